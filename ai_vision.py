@@ -3,24 +3,113 @@ Módulo de integración con Claude AI para visión por computadora e instruccion
 Permite enviar imágenes a Claude y obtener análisis, instrucciones y acciones a ejecutar.
 """
 
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from PIL import Image
+import asyncio
 import base64
 import io
-import json
-from typing import List, Dict, Optional, Any
+import threading
+import time
+from typing import List, Dict, Optional, Any, Tuple, Iterator, AsyncIterator, Callable, Generator, Union
 import os
 
+from image_encoder import ImageEncoder, EncodedImage
+from image_diff import ImageDiff
+from element_memory import ElementMemory
+from frame import Frame, image_origin, memoized
+from response_cache import DEFAULT_HASH_WIDTH, ResponseCache, SingleFlight, image_fingerprint, request_key
+from conversation_memory import ConversationMemory
+from metrics import (
+    CallMetrics, InMemoryMetrics, MetricsSink, current_call, estimate_image_tokens, instrumented, stage
+)
+from request_governor import RequestGovernor
+from model_router import ModelRouter
+from token_budget import TokenBudget, estimate_request_tokens
+from structured_output import (
+    StructuredResult, IncrementalArrayParser, ACTION_PLAN_TOOL, ACTION_SCHEMA,
+    ELEMENT_LOCATION_TOOL, ELEMENT_REGION_TOOL, ELEMENTS_LOCATION_TOOL, VERIFICATION_TOOL, normalize, tool_choice
+)
+
+
+# Verificación por recortes: máximo de regiones y de superficie antes de enviar las capturas completas
+VERIFY_MAX_REGIONS = 3
+VERIFY_MAX_REGION_FRACTION = 0.5
+VERIFY_THUMBNAIL_EDGE = 512
+
+# Localización en dos etapas: lado mayor de la vista reducida, lado mínimo del recorte
+# a resolución completa y margen añadido a la región aproximada (fracción de su tamaño)
+LOCATE_COARSE_EDGE = 768
+LOCATE_CROP_MIN_SIZE = 512
+LOCATE_CROP_MARGIN = 0.5
+
+# Parte fija del prompt de planificación: va en el system prompt para poder cachearla
+ACTIONS_SYSTEM_PROMPT = """
+        Eres un asistente de automatización inteligente. El usuario te dará una instrucción
+        junto con una captura de la pantalla actual.
+
+        Analiza la captura de pantalla y determina las acciones exactas necesarias para cumplir la instrucción.
+        Reporta el resultado con la herramienta report_action_plan.
+
+        Ejemplos de acciones:
+            {"type": "click", "x": 100, "y": 200, "description": "Clic en botón X"}
+            {"type": "type", "text": "texto a escribir", "description": "Escribir en campo Y"}
+            {"type": "press", "key": "enter", "description": "Presionar Enter"}
+            {"type": "hotkey", "keys": ["ctrl", "s"], "description": "Guardar con Ctrl+S"}
+            {"type": "wait", "seconds": 1, "description": "Esperar 1 segundo"}
+            {"type": "scroll", "amount": -3, "description": "Scroll hacia abajo"}
+
+        IMPORTANTE:
+        - Solo incluye acciones que sean seguras y reversibles
+        - Si la instrucción no es clara o no es posible, explica por qué en "warnings"
+        - Proporciona coordenadas precisas basándote en lo que ves en la imagen
+        - Sé específico con los elementos visuales que identificas
+        """
+
+# Marca de caché de prompts (el prefijo hasta este bloque se reutiliza entre llamadas)
+CACHE_CONTROL = {"type": "ephemeral"}
+
+DEFAULT_ANALYSIS_PROMPT = """
+        Analiza esta captura de pantalla y describe:
+        1. Qué aplicación o ventana está visible
+        2. Qué elementos importantes hay en la pantalla (botones, campos de texto, menús, etc.)
+        3. El estado actual de la aplicación
+        4. Cualquier texto visible importante
+
+        Sé conciso pero detallado.
+        """
+
 
 class AIVision:
     """Clase para integración con Claude AI y procesamiento de visión por computadora."""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, encoder: Optional[ImageEncoder] = None,
+                 cache: Optional[ResponseCache] = None, metrics: Optional[MetricsSink] = None,
+                 governor: Optional[RequestGovernor] = None, base_url: Optional[str] = None,
+                 image_diff: Optional[ImageDiff] = None, single_flight: Optional[SingleFlight] = None,
+                 element_memory: Optional[ElementMemory] = None, router: Optional[ModelRouter] = None,
+                 budget: Optional[TokenBudget] = None):
         """
         Inicializa el cliente de Claude AI.
 
         Args:
             api_key: API key de Anthropic (si no se proporciona, se busca en variable de entorno)
+            encoder: Codificador de imágenes (por defecto reescala y elige formato automáticamente)
+            cache: Caché de respuestas por huella de pantalla (None para desactivarla)
+            metrics: Destino de las métricas por llamada (por defecto un agregador en memoria)
+            governor: Límite de tasa/concurrencia y reintentos (compartir una instancia entre
+                      varios AIVision para aplicar un límite común)
+            base_url: URL base de la API (p. ej. el servidor de fake_anthropic_server.py);
+                      por defecto ANTHROPIC_BASE_URL o la API oficial
+            image_diff: Comparador local de capturas usado por verify_action_completed()
+            single_flight: Agrupación de peticiones idénticas simultáneas en una sola llamada
+                           (None para desactivarla)
+            element_memory: Memoria persistente de posiciones por ventana usada por
+                            find_element() cuando se indica la ventana (None para desactivarla)
+            router: Política de modelos y presupuestos de salida por operación
+                    (por defecto la de las variables de entorno, ver model_router.py)
+            budget: Presupuesto de tokens de entrada por petición con el que se elige la
+                    resolución o el recorte de cada captura (por defecto el de las variables
+                    de entorno, ver token_budget.py)
         """
         self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY')
         if not self.api_key:
@@ -29,8 +118,196 @@ class AIVision:
                 "Proporciona api_key o configura la variable de entorno ANTHROPIC_API_KEY"
             )
 
-        self.client = Anthropic(api_key=self.api_key)
-        self.model = "claude-3-5-sonnet-20241022"  # Modelo con capacidades de visión
+        self.base_url = base_url or os.getenv('ANTHROPIC_BASE_URL') or None
+
+        # Los reintentos los hace el governor; el SDK no debe reintentar por su cuenta
+        self.governor = governor or RequestGovernor()
+        self.client = self._create_client()
+        # Modelo y presupuesto de salida de cada operación (el modelo por defecto está en self.model)
+        self.router = router or ModelRouter.from_env()
+        self.encoder = encoder or ImageEncoder()
+        self.budget = budget or TokenBudget.from_env()
+        self.cache = cache
+        self.single_flight = single_flight
+        self.element_memory = element_memory
+        self.metrics = metrics if metrics is not None else InMemoryMetrics()
+        self.image_diff = image_diff or ImageDiff()
+        self.thumbnail_encoder = ImageEncoder(max_long_edge=VERIFY_THUMBNAIL_EDGE)
+        self.coarse_encoder = ImageEncoder(max_long_edge=LOCATE_COARSE_EDGE)
+
+        # Consumo de tokens (incluida la caché de prompts) de la última llamada de cada hilo
+        self._local = threading.local()
+        self._usage_lock = threading.Lock()
+        self.usage_totals = {
+            'calls': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': 0,
+        }
+
+    def _create_client(self):
+        """Crea el cliente de la API de Anthropic."""
+        return Anthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+    @property
+    def model(self) -> str:
+        """Modelo por defecto (nivel 'balanced' de la política de modelos)."""
+        return self.router.default_model
+
+    @model.setter
+    def model(self, value: str):
+        self.router.configure(models={'balanced': value})
+
+    def _create_message(self, operation: str, **request):
+        """
+        Envía una petición a la API de mensajes.
+
+        Si la ruta de la operación lo permite y la respuesta tiene confianza baja,
+        repite la petición con el modelo de escalado.
+
+        Args:
+            operation: Nombre de la operación (para el registro de consumo y la ruta)
+            **request: Argumentos de messages.create()
+
+        Returns:
+            Mensaje de respuesta de la API
+        """
+        self._record_estimate(request)
+        start = time.perf_counter()
+        with stage('api'):
+            message = self.governor.call(operation, lambda: self.client.messages.create(**request))
+        self.router.record(operation, request['model'], time.perf_counter() - start)
+        self._record_usage(operation, message)
+
+        escalated = self.router.escalation(operation, request, message)
+        if escalated is not None:
+            return self._create_message(operation, **escalated)
+        return message
+
+    def _stream_text(self, operation: str, **request) -> Iterator[str]:
+        """
+        Envía una petición en modo streaming y produce los fragmentos de texto.
+
+        Args:
+            operation: Nombre de la operación (para el registro de consumo)
+            **request: Argumentos de messages.stream()
+
+        Yields:
+            Fragmentos de texto a medida que llegan
+        """
+        call = current_call()
+        self._record_estimate(request)
+        start = time.perf_counter()
+        with stage('api'), self.governor.stream(operation, lambda: self.client.messages.stream(**request)) as stream:
+            for text in stream.text_stream:
+                if call is not None:
+                    call.mark('first_token')
+                yield text
+            message = stream.get_final_message()
+        self.router.record(operation, request['model'], time.perf_counter() - start)
+        self._record_usage(operation, message)
+
+    def _stream_tool_input(self, operation: str, **request) -> Generator[str, None, Any]:
+        """
+        Envía una petición con herramienta en modo streaming y produce el JSON
+        de los argumentos de la herramienta a medida que se genera.
+
+        Args:
+            operation: Nombre de la operación (para el registro de consumo)
+            **request: Argumentos de messages.stream()
+
+        Yields:
+            Fragmentos del JSON de entrada de la herramienta
+
+        Returns:
+            Mensaje final completo (valor de retorno del generador)
+        """
+        call = current_call()
+        self._record_estimate(request)
+        start = time.perf_counter()
+        with stage('api'), self.governor.stream(operation, lambda: self.client.messages.stream(**request)) as stream:
+            for event in stream:
+                if event.type == 'content_block_delta' and getattr(event.delta, 'type', None) == 'input_json_delta':
+                    if call is not None:
+                        call.mark('first_token')
+                    yield event.delta.partial_json
+            message = stream.get_final_message()
+        self.router.record(operation, request['model'], time.perf_counter() - start)
+        self._record_usage(operation, message)
+        return message
+
+    def _record_estimate(self, request: Dict[str, Any]):
+        """
+        Registra en la llamada en curso los tokens de entrada estimados de una petición
+        y el presupuesto, para compararlos con el consumo real.
+
+        Args:
+            request: Argumentos de messages.create()
+        """
+        call = current_call()
+        if call is not None:
+            call.add_estimate(estimate_request_tokens(request)['total'], self.budget.max_tokens)
+
+    @staticmethod
+    def _usage_to_dict(usage) -> Dict[str, int]:
+        """Convierte el objeto usage de la API en un diccionario de contadores."""
+        return {
+            'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+            'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+            'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+            'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+        }
+
+    def _record_usage(self, operation: str, message):
+        """
+        Registra el consumo de tokens de una respuesta.
+
+        Args:
+            operation: Nombre de la operación
+            message: Mensaje de respuesta de la API
+        """
+        usage = self._usage_to_dict(getattr(message, 'usage', None))
+        call = current_call()
+        if call is not None:
+            call.add_usage(usage, getattr(message, 'model', None))
+
+        usage['operation'] = operation
+        self._local.last_usage = usage
+
+        with self._usage_lock:
+            self.usage_totals['calls'] += 1
+            for key, value in usage.items():
+                if key in self.usage_totals and key != 'calls':
+                    self.usage_totals[key] += value
+
+    @property
+    def last_usage(self) -> Optional[Dict[str, Any]]:
+        """
+        Consumo de la última llamada hecha desde el hilo actual.
+
+        Incluye 'cache_read_input_tokens' (prefijo leído de la caché de prompts)
+        y 'cache_creation_input_tokens' (prefijo escrito en la caché).
+        """
+        return getattr(self._local, 'last_usage', None)
+
+    def _finish_call(self, call: CallMetrics):
+        """
+        Entrega las métricas de una llamada terminada al sink (usado por @instrumented).
+
+        Args:
+            call: Métricas de la llamada
+        """
+        self._local.last_metrics = call
+        try:
+            self.metrics.record(call)
+        except Exception as e:
+            print(f"Error al registrar métricas: {e}")
+
+    @property
+    def last_metrics(self) -> Optional[CallMetrics]:
+        """Métricas de la última llamada terminada en el hilo actual."""
+        return getattr(self._local, 'last_metrics', None)
 
     def image_to_base64(self, image: Image.Image, format: str = 'PNG') -> str:
         """
@@ -43,6 +320,9 @@ class AIVision:
         Returns:
             String en base64
         """
+        if isinstance(image, Frame) and image.mode not in ('RGBA', 'LA', 'P'):
+            return image.to_base64(format)
+
         buffered = io.BytesIO()
         # Convertir a RGB si es necesario
         if image.mode in ('RGBA', 'LA', 'P'):
@@ -51,46 +331,213 @@ class AIVision:
         img_str = base64.standard_b64encode(buffered.getvalue()).decode()
         return img_str
 
-    def analyze_screen(self, image: Image.Image, custom_prompt: Optional[str] = None) -> str:
+    def encode_image(self, image: Image.Image, encoder: Optional[ImageEncoder] = None) -> EncodedImage:
         """
-        Analiza una captura de pantalla y describe lo que ve.
+        Codifica una imagen con el codificador configurado.
+
+        Si la imagen es un Frame, la codificación se memoriza en él y las siguientes
+        llamadas con la misma configuración reutilizan los mismos bytes.
+
+        Con el codificador por defecto se aplica el presupuesto de tokens: la captura se
+        reduce hasta caber en él o, si el texto dejaría de ser legible, se recorta.
 
         Args:
-            image: Imagen PIL de la pantalla
-            custom_prompt: Prompt personalizado (opcional)
+            image: Imagen PIL o Frame
+            encoder: Codificador a usar (por defecto self.encoder)
 
         Returns:
-            Descripción textual de lo que ve en la imagen
+            EncodedImage con los datos, el tipo MIME, la escala y el desplazamiento aplicados
         """
-        base64_image = self.image_to_base64(image)
+        plan = None
+        with stage('encode'):
+            if encoder is None or encoder is self.encoder:
+                encoded, plan = self.budget.encode(image, self.encoder)
+            elif isinstance(image, Frame):
+                encoded = image.encode(encoder)
+            else:
+                encoded = encoder.encode(image)
 
-        default_prompt = """
-        Analiza esta captura de pantalla y describe:
-        1. Qué aplicación o ventana está visible
-        2. Qué elementos importantes hay en la pantalla (botones, campos de texto, menús, etc.)
-        3. El estado actual de la aplicación
-        4. Cualquier texto visible importante
+        call = current_call()
+        if call is not None:
+            call.add_image(encoded.width, encoded.height, len(encoded.data),
+                           cropped=plan is not None and plan.box is not None)
+        return encoded
 
-        Sé conciso pero detallado.
+    def _scale_actions(self, actions: List[Dict], encoded: EncodedImage) -> List[Dict]:
         """
+        Convierte las coordenadas de las acciones a píxeles reales de la pantalla.
 
-        prompt = custom_prompt or default_prompt
+        Args:
+            actions: Lista de acciones devuelta por el modelo
+            encoded: Imagen codificada que se envió al modelo
 
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=1024,
+        Returns:
+            Lista de acciones con coordenadas escaladas
+        """
+        scaled = []
+        for action in actions:
+            if isinstance(action, dict) and action.get('x') is not None and action.get('y') is not None:
+                action = dict(action)
+                action['x'], action['y'] = encoded.to_original_coords(action['x'], action['y'])
+            scaled.append(action)
+        return scaled
+
+    @staticmethod
+    def _image_blocks(encoded: EncodedImage) -> List[Dict[str, Any]]:
+        """
+        Bloques de contenido de una imagen; si es un recorte del presupuesto de tokens,
+        va seguida de un aviso para que el modelo sepa que no ve toda la pantalla.
+        """
+        blocks = [encoded.to_content_block()]
+        if encoded.is_crop:
+            left, top = encoded.offset
+            full_width, full_height = encoded.full_size
+            blocks.append({
+                "type": "text",
+                "text": (f"Nota: esta imagen es solo una parte de la pantalla (región {left}, {top}, "
+                         f"{left + encoded.original_width}, {top + encoded.original_height} de una "
+                         f"pantalla de {full_width}x{full_height}). Si lo que se pide no está en ella, "
+                         "indícalo en lugar de suponer. Las coordenadas se refieren a esta imagen."),
+            })
+        return blocks
+
+    @staticmethod
+    def _to_screen(image: Image.Image, location: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Traslada una posición de la captura a coordenadas globales del escritorio virtual.
+
+        Las capturas de un monitor concreto (Frame con origin) no empiezan en (0, 0). La
+        caché y la memoria de elementos guardan coordenadas de la captura, así que la
+        traslación se aplica solo al devolver el resultado.
+
+        Args:
+            image: Imagen PIL o Frame enviado
+            location: Resultado con 'x', 'y' y opcionalmente 'region' (o None)
+
+        Returns:
+            Copia del resultado trasladada (el mismo objeto si no hay que trasladar)
+        """
+        dx, dy = image_origin(image)
+        if (dx, dy) == (0, 0) or not isinstance(location, dict) \
+                or location.get('x') is None or location.get('y') is None:
+            return location
+        location = dict(location)
+        location['x'] += dx
+        location['y'] += dy
+        if location.get('region'):
+            left, top, right, bottom = location['region']
+            location['region'] = (left + dx, top + dy, right + dx, bottom + dy)
+        return location
+
+    def _plan_to_screen(self, image: Image.Image, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Traslada las acciones de un plan a coordenadas globales (ver _to_screen)."""
+        if image_origin(image) == (0, 0):
+            return plan
+        return dict(plan, actions=[self._to_screen(image, action) for action in plan.get('actions', [])])
+
+    def _results_to_screen(self, image: Image.Image, results: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Traslada los resultados de find_elements() a coordenadas globales (ver _to_screen)."""
+        if image_origin(image) == (0, 0):
+            return results
+        return {description: self._to_screen(image, result) for description, result in results.items()}
+
+    def _cache_lookup(self, method: str, image: Image.Image, *params: Any):
+        """
+        Busca una respuesta previa para la misma petición sobre la misma pantalla.
+
+        Args:
+            method: Nombre del método
+            image: Imagen PIL de la pantalla
+            *params: Parámetros que afectan a la respuesta
+
+        Returns:
+            Tupla (entrada o None, clave, huella); clave y huella son None sin caché ni agrupación
+        """
+        if self.cache is None and self.single_flight is None:
+            return None, None, None
+        with stage('cache'):
+            hash_width = self.cache.hash_width if self.cache is not None else DEFAULT_HASH_WIDTH
+            key = request_key(method, self.router.model_for(method), *params, size=image.size)
+            fingerprint = memoized(image, ('fingerprint', hash_width),
+                                   lambda: image_fingerprint(image, hash_width))
+            entry = self.cache.get(key, fingerprint) if self.cache is not None else None
+
+        call = current_call()
+        if call is not None and entry is not None:
+            call.cache_hit = True
+        return entry, key, fingerprint
+
+    def _cache_store(self, key: Optional[str], fingerprint: Optional[bytes], value: Any):
+        """Guarda una respuesta en la caché si está habilitada."""
+        if self.cache is not None and key is not None:
+            self.cache.put(key, fingerprint, value)
+
+    def _coalesce(self, key: Optional[str], fingerprint: Optional[bytes], compute: Callable[[], Any]) -> Any:
+        """
+        Ejecuta la petición o, si hay una idéntica en curso, espera su resultado.
+
+        Args:
+            key: Clave de la petición (de _cache_lookup())
+            fingerprint: Huella de la captura
+            compute: Función sin argumentos que hace la petición
+
+        Returns:
+            Resultado de la petición
+        """
+        if self.single_flight is None or key is None:
+            return compute()
+        value, shared = self.single_flight.do(key, fingerprint, compute)
+        self._mark_coalesced(shared)
+        return value
+
+    @staticmethod
+    def _mark_coalesced(shared: bool):
+        """Marca la llamada en curso como agrupada con otra petición."""
+        call = current_call()
+        if shared and call is not None:
+            call.coalesced = True
+
+    def _memory_lookup(self, image: Image.Image, element_description: str,
+                       window: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """Busca la posición recordada del elemento en la ventana (validada con su plantilla)."""
+        if self.element_memory is None or window is None:
+            return None
+        with stage('memory'):
+            location = self.element_memory.lookup(image, self._window_in_image(image, window), element_description)
+
+        call = current_call()
+        if call is not None and location is not None:
+            call.cache_hit = True
+        return location
+
+    def _memory_remember(self, image: Image.Image, element_description: str,
+                         window: Optional[Dict[str, Any]], location: Optional[Dict[str, int]]):
+        """Recuerda la posición encontrada por la IA para las siguientes búsquedas en la ventana."""
+        if self.element_memory is not None and window is not None and location is not None:
+            self.element_memory.remember(image, self._window_in_image(image, window), element_description,
+                                         location['x'], location['y'])
+
+    @staticmethod
+    def _window_in_image(image: Image.Image, window: Dict[str, Any]) -> Dict[str, Any]:
+        """Ventana (en coordenadas globales) con su posición relativa a la captura."""
+        dx, dy = image_origin(image)
+        if (dx, dy) == (0, 0):
+            return window
+        return dict(window, left=window['left'] - dx, top=window['top'] - dy)
+
+    # ===== CONSTRUCCIÓN DE PETICIONES Y PROCESADO DE RESPUESTAS =====
+    # Compartidos por el cliente síncrono y el asíncrono.
+
+    def _analyze_screen_request(self, image: Image.Image, prompt: str) -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de analyze_screen()."""
+        encoded = self.encode_image(image)
+        request = dict(
+            **self.router.params('analyze_screen'),
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": base64_image,
-                            },
-                        },
+                        *self._image_blocks(encoded),
                         {
                             "type": "text",
                             "text": prompt
@@ -99,71 +546,155 @@ class AIVision:
                 }
             ],
         )
+        return request, encoded
+
+    def _analyze_screen_result(self, message) -> str:
+        """Procesa la respuesta de analyze_screen()."""
+        return message.content[0].text
+
+    def _actions_request(self, image: Image.Image, instruction: str) -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de get_actions_from_instruction()."""
+        encoded = self.encode_image(image)
+
+        # La herramienta (esquema) y las reglas son fijas y van primero con marca de
+        # caché; solo la imagen y la instrucción cambian entre llamadas.
+        request = dict(
+            **self.router.params('get_actions_from_instruction'),
+            tools=[ACTION_PLAN_TOOL],
+            tool_choice=tool_choice(ACTION_PLAN_TOOL),
+            system=[
+                {
+                    "type": "text",
+                    "text": ACTIONS_SYSTEM_PROMPT,
+                    "cache_control": CACHE_CONTROL
+                }
+            ],
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        *self._image_blocks(encoded),
+                        {
+                            "type": "text",
+                            "text": f"INSTRUCCIÓN: {instruction}"
+                        }
+                    ],
+                }
+            ],
+        )
+        return request, encoded
+
+    def _actions_result(self, message, encoded: EncodedImage) -> Dict[str, Any]:
+        """Procesa la respuesta de get_actions_from_instruction()."""
+        with stage('parse'):
+            result = StructuredResult.from_message(message, ACTION_PLAN_TOOL)
+
+            if not result.ok:
+                print(f"Respuesta de IA inválida: {'; '.join(result.errors)}")
+                return {
+                    "analysis": "Error al procesar la respuesta",
+                    "strategy": "No se pudo determinar",
+                    "actions": [],
+                    "warnings": [f"Error al procesar respuesta de IA: {'; '.join(result.errors)}"],
+                    "success_criteria": "N/A"
+                }
 
-        response_text = message.content[0].text
-        return response_text
+            actions_data = result.to_dict()
+            actions_data['actions'] = self._scale_actions(actions_data['actions'], encoded)
+            return actions_data
 
-    def get_actions_from_instruction(self, image: Image.Image, instruction: str) -> Dict[str, Any]:
+    def _find_element_request(self, image: Image.Image, element_description: str,
+                              operation: str = 'find_element') -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de find_element() (operation indica la ruta de modelo)."""
+        encoded = self.encode_image(image)
+
+        prompt = f"""
+        Busca este elemento en la pantalla: "{element_description}"
+
+        Reporta su posición (centro del elemento) con la herramienta report_element_location.
+        Si no lo encuentras, indica found=false y una explicación breve en "reason".
         """
-        Recibe una instrucción del usuario y la imagen de la pantalla,
-        y retorna las acciones necesarias para cumplir la instrucción.
+
+        request = dict(
+            **self.router.params(operation),
+            tools=[ELEMENT_LOCATION_TOOL],
+            tool_choice=tool_choice(ELEMENT_LOCATION_TOOL),
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        *self._image_blocks(encoded),
+                        {
+                            "type": "text",
+                            "text": prompt
+                        }
+                    ],
+                }
+            ],
+        )
+        return request, encoded
+
+    def _location_from_data(self, data: Dict[str, Any], encoded: EncodedImage) -> Dict[str, Any]:
+        """
+        Convierte una localización validada en un resultado con coordenadas reales.
 
         Args:
-            image: Imagen PIL de la pantalla
-            instruction: Instrucción del usuario
+            data: Datos del esquema de localización
+            encoded: Imagen codificada que se envió al modelo
 
         Returns:
-            Diccionario con la estrategia y lista de acciones a ejecutar
+            {'found': True, 'x', 'y', 'confidence'} o {'found': False, 'reason'}
         """
-        base64_image = self.image_to_base64(image)
+        if data.get('found') and data.get('x') is not None and data.get('y') is not None:
+            x, y = encoded.to_original_coords(data['x'], data['y'])
+            return {'found': True, 'x': x, 'y': y, 'confidence': data.get('confidence', 'medium')}
+        return {'found': False, 'reason': data.get('reason', 'Elemento no encontrado')}
 
-        prompt = f"""
-        Eres un asistente de automatización inteligente. El usuario quiere que hagas esto:
-
-        INSTRUCCIÓN: {instruction}
-
-        Analiza la captura de pantalla actual y determina las acciones exactas necesarias para cumplir la instrucción.
-
-        Responde en formato JSON con esta estructura:
-        {{
-            "analysis": "Breve análisis de lo que ves en la pantalla",
-            "strategy": "Estrategia general para cumplir la instrucción",
-            "actions": [
-                {{"type": "click", "x": 100, "y": 200, "description": "Clic en botón X"}},
-                {{"type": "type", "text": "texto a escribir", "description": "Escribir en campo Y"}},
-                {{"type": "press", "key": "enter", "description": "Presionar Enter"}},
-                {{"type": "hotkey", "keys": ["ctrl", "s"], "description": "Guardar con Ctrl+S"}},
-                {{"type": "wait", "seconds": 1, "description": "Esperar 1 segundo"}},
-                {{"type": "scroll", "amount": -3, "description": "Scroll hacia abajo"}}
-            ],
-            "warnings": ["Cualquier advertencia o limitación"],
-            "success_criteria": "Cómo saber si se completó exitosamente"
-        }}
+    def _find_element_result(self, message, encoded: EncodedImage) -> Tuple[Optional[Dict[str, int]], bool]:
+        """
+        Procesa la respuesta de find_element().
 
-        IMPORTANTE:
-        - Solo incluye acciones que sean seguras y reversibles
-        - Si la instrucción no es clara o no es posible, explica por qué en "warnings"
-        - Proporciona coordenadas precisas basándote en lo que ves en la imagen
-        - Sé específico con los elementos visuales que identificas
+        Returns:
+            Tupla (coordenadas o None, si la respuesta es válida para guardarla en caché)
+        """
+        with stage('parse'):
+            result = StructuredResult.from_message(message, ELEMENT_LOCATION_TOOL)
+
+            if not result.ok:
+                print(f"Respuesta de IA inválida: {'; '.join(result.errors)}")
+                return None, False
+
+            location = self._location_from_data(result.data, encoded)
+            if location['found']:
+                return {'x': location['x'], 'y': location['y']}, True
 
-        Responde SOLO con el JSON, sin texto adicional.
+            print(f"Elemento no encontrado: {location['reason']}")
+            return None, True
+
+    def _find_elements_request(self, image: Image.Image, descriptions: List[str]) -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de find_elements()."""
+        encoded = self.encode_image(image)
+
+        element_list = "\n".join(f'        {idx}. "{description}"' for idx, description in enumerate(descriptions))
+
+        prompt = f"""
+        Busca estos elementos en la pantalla:
+{element_list}
+
+        Reporta con la herramienta report_elements_locations un resultado por elemento,
+        usando su número como "index". Si no encuentras alguno, indica found=false y
+        una explicación breve en "reason".
         """
 
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=2048,
+        request = dict(
+            **self.router.params('find_elements', needed_tokens=128 + 96 * len(descriptions)),
+            tools=[ELEMENTS_LOCATION_TOOL],
+            tool_choice=tool_choice(ELEMENTS_LOCATION_TOOL),
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": base64_image,
-                            },
-                        },
+                        *self._image_blocks(encoded),
                         {
                             "type": "text",
                             "text": prompt
@@ -172,70 +703,54 @@ class AIVision:
                 }
             ],
         )
+        return request, encoded
 
-        response_text = message.content[0].text
-
-        # Intentar extraer JSON de la respuesta
-        try:
-            # Limpiar posibles marcadores de código
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-
-            actions_data = json.loads(response_text.strip())
-            return actions_data
-        except json.JSONDecodeError as e:
-            print(f"Error al parsear JSON: {e}")
-            print(f"Respuesta recibida: {response_text}")
-            return {
-                "analysis": "Error al procesar la respuesta",
-                "strategy": "No se pudo determinar",
-                "actions": [],
-                "warnings": [f"Error al parsear respuesta de IA: {str(e)}"],
-                "success_criteria": "N/A"
-            }
-
-    def find_element(self, image: Image.Image, element_description: str) -> Optional[Dict[str, int]]:
+    def _find_elements_result(self, message, encoded: EncodedImage,
+                              descriptions: List[str]) -> Tuple[Dict[str, Dict[str, Any]], bool]:
         """
-        Encuentra un elemento en la pantalla por su descripción.
-
-        Args:
-            image: Imagen PIL de la pantalla
-            element_description: Descripción del elemento a buscar
+        Procesa la respuesta de find_elements().
 
         Returns:
-            Diccionario con coordenadas {'x': int, 'y': int} o None si no se encuentra
+            Tupla (resultados por descripción, si la respuesta es válida para guardarla en caché)
         """
-        base64_image = self.image_to_base64(image)
+        with stage('parse'):
+            result = StructuredResult.from_message(message, ELEMENTS_LOCATION_TOOL)
 
-        prompt = f"""
-        Busca este elemento en la pantalla: "{element_description}"
+            if not result.ok:
+                print(f"Respuesta de IA inválida: {'; '.join(result.errors)}")
+                return {
+                    description: {'found': False, 'reason': f"Error al procesar respuesta de IA: {'; '.join(result.errors)}"}
+                    for description in descriptions
+                }, False
 
-        Si lo encuentras, responde SOLO con las coordenadas en formato JSON:
-        {{"x": 123, "y": 456, "found": true, "confidence": "high/medium/low"}}
+            by_index = {item['index']: item for item in result.data['elements']}
 
-        Si no lo encuentras, responde:
-        {{"found": false, "reason": "explicación breve"}}
+            results = {}
+            for idx, description in enumerate(descriptions):
+                results[description] = self._location_from_data(by_index.get(idx, {}), encoded)
+            return results, True
 
-        NO incluyas texto adicional, solo el JSON.
+    def _coarse_region_request(self, image: Image.Image, element_description: str) -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de la primera etapa de locate_element() (pantalla reducida)."""
+        encoded = self.encode_image(image, self.coarse_encoder)
+
+        prompt = f"""
+        Busca este elemento en la pantalla (imagen reducida): "{element_description}"
+
+        Reporta con la herramienta report_element_region un rectángulo aproximado que lo contenga
+        por completo; no hace falta precisión, es mejor que sobre margen a que se quede corto.
+        Si no lo encuentras, indica found=false y una explicación breve en "reason".
         """
 
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=256,
+        request = dict(
+            **self.router.params('locate_element'),
+            tools=[ELEMENT_REGION_TOOL],
+            tool_choice=tool_choice(ELEMENT_REGION_TOOL),
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": base64_image,
-                            },
-                        },
+                        *self._image_blocks(encoded),
                         {
                             "type": "text",
                             "text": prompt
@@ -244,58 +759,119 @@ class AIVision:
                 }
             ],
         )
+        return request, encoded
 
-        response_text = message.content[0].text
-
-        try:
-            # Limpiar respuesta
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
+    def _coarse_region_result(self, message, encoded: EncodedImage) -> Tuple[Optional[Tuple[int, int, int, int]], str]:
+        """
+        Procesa la respuesta de la primera etapa de locate_element().
 
-            result = json.loads(response_text.strip())
+        Returns:
+            Tupla (región (left, top, right, bottom) en píxeles reales o None, motivo si no se encontró)
+        """
+        with stage('parse'):
+            result = StructuredResult.from_message(message, ELEMENT_REGION_TOOL)
+            if not result.ok:
+                return None, f"Respuesta de IA inválida: {'; '.join(result.errors)}"
 
-            if result.get('found'):
-                return {'x': result['x'], 'y': result['y']}
-            else:
-                print(f"Elemento no encontrado: {result.get('reason', 'razón desconocida')}")
-                return None
+            data = result.data
+            if not data.get('found') or any(data.get(k) is None for k in ('left', 'top', 'right', 'bottom')):
+                return None, data.get('reason', 'Elemento no encontrado')
 
-        except json.JSONDecodeError as e:
-            print(f"Error al parsear respuesta: {e}")
-            return None
+            left, top = encoded.to_original_coords(min(data['left'], data['right']), min(data['top'], data['bottom']))
+            right, bottom = encoded.to_original_coords(max(data['left'], data['right']), max(data['top'], data['bottom']))
+            return (left, top, right + 1, bottom + 1), ''
 
-    def chat_with_context(self, image: Image.Image, user_message: str,
-                          conversation_history: Optional[List[Dict]] = None) -> str:
+    @staticmethod
+    def _fine_crop_box(region: Tuple[int, int, int, int], size: Tuple[int, int]) -> Tuple[int, int, int, int]:
         """
-        Chat con Claude teniendo contexto de la pantalla actual.
+        Calcula el recorte a resolución completa alrededor de la región aproximada.
 
-        Args:
-            image: Imagen PIL de la pantalla
-            user_message: Mensaje del usuario
-            conversation_history: Historial de conversación previo (opcional)
+        La región se amplía con LOCATE_CROP_MARGIN y hasta LOCATE_CROP_MIN_SIZE por lado
+        (el error de la vista reducida es de varios píxeles reales), sin salir de la imagen.
+        """
+        width, height = size
+        box = []
+        for start, end, limit in ((region[0], region[2], width), (region[1], region[3], height)):
+            span = end - start
+            span = min(limit, max(int(span * (1 + 2 * LOCATE_CROP_MARGIN)), LOCATE_CROP_MIN_SIZE))
+            low = max(0, min((start + end - span) // 2, limit - span))
+            box.append((low, low + span))
+        (left, right), (top, bottom) = box
+        return left, top, right, bottom
+
+    def _fine_location_request(self, image: Image.Image, element_description: str,
+                               box: Tuple[int, int, int, int]) -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de la segunda etapa de locate_element() (recorte a resolución completa)."""
+        # Igual que find_element(), pero sobre el recorte
+        return self._find_element_request(image.crop(box), element_description, 'locate_element')
+
+    def _locate_tokens(self, image: Image.Image, coarse_message, coarse: EncodedImage,
+                       fine_message=None, fine: Optional[EncodedImage] = None) -> Dict[str, int]:
+        """
+        Compara los tokens de las dos etapas con los de una sola llamada a find_element().
 
-        Returns:
-            Respuesta de Claude
+        La llamada única se estima a partir de la última etapa enviada (mismo prompt y
+        herramienta) sustituyendo su imagen por la pantalla completa codificada.
         """
-        base64_image = self.image_to_base64(image)
+        def total(message) -> int:
+            return sum(self._usage_to_dict(getattr(message, 'usage', None)).values())
+
+        coarse_tokens = total(coarse_message)
+        fine_tokens = total(fine_message) if fine_message is not None else 0
+        reference, sent = (fine_message, fine) if fine_message is not None else (coarse_message, coarse)
+
+        # La llamada única también pasaría por el presupuesto de tokens
+        plan = self.budget.plan(image, self.encoder)
+        full_width, full_height = plan.width, plan.height
+        single_shot = (total(reference) - estimate_image_tokens(sent.width, sent.height)
+                       + estimate_image_tokens(full_width, full_height))
+        return {
+            'coarse': coarse_tokens,
+            'fine': fine_tokens,
+            'total': coarse_tokens + fine_tokens,
+            'single_shot_estimate': single_shot,
+            'saved': single_shot - (coarse_tokens + fine_tokens),
+        }
 
-        # Construir mensajes
-        messages = conversation_history or []
+    def _locate_result(self, image: Image.Image, coarse_message, coarse: EncodedImage,
+                       region: Optional[Tuple[int, int, int, int]], reason: str,
+                       fine_message=None, fine: Optional[EncodedImage] = None,
+                       box: Optional[Tuple[int, int, int, int]] = None) -> Dict[str, Any]:
+        """Procesa el resultado de locate_element() y traslada las coordenadas a la pantalla completa."""
+        if fine_message is None:
+            location = {'found': False, 'reason': reason}
+        else:
+            with stage('parse'):
+                result = StructuredResult.from_message(fine_message, ELEMENT_LOCATION_TOOL)
+                if result.ok:
+                    location = self._location_from_data(result.data, fine)
+                else:
+                    location = {'found': False, 'reason': f"Respuesta de IA inválida: {'; '.join(result.errors)}"}
+            if location['found']:
+                location['x'] += box[0]
+                location['y'] += box[1]
+                location['region'] = region
+
+        location['tokens'] = self._locate_tokens(image, coarse_message, coarse, fine_message, fine)
+        return location
+
+    def _chat_request(self, image: Image.Image, user_message: str,
+                      conversation_history: Optional[Union[List[Dict], ConversationMemory]]
+                      ) -> Tuple[Dict, EncodedImage]:
+        """Construye la petición de chat_with_context() sin modificar el historial recibido."""
+        encoded = self.encode_image(image)
+
+        # Construir mensajes (siempre sobre una copia)
+        if isinstance(conversation_history, ConversationMemory):
+            request_messages = conversation_history.to_messages()
+        else:
+            request_messages = list(conversation_history or [])
 
         # Agregar mensaje actual con imagen
         current_message = {
             "role": "user",
             "content": [
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/png",
-                        "data": base64_image,
-                    },
-                },
+                *self._image_blocks(encoded),
                 {
                     "type": "text",
                     "text": user_message
@@ -303,17 +879,445 @@ class AIVision:
             ],
         }
 
-        messages.append(current_message)
+        # Marcar el final del historial como prefijo cacheable: en cada turno solo
+        # se procesa de nuevo el mensaje actual
+        if request_messages:
+            request_messages[-1] = self._with_cache_control(request_messages[-1])
+
+        request_messages.append(current_message)
 
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=2048,
-            messages=messages,
+        request = dict(
+            **self.router.params('chat_with_context'),
+            messages=request_messages,
         )
+        return request, encoded
 
-        response_text = message.content[0].text
+    @staticmethod
+    def _chat_remember(conversation_history, request: Dict, response_text: str):
+        """
+        Registra el turno en la memoria de conversación (si se usa ConversationMemory).
+
+        Args:
+            conversation_history: Historial recibido por chat_with_context()
+            request: Petición enviada (su último mensaje es el del usuario)
+            response_text: Respuesta de Claude
+        """
+        if isinstance(conversation_history, ConversationMemory):
+            conversation_history.add_user(request['messages'][-1]['content'])
+            conversation_history.add_assistant(response_text)
+
+    @staticmethod
+    def _with_cache_control(message: Dict) -> Dict:
+        """
+        Devuelve una copia del mensaje con marca de caché en su último bloque.
+
+        Args:
+            message: Mensaje del historial ({'role', 'content'})
+
+        Returns:
+            Copia del mensaje (el original no se modifica)
+        """
+        content = message.get('content')
+        if isinstance(content, str):
+            blocks = [{"type": "text", "text": content}]
+        else:
+            blocks = [dict(block) for block in content or []]
+        if not blocks:
+            return message
+
+        blocks[-1]["cache_control"] = CACHE_CONTROL
+        return {**message, "content": blocks}
+
+    def _chat_result(self, message) -> str:
+        """Procesa la respuesta de chat_with_context()."""
+        return message.content[0].text
+
+    def _verify_request(self, image_before: Image.Image, image_after: Image.Image,
+                        action_description: str) -> Tuple[Optional[Dict], Optional[Dict[str, Any]]]:
+        """
+        Construye la petición de verify_action_completed().
+
+        Primero compara las capturas localmente: si no cambió nada no hace falta
+        llamar a la IA, y si cambiaron pocas regiones solo se envían sus recortes
+        (antes y después) más una miniatura de la pantalla completa.
+
+        Returns:
+            Tupla (petición, None) o (None, resultado) si no hace falta llamar a la API
+        """
+        with stage('diff'):
+            diff = self.image_diff.compare(image_before, image_after)
+
+        if not diff.changed:
+            return None, {
+                "success": False,
+                "changes_detected": [],
+                "explanation": "La pantalla no cambió después de la acción",
+                "confidence": "high"
+            }
+
+        if (diff.comparable and len(diff.regions) <= VERIFY_MAX_REGIONS
+                and diff.region_area_fraction <= VERIFY_MAX_REGION_FRACTION):
+            content = []
+            for idx, region in enumerate(diff.regions, start=1):
+                box = self.image_diff.pad_box(region, image_after.size)
+                content.extend([
+                    {
+                        "type": "text",
+                        "text": f"REGIÓN {idx} {box} - ANTES:"
+                    },
+                    *self._image_blocks(self.encode_image(image_before.crop(box))),
+                    {
+                        "type": "text",
+                        "text": f"REGIÓN {idx} - DESPUÉS:"
+                    },
+                    *self._image_blocks(self.encode_image(image_after.crop(box))),
+                ])
+
+            thumbnail = self.encode_image(image_after, self.thumbnail_encoder)
+
+            content.extend([
+                {
+                    "type": "text",
+                    "text": "VISTA GENERAL DESPUÉS (miniatura):"
+                },
+                thumbnail.to_content_block(),
+            ])
+            comparison = (
+                "Solo se muestran recortes de las regiones de la pantalla que cambiaron "
+                "(coordenadas left, top, right, bottom); el resto de la pantalla no cambió."
+            )
+        else:
+            content = [
+                {
+                    "type": "text",
+                    "text": "ANTES:"
+                },
+                *self._image_blocks(self.encode_image(image_before)),
+                {
+                    "type": "text",
+                    "text": "DESPUÉS:"
+                },
+                *self._image_blocks(self.encode_image(image_after)),
+            ]
+            comparison = "Compara estas dos capturas de pantalla (ANTES y DESPUÉS)."
+
+        prompt = f"""
+        Se realizó esta acción: "{action_description}"
+
+        {comparison}
+        Determina si la acción se completó exitosamente.
+
+        Reporta el resultado con la herramienta report_verification.
+        """
+        content.append({
+            "type": "text",
+            "text": prompt
+        })
+
+        request = dict(
+            **self.router.params('verify_action_completed'),
+            tools=[VERIFICATION_TOOL],
+            tool_choice=tool_choice(VERIFICATION_TOOL),
+            messages=[
+                {
+                    "role": "user",
+                    "content": content,
+                }
+            ],
+        )
+        return request, None
+
+    def _verify_result(self, message) -> Dict[str, Any]:
+        """Procesa la respuesta de verify_action_completed()."""
+        with stage('parse'):
+            result = StructuredResult.from_message(message, VERIFICATION_TOOL)
+
+            if not result.ok:
+                print(f"Respuesta de IA inválida: {'; '.join(result.errors)}")
+                return {
+                    "success": False,
+                    "changes_detected": [],
+                    "explanation": "Error al verificar cambios",
+                    "confidence": "low"
+                }
+
+            return result.to_dict()
+
+    # ===== MÉTODOS PÚBLICOS =====
+
+    @instrumented('analyze_screen')
+    def analyze_screen(self, image: Image.Image, custom_prompt: Optional[str] = None) -> str:
+        """
+        Analiza una captura de pantalla y describe lo que ve.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            custom_prompt: Prompt personalizado (opcional)
+
+        Returns:
+            Descripción textual de lo que ve en la imagen
+        """
+        prompt = custom_prompt or DEFAULT_ANALYSIS_PROMPT
+
+        cached, cache_key, fingerprint = self._cache_lookup('analyze_screen', image, prompt)
+        if cached is not None:
+            return cached.value
+
+        def compute():
+            request, _ = self._analyze_screen_request(image, prompt)
+            message = self._create_message('analyze_screen', **request)
+
+            response_text = self._analyze_screen_result(message)
+            self._cache_store(cache_key, fingerprint, response_text)
+            return response_text
+
+        return self._coalesce(cache_key, fingerprint, compute)
+
+    @instrumented('stream_analyze_screen')
+    def stream_analyze_screen(self, image: Image.Image, custom_prompt: Optional[str] = None) -> Iterator[str]:
+        """
+        Analiza una captura de pantalla produciendo el texto a medida que se genera.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            custom_prompt: Prompt personalizado (opcional)
+
+        Yields:
+            Fragmentos de la descripción
+        """
+        prompt = custom_prompt or DEFAULT_ANALYSIS_PROMPT
+
+        cached, cache_key, fingerprint = self._cache_lookup('analyze_screen', image, prompt)
+        if cached is not None:
+            yield cached.value
+            return
+
+        request, _ = self._analyze_screen_request(image, prompt)
+
+        chunks = []
+        for text in self._stream_text('analyze_screen', **request):
+            chunks.append(text)
+            yield text
+
+        self._cache_store(cache_key, fingerprint, "".join(chunks))
+
+    @instrumented('get_actions_from_instruction')
+    def get_actions_from_instruction(self, image: Image.Image, instruction: str) -> Dict[str, Any]:
+        """
+        Recibe una instrucción del usuario y la imagen de la pantalla,
+        y retorna las acciones necesarias para cumplir la instrucción.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            instruction: Instrucción del usuario
+
+        Returns:
+            Diccionario con la estrategia y lista de acciones a ejecutar
+        """
+        request, encoded = self._actions_request(image, instruction)
+        message = self._create_message('get_actions_from_instruction', **request)
+        return self._plan_to_screen(image, self._actions_result(message, encoded))
+
+    @instrumented('stream_actions_from_instruction')
+    def stream_actions_from_instruction(self, image: Image.Image,
+                                        instruction: str) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """
+        Igual que get_actions_from_instruction(), pero produce cada acción en cuanto
+        el modelo termina de generarla, para empezar a ejecutar el plan antes de
+        que la respuesta esté completa.
+
+        Las acciones que no cumplen el esquema se descartan. Cerrar el generador
+        (p. ej. al rechazar una acción) cancela la generación en curso. El plan completo
+        se valida al final: si no es válido, el valor de retorno no tiene acciones aunque
+        ya se hayan producido (y quizá ejecutado) algunas.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            instruction: Instrucción del usuario
+
+        Yields:
+            Acciones con coordenadas en píxeles de la pantalla
+
+        Returns:
+            Plan completo validado (valor de retorno del generador)
+        """
+        request, encoded = self._actions_request(image, instruction)
+        parser = IncrementalArrayParser('actions')
+        chunks = self._stream_tool_input('get_actions_from_instruction', **request)
+
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                message = stop.value
+                break
+
+            for action in parser.feed(chunk):
+                action = self._streamed_action(image, action, encoded)
+                if action is not None:
+                    yield action
+
+        return self._plan_to_screen(image, self._actions_result(message, encoded))
+
+    def _streamed_action(self, image: Image.Image, action: Any,
+                         encoded: EncodedImage) -> Optional[Dict[str, Any]]:
+        """Valida una acción recibida en streaming y la pasa a coordenadas de la pantalla (None si no es válida)."""
+        action, errors = normalize(action, ACTION_SCHEMA)
+        if errors:
+            print(f"Acción descartada: {'; '.join(errors)}")
+            return None
+        return self._to_screen(image, self._scale_actions([action], encoded)[0])
+
+    @instrumented('find_element')
+    def find_element(self, image: Image.Image, element_description: str,
+                     window: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, int]]:
+        """
+        Encuentra un elemento en la pantalla por su descripción.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            element_description: Descripción del elemento a buscar
+            window: Ventana que contiene el elemento (de ScreenCapture.get_all_windows());
+                    con element_memory, la posición se recuerda y se reutiliza sin llamar a la IA
+
+        Returns:
+            Diccionario con coordenadas {'x': int, 'y': int} o None si no se encuentra
+        """
+        remembered = self._memory_lookup(image, element_description, window)
+        if remembered is not None:
+            return self._to_screen(image, remembered)
+
+        cached, cache_key, fingerprint = self._cache_lookup('find_element', image, element_description)
+        if cached is not None:
+            location = cached.value
+        else:
+            def compute():
+                request, encoded = self._find_element_request(image, element_description)
+                message = self._create_message('find_element', **request)
+
+                location, cacheable = self._find_element_result(message, encoded)
+                if cacheable:
+                    self._cache_store(cache_key, fingerprint, location)
+                return location
+
+            location = self._coalesce(cache_key, fingerprint, compute)
+
+        # Cada llamada recuerda la posición para su propia ventana, también las que
+        # se unieron a una petición en curso (la ventana no forma parte de la clave)
+        self._memory_remember(image, element_description, window, location)
+        return self._to_screen(image, location)
+
+    @instrumented('find_elements')
+    def find_elements(self, image: Image.Image, descriptions: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Encuentra varios elementos en la pantalla con una sola llamada a la API.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            descriptions: Lista de descripciones de los elementos a buscar
+
+        Returns:
+            Diccionario descripción -> {'found': True, 'x', 'y', 'confidence'}
+            o {'found': False, 'reason'}
+        """
+        descriptions = list(dict.fromkeys(descriptions))  # Sin duplicados, en orden
+        if not descriptions:
+            return {}
+
+        cached, cache_key, fingerprint = self._cache_lookup('find_elements', image, tuple(descriptions))
+        if cached is not None:
+            return self._results_to_screen(image, cached.value)
+
+        def compute():
+            request, encoded = self._find_elements_request(image, descriptions)
+            message = self._create_message('find_elements', **request)
+
+            results, cacheable = self._find_elements_result(message, encoded, descriptions)
+            if cacheable:
+                self._cache_store(cache_key, fingerprint, results)
+            return results
+
+        return self._results_to_screen(image, self._coalesce(cache_key, fingerprint, compute))
+
+    @instrumented('locate_element')
+    def locate_element(self, image: Image.Image, element_description: str) -> Dict[str, Any]:
+        """
+        Encuentra un elemento en dos etapas, de grueso a fino, para reducir los tokens de imagen.
+
+        Primero envía la pantalla muy reducida y pide una región aproximada; después envía
+        solo un recorte a resolución completa alrededor de esa región y traslada las
+        coordenadas precisas a la pantalla completa. Compensa en pantallas grandes
+        (varios monitores, 4K), donde una sola llamada pierde detalle o consume más tokens.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            element_description: Descripción del elemento a buscar
+
+        Returns:
+            {'found': True, 'x', 'y', 'confidence', 'region'} o {'found': False, 'reason'},
+            con 'tokens': tokens de cada etapa, total y estimado de una sola llamada
+        """
+        request, coarse = self._coarse_region_request(image, element_description)
+        coarse_message = self._create_message('locate_element', **request)
+
+        region, reason = self._coarse_region_result(coarse_message, coarse)
+        if region is None:
+            return self._to_screen(image, self._locate_result(image, coarse_message, coarse, None, reason))
+
+        box = self._fine_crop_box(region, image.size)
+        request, fine = self._fine_location_request(image, element_description, box)
+        fine_message = self._create_message('locate_element', **request)
+
+        return self._to_screen(image, self._locate_result(image, coarse_message, coarse, region, reason,
+                                                          fine_message, fine, box))
+
+    @instrumented('chat_with_context')
+    def chat_with_context(self, image: Image.Image, user_message: str,
+                          conversation_history: Optional[Union[List[Dict], ConversationMemory]] = None) -> str:
+        """
+        Chat con Claude teniendo contexto de la pantalla actual.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            user_message: Mensaje del usuario
+            conversation_history: Historial previo (opcional). Una lista de mensajes no se
+                                  modifica; un ConversationMemory registra el turno y se
+                                  compacta automáticamente.
+
+        Returns:
+            Respuesta de Claude
+        """
+        request, _ = self._chat_request(image, user_message, conversation_history)
+        message = self._create_message('chat_with_context', **request)
+        response_text = self._chat_result(message)
+        self._chat_remember(conversation_history, request, response_text)
         return response_text
 
+    @instrumented('stream_chat_with_context')
+    def stream_chat_with_context(self, image: Image.Image, user_message: str,
+                                 conversation_history: Optional[Union[List[Dict], ConversationMemory]] = None
+                                 ) -> Iterator[str]:
+        """
+        Chat con contexto de pantalla produciendo la respuesta a medida que se genera.
+
+        Args:
+            image: Imagen PIL de la pantalla
+            user_message: Mensaje del usuario
+            conversation_history: Historial previo (opcional), como en chat_with_context()
+
+        Yields:
+            Fragmentos de la respuesta de Claude
+        """
+        request, _ = self._chat_request(image, user_message, conversation_history)
+
+        chunks = []
+        for text in self._stream_text('chat_with_context', **request):
+            chunks.append(text)
+            yield text
+
+        self._chat_remember(conversation_history, request, "".join(chunks))
+
+    @instrumented('verify_action_completed')
     def verify_action_completed(self, image_before: Image.Image, image_after: Image.Image,
                                 action_description: str) -> Dict[str, Any]:
         """
@@ -327,83 +1331,371 @@ class AIVision:
         Returns:
             Diccionario con resultado de verificación
         """
-        base64_before = self.image_to_base64(image_before)
-        base64_after = self.image_to_base64(image_after)
+        request, result = self._verify_request(image_before, image_after, action_description)
+        if request is None:
+            return result
 
-        prompt = f"""
-        Se realizó esta acción: "{action_description}"
+        message = self._create_message('verify_action_completed', **request)
+        return self._verify_result(message)
 
-        Compara estas dos capturas de pantalla (ANTES y DESPUÉS) y determina si la acción se completó exitosamente.
+    # ===== LOTES =====
+    # Usados por batch_analyze.py para enviar los análisis a la API de lotes.
+
+    def analysis_request(self, image: Image.Image, custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Construye la petición de analyze_screen() sin enviarla.
 
-        Responde en formato JSON:
-        {{
-            "success": true/false,
-            "changes_detected": ["cambio 1", "cambio 2"],
-            "explanation": "Explicación de lo que cambió",
-            "confidence": "high/medium/low"
-        }}
+        Args:
+            image: Imagen PIL de la pantalla
+            custom_prompt: Prompt personalizado (opcional)
 
-        Responde SOLO con el JSON.
+        Returns:
+            Argumentos de messages.create() (los 'params' de una petición del lote)
         """
+        request, _ = self._analyze_screen_request(image, custom_prompt or DEFAULT_ANALYSIS_PROMPT)
+        return request
 
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=1024,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "ANTES:"
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": base64_before,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": "DESPUÉS:"
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": base64_after,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
-                }
-            ],
+    def analysis_from_message(self, message) -> str:
+        """
+        Procesa la respuesta de una petición creada con analysis_request() y registra su consumo.
+
+        Args:
+            message: Mensaje de respuesta (p. ej. el resultado de un lote)
+
+        Returns:
+            Descripción textual de lo que ve en la imagen
+        """
+        self._record_usage('analyze_screen_batch', message)
+        return self._analyze_screen_result(message)
+
+
+class AsyncAIVision(AIVision):
+    """
+    Versión asíncrona de AIVision basada en el cliente AsyncAnthropic.
+
+    Una sola instancia comparte el pool de conexiones HTTP entre todas las
+    peticiones concurrentes. La codificación de imágenes se ejecuta en un hilo
+    para no bloquear el event loop.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, encoder: Optional[ImageEncoder] = None,
+                 cache: Optional[ResponseCache] = None, client: Optional[AsyncAnthropic] = None,
+                 metrics: Optional[MetricsSink] = None, governor: Optional[RequestGovernor] = None,
+                 base_url: Optional[str] = None, single_flight: Optional[SingleFlight] = None,
+                 element_memory: Optional[ElementMemory] = None, router: Optional[ModelRouter] = None,
+                 budget: Optional[TokenBudget] = None):
+        """
+        Inicializa el cliente asíncrono.
+
+        Args:
+            api_key: API key de Anthropic (si no se proporciona, se busca en variable de entorno)
+            encoder: Codificador de imágenes
+            cache: Caché de respuestas por huella de pantalla (None para desactivarla)
+            client: Cliente AsyncAnthropic existente para compartir su pool de conexiones
+            metrics: Destino de las métricas por llamada
+            governor: Límite de tasa/concurrencia y reintentos (puede compartirse con AIVision)
+            base_url: URL base de la API
+            single_flight: Agrupación de peticiones idénticas simultáneas (None para desactivarla)
+            element_memory: Memoria persistente de posiciones por ventana (None para desactivarla)
+            router: Política de modelos y presupuestos de salida (puede compartirse con AIVision)
+            budget: Presupuesto de tokens de entrada por petición
+        """
+        self._shared_client = client
+        self._inflight = set()
+        super().__init__(api_key=api_key, encoder=encoder, cache=cache, metrics=metrics,
+                         governor=governor, base_url=base_url, single_flight=single_flight,
+                         element_memory=element_memory, router=router, budget=budget)
+
+    def _create_client(self):
+        """Crea (o reutiliza) el cliente asíncrono de la API."""
+        return self._shared_client or AsyncAnthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+    async def _create_message(self, operation: str, **request):
+        """
+        Envía una petición a la API registrándola como petición en curso.
+
+        Si la tarea que espera se cancela, la petición HTTP también se cancela.
+        """
+        self._record_estimate(request)
+        start = time.perf_counter()
+        task = asyncio.ensure_future(
+            self.governor.acall(operation, lambda: self.client.messages.create(**request))
+        )
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        with stage('api'):
+            message = await task
+        self.router.record(operation, request['model'], time.perf_counter() - start)
+        self._record_usage(operation, message)
+
+        escalated = self.router.escalation(operation, request, message)
+        if escalated is not None:
+            return await self._create_message(operation, **escalated)
+        return message
+
+    async def _stream_text(self, operation: str, **request) -> AsyncIterator[str]:
+        """Versión asíncrona de AIVision._stream_text()."""
+        call = current_call()
+        self._record_estimate(request)
+        start = time.perf_counter()
+        with stage('api'):
+            async with self.governor.astream(operation, lambda: self.client.messages.stream(**request)) as stream:
+                async for text in stream.text_stream:
+                    if call is not None:
+                        call.mark('first_token')
+                    yield text
+                message = await stream.get_final_message()
+        self.router.record(operation, request['model'], time.perf_counter() - start)
+        self._record_usage(operation, message)
+
+    async def _stream_tool_input(self, operation: str, result: Dict[str, Any],
+                                 **request) -> AsyncIterator[str]:
+        """
+        Versión asíncrona de AIVision._stream_tool_input().
+
+        Un generador asíncrono no puede devolver un valor, así que el mensaje final
+        se guarda en result['message'] al terminar.
+        """
+        call = current_call()
+        self._record_estimate(request)
+        start = time.perf_counter()
+        with stage('api'):
+            async with self.governor.astream(operation, lambda: self.client.messages.stream(**request)) as stream:
+                async for event in stream:
+                    if (event.type == 'content_block_delta'
+                            and getattr(event.delta, 'type', None) == 'input_json_delta'):
+                        if call is not None:
+                            call.mark('first_token')
+                        yield event.delta.partial_json
+                message = await stream.get_final_message()
+        self.router.record(operation, request['model'], time.perf_counter() - start)
+        self._record_usage(operation, message)
+        result['message'] = message
+
+    async def _coalesce(self, key: Optional[str], fingerprint: Optional[bytes],
+                        compute: Callable[[], Any]) -> Any:
+        """Versión asíncrona de AIVision._coalesce(); compute devuelve una corrutina."""
+        if self.single_flight is None or key is None:
+            return await compute()
+        value, shared = await self.single_flight.ado(key, fingerprint, compute)
+        self._mark_coalesced(shared)
+        return value
+
+    @property
+    def inflight_count(self) -> int:
+        """Número de peticiones en curso."""
+        return len(self._inflight)
+
+    def cancel_all(self) -> int:
+        """
+        Cancela todas las peticiones en curso.
+
+        Returns:
+            Número de peticiones canceladas
+        """
+        tasks = list(self._inflight)
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    async def aclose(self):
+        """Cancela las peticiones pendientes y cierra el pool de conexiones."""
+        self.cancel_all()
+        if self._shared_client is None:
+            await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    @instrumented('analyze_screen')
+    async def analyze_screen(self, image: Image.Image, custom_prompt: Optional[str] = None) -> str:
+        """Versión asíncrona de AIVision.analyze_screen()."""
+        prompt = custom_prompt or DEFAULT_ANALYSIS_PROMPT
+
+        cached, cache_key, fingerprint = await asyncio.to_thread(
+            self._cache_lookup, 'analyze_screen', image, prompt
         )
+        if cached is not None:
+            return cached.value
 
-        response_text = message.content[0].text
+        async def compute():
+            request, _ = await asyncio.to_thread(self._analyze_screen_request, image, prompt)
+            message = await self._create_message('analyze_screen', **request)
 
-        try:
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
+            response_text = self._analyze_screen_result(message)
+            self._cache_store(cache_key, fingerprint, response_text)
+            return response_text
+
+        return await self._coalesce(cache_key, fingerprint, compute)
 
-            result = json.loads(response_text.strip())
+    @instrumented('stream_analyze_screen')
+    async def stream_analyze_screen(self, image: Image.Image,
+                                    custom_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        """Versión asíncrona de AIVision.stream_analyze_screen()."""
+        prompt = custom_prompt or DEFAULT_ANALYSIS_PROMPT
+
+        cached, cache_key, fingerprint = await asyncio.to_thread(
+            self._cache_lookup, 'analyze_screen', image, prompt
+        )
+        if cached is not None:
+            yield cached.value
+            return
+
+        request, _ = await asyncio.to_thread(self._analyze_screen_request, image, prompt)
+
+        chunks = []
+        async for text in self._stream_text('analyze_screen', **request):
+            chunks.append(text)
+            yield text
+
+        self._cache_store(cache_key, fingerprint, "".join(chunks))
+
+    @instrumented('get_actions_from_instruction')
+    async def get_actions_from_instruction(self, image: Image.Image, instruction: str) -> Dict[str, Any]:
+        """Versión asíncrona de AIVision.get_actions_from_instruction()."""
+        request, encoded = await asyncio.to_thread(self._actions_request, image, instruction)
+        message = await self._create_message('get_actions_from_instruction', **request)
+        return self._plan_to_screen(image, self._actions_result(message, encoded))
+
+    @instrumented('stream_actions_from_instruction')
+    async def stream_actions_from_instruction(self, image: Image.Image, instruction: str,
+                                              plan: Optional[Dict[str, Any]] = None
+                                              ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versión asíncrona de AIVision.stream_actions_from_instruction().
+
+        Args:
+            image: Imagen PIL de la pantalla
+            instruction: Instrucción del usuario
+            plan: Diccionario que al terminar se rellena con el plan completo validado
+                  (el valor de retorno de la versión síncrona)
+
+        Yields:
+            Acciones con coordenadas en píxeles de la pantalla
+        """
+        request, encoded = await asyncio.to_thread(self._actions_request, image, instruction)
+        parser = IncrementalArrayParser('actions')
+        result = {}
+
+        async for chunk in self._stream_tool_input('get_actions_from_instruction', result, **request):
+            for action in parser.feed(chunk):
+                action = self._streamed_action(image, action, encoded)
+                if action is not None:
+                    yield action
+
+        final = self._plan_to_screen(image, self._actions_result(result['message'], encoded))
+        if plan is not None:
+            plan.update(final)
+
+    @instrumented('find_element')
+    async def find_element(self, image: Image.Image, element_description: str,
+                           window: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, int]]:
+        """Versión asíncrona de AIVision.find_element()."""
+        remembered = await asyncio.to_thread(self._memory_lookup, image, element_description, window)
+        if remembered is not None:
+            return self._to_screen(image, remembered)
+
+        cached, cache_key, fingerprint = await asyncio.to_thread(
+            self._cache_lookup, 'find_element', image, element_description
+        )
+        if cached is not None:
+            location = cached.value
+        else:
+            async def compute():
+                request, encoded = await asyncio.to_thread(self._find_element_request, image, element_description)
+                message = await self._create_message('find_element', **request)
+
+                location, cacheable = self._find_element_result(message, encoded)
+                if cacheable:
+                    self._cache_store(cache_key, fingerprint, location)
+                return location
+
+            location = await self._coalesce(cache_key, fingerprint, compute)
+
+        await asyncio.to_thread(self._memory_remember, image, element_description, window, location)
+        return self._to_screen(image, location)
+
+    @instrumented('find_elements')
+    async def find_elements(self, image: Image.Image, descriptions: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Versión asíncrona de AIVision.find_elements()."""
+        descriptions = list(dict.fromkeys(descriptions))
+        if not descriptions:
+            return {}
+
+        cached, cache_key, fingerprint = await asyncio.to_thread(
+            self._cache_lookup, 'find_elements', image, tuple(descriptions)
+        )
+        if cached is not None:
+            return self._results_to_screen(image, cached.value)
+
+        async def compute():
+            request, encoded = await asyncio.to_thread(self._find_elements_request, image, descriptions)
+            message = await self._create_message('find_elements', **request)
+
+            results, cacheable = self._find_elements_result(message, encoded, descriptions)
+            if cacheable:
+                self._cache_store(cache_key, fingerprint, results)
+            return results
+
+        return self._results_to_screen(image, await self._coalesce(cache_key, fingerprint, compute))
+
+    @instrumented('locate_element')
+    async def locate_element(self, image: Image.Image, element_description: str) -> Dict[str, Any]:
+        """Versión asíncrona de AIVision.locate_element()."""
+        request, coarse = await asyncio.to_thread(self._coarse_region_request, image, element_description)
+        coarse_message = await self._create_message('locate_element', **request)
+
+        region, reason = self._coarse_region_result(coarse_message, coarse)
+        if region is None:
+            return self._to_screen(image, self._locate_result(image, coarse_message, coarse, None, reason))
+
+        box = self._fine_crop_box(region, image.size)
+        request, fine = await asyncio.to_thread(self._fine_location_request, image, element_description, box)
+        fine_message = await self._create_message('locate_element', **request)
+
+        return self._to_screen(image, self._locate_result(image, coarse_message, coarse, region, reason,
+                                                          fine_message, fine, box))
+
+    @instrumented('chat_with_context')
+    async def chat_with_context(self, image: Image.Image, user_message: str,
+                                conversation_history: Optional[Union[List[Dict], ConversationMemory]] = None
+                                ) -> str:
+        """Versión asíncrona de AIVision.chat_with_context()."""
+        request, _ = await asyncio.to_thread(self._chat_request, image, user_message, conversation_history)
+        message = await self._create_message('chat_with_context', **request)
+        response_text = self._chat_result(message)
+        self._chat_remember(conversation_history, request, response_text)
+        return response_text
+
+    @instrumented('stream_chat_with_context')
+    async def stream_chat_with_context(self, image: Image.Image, user_message: str,
+                                       conversation_history: Optional[Union[List[Dict], ConversationMemory]] = None
+                                       ) -> AsyncIterator[str]:
+        """Versión asíncrona de AIVision.stream_chat_with_context()."""
+        request, _ = await asyncio.to_thread(self._chat_request, image, user_message, conversation_history)
+
+        chunks = []
+        async for text in self._stream_text('chat_with_context', **request):
+            chunks.append(text)
+            yield text
+
+        self._chat_remember(conversation_history, request, "".join(chunks))
+
+    @instrumented('verify_action_completed')
+    async def verify_action_completed(self, image_before: Image.Image, image_after: Image.Image,
+                                      action_description: str) -> Dict[str, Any]:
+        """Versión asíncrona de AIVision.verify_action_completed()."""
+        request, result = await asyncio.to_thread(
+            self._verify_request, image_before, image_after, action_description
+        )
+        if request is None:
             return result
-        except json.JSONDecodeError as e:
-            print(f"Error al parsear respuesta: {e}")
-            return {
-                "success": False,
-                "changes_detected": [],
-                "explanation": "Error al verificar cambios",
-                "confidence": "low"
-            }
+
+        message = await self._create_message('verify_action_completed', **request)
+        return self._verify_result(message)
 
 
 # Función de prueba
@@ -3,20 +3,27 @@ Backend Flask - API REST para el Asistente de IA
 Proporciona endpoints web para controlar el asistente desde una interfaz gráfica.
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
 import json
 import base64
 import io
+import time
+from typing import Optional
 from datetime import datetime
 from dotenv import load_dotenv
 from PIL import Image
 
 # Importar módulos del asistente
 from screen_capture import ScreenCapture
-from automation import Automation
+from automation import Automation, ConfirmationPolicy
 from ai_vision import AIVision
+from response_cache import ResponseCache, SingleFlight
+from element_memory import ElementMemory
+from model_router import ModelRouter
+from metrics import InMemoryMetrics
+from request_governor import RequestGovernor, GovernorTimeout, is_retryable
 
 # Cargar variables de entorno
 load_dotenv()
@@ -26,12 +33,47 @@ app = Flask(__name__)
 CORS(app)  # Permitir CORS para desarrollo
 
 # Inicializar componentes del asistente
-screen_capture = ScreenCapture()
+# CAPTURE_WORKERS: capturas simultáneas en paralelo (las demás esperan turno); por defecto una por núcleo
+screen_capture = ScreenCapture(capture_workers=int(os.getenv('CAPTURE_WORKERS', '0') or 0) or None)
 automation = Automation()
 
+# Captura continua opcional: con CONTINUOUS_CAPTURE_FPS > 0 las peticiones toman la última
+# captura del búfer si no tiene más de CAPTURE_MAX_AGE_MS en lugar de capturar en el momento.
+# El búfer guarda capturas completas (unos 33 MB cada una en 4K) hasta CONTINUOUS_CAPTURE_MAX_MB
+CONTINUOUS_CAPTURE_FPS = float(os.getenv('CONTINUOUS_CAPTURE_FPS', '0') or 0)
+CONTINUOUS_CAPTURE_MAX_MB = float(os.getenv('CONTINUOUS_CAPTURE_MAX_MB', '256'))
+CAPTURE_MAX_AGE_MS = float(os.getenv('CAPTURE_MAX_AGE_MS', '250'))
+if CONTINUOUS_CAPTURE_FPS > 0:
+    screen_capture.start_continuous_capture(fps=CONTINUOUS_CAPTURE_FPS,
+                                            max_bytes=int(CONTINUOUS_CAPTURE_MAX_MB * 2 ** 20))
+
+# Monitor que ven las peticiones que no indican 'monitor' (1 el principal; 0 todos unidos)
+CAPTURE_MONITOR = int(os.getenv('CAPTURE_MONITOR', '1'))
+
 # Variable global para la instancia de AI (se inicializa cuando se configura la API key)
 ai_vision = None
 
+# Caché de respuestas compartida (se conserva aunque se reconfigure la API key)
+response_cache = ResponseCache()
+
+# Métricas de las llamadas a la IA; con METRICS_DEBUG=1 se adjuntan a las respuestas JSON
+metrics_sink = InMemoryMetrics()
+
+# Límite de tasa y concurrencia común a todos los usuarios de la interfaz web:
+# con carga, las peticiones esperan turno en lugar de fallar
+request_governor = RequestGovernor()
+
+# Peticiones idénticas simultáneas (varias pestañas o paneles que se refrescan a la vez
+# sobre el mismo escritorio) comparten una sola llamada a la API
+single_flight = SingleFlight()
+
+# Posiciones de elementos recordadas por ventana (persisten entre reinicios)
+element_memory = ElementMemory(path=os.getenv('ELEMENT_MEMORY_PATH', 'element_memory.json'))
+
+# Modelo y presupuesto de salida por operación (variables de entorno + cambios hechos en /settings)
+model_router = ModelRouter.from_env(path=os.getenv('AI_ROUTING_PATH', 'model_routing.json'))
+app.config['METRICS_DEBUG'] = os.getenv('METRICS_DEBUG', '').lower() in ('1', 'true', 'yes')
+
 
 # ===== RUTAS DE LA INTERFAZ WEB =====
 
@@ -49,6 +91,94 @@ def settings():
 
 # ===== API ENDPOINTS =====
 
+def ai_error_status(error: Exception) -> int:
+    """
+    Código HTTP para un error de la IA.
+
+    Los límites de tasa y la sobrecarga se devuelven como 429/503 (no 500) para que
+    el cliente sepa que puede reintentar.
+    """
+    if isinstance(error, InvalidMonitorError):
+        return 400
+    if getattr(error, 'status_code', None) == 429:
+        return 429
+    if isinstance(error, GovernorTimeout) or is_retryable(error):
+        return 503
+    return 500
+
+
+class InvalidMonitorError(ValueError):
+    """El monitor indicado en la petición no es un número o no existe (se responde con 400)."""
+
+
+def requested_monitor() -> int:
+    """
+    Monitor indicado en la petición ('monitor' en el JSON o en la URL; por defecto CAPTURE_MONITOR).
+
+    Solo se envían a la IA los píxeles de ese monitor, y las coordenadas devueltas
+    son globales del escritorio virtual.
+
+    Raises:
+        InvalidMonitorError: Si el monitor no es un número o no existe
+    """
+    data = request.get_json(silent=True) or {}
+    monitor = data.get('monitor', request.args.get('monitor'))
+    if monitor in (None, ''):
+        return CAPTURE_MONITOR
+
+    try:
+        if isinstance(monitor, bool):
+            raise ValueError
+        index = int(monitor)
+    except (TypeError, ValueError):
+        raise InvalidMonitorError(f"Monitor no válido: {monitor!r}")
+
+    available = len(screen_capture.get_monitors())
+    if not 0 <= index <= available:
+        raise InvalidMonitorError(f"Monitor inexistente: {index} (hay {available}; 0 para todos)")
+    return index
+
+
+def capture_screen_timed(monitor: Optional[int] = None):
+    """
+    Captura la pantalla completa midiendo el tiempo de captura (con la captura
+    continua activa, toma la última del búfer si es suficientemente reciente).
+
+    Args:
+        monitor: Monitor a capturar (por defecto el de la petición, ver requested_monitor())
+
+    Returns:
+        Tupla (Frame, segundos); el Frame memoriza sus codificaciones
+
+    Raises:
+        InvalidMonitorError: Si el monitor de la petición no es válido
+    """
+    if monitor is None:
+        monitor = requested_monitor()
+    start = time.perf_counter()
+    screenshot = screen_capture.latest(max_age_ms=CAPTURE_MAX_AGE_MS, monitor=monitor)
+    return screenshot, time.perf_counter() - start
+
+
+def with_metrics(payload: dict, capture_seconds: float = None) -> dict:
+    """
+    Agrega a una respuesta las métricas de la última llamada a la IA (solo con METRICS_DEBUG).
+
+    Args:
+        payload: Diccionario de la respuesta JSON
+        capture_seconds: Tiempo de captura de pantalla (se incluye como etapa 'capture')
+
+    Returns:
+        El mismo diccionario, con la clave 'metrics' si el modo depuración está activo
+    """
+    if app.config['METRICS_DEBUG'] and ai_vision and ai_vision.last_metrics:
+        call_metrics = ai_vision.last_metrics.to_dict()
+        if capture_seconds is not None:
+            call_metrics['stages']['capture'] = round(capture_seconds, 4)
+        payload['metrics'] = call_metrics
+    return payload
+
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Obtiene el estado actual del sistema."""
@@ -60,7 +190,9 @@ def get_status():
     # Intentar inicializar AI si no está inicializado
     if api_key_configured and ai_vision is None:
         try:
-            ai_vision = AIVision()
+            ai_vision = AIVision(cache=response_cache, metrics=metrics_sink, governor=request_governor,
+                                 single_flight=single_flight, element_memory=element_memory,
+                                 router=model_router)
         except Exception as e:
             api_key_configured = False
 
@@ -70,11 +202,66 @@ def get_status():
             'api_key_configured': api_key_configured,
             'ai_enabled': ai_vision is not None,
             'screen_size': screen_capture.get_screen_size(),
-            'model': ai_vision.model if ai_vision else None
+            'monitors': screen_capture.get_monitors(),
+            'model': ai_vision.model if ai_vision else None,
+            'cache': response_cache.stats(),
+            'usage': ai_vision.usage_totals if ai_vision else None,
+            'governor': request_governor.stats(),
+            'single_flight': single_flight.stats(),
+            'element_memory': element_memory.stats(),
+            'continuous_capture': screen_capture.continuous_capture_stats(),
+            'capture_pool': screen_capture.mss_pool.stats()
         }
     })
 
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Obtiene las métricas agregadas por método (latencias p50/p95/p99, tokens y coste)."""
+    return jsonify({
+        'success': True,
+        'metrics': metrics_sink.summary(),
+        'routes': model_router.stats()
+    })
+
+
+@app.route('/api/config/routing', methods=['GET'])
+def get_routing():
+    """Obtiene la política de modelos por operación y sus estadísticas de latencia."""
+    return jsonify({
+        'success': True,
+        'routing': model_router.to_dict(),
+        'stats': model_router.stats()
+    })
+
+
+@app.route('/api/config/routing', methods=['POST'])
+def set_routing():
+    """Actualiza la política de modelos (niveles, rutas, activación) y la guarda."""
+    data = request.get_json() or {}
+
+    try:
+        model_router.configure(
+            models=data.get('models'),
+            routes=data.get('routes'),
+            enabled=data.get('enabled')
+        )
+        model_router.save()
+
+        return jsonify({
+            'success': True,
+            'routing': model_router.to_dict()
+        })
+
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Configuración aplicada pero no se pudo guardar: {str(e)}'
+        }), 500
+
+
 @app.route('/api/config/api-key', methods=['POST'])
 def set_api_key():
     """Configura la API key de Anthropic."""
@@ -96,7 +283,10 @@ def set_api_key():
         os.environ['ANTHROPIC_API_KEY'] = api_key
 
         # Reinicializar AI Vision
-        ai_vision = AIVision(api_key=api_key)
+        response_cache.clear()
+        ai_vision = AIVision(api_key=api_key, cache=response_cache, metrics=metrics_sink,
+                             governor=request_governor, single_flight=single_flight,
+                             element_memory=element_memory, router=model_router)
 
         return jsonify({
             'success': True,
@@ -148,7 +338,7 @@ def get_windows():
 def capture_screen():
     """Captura la pantalla completa."""
     try:
-        screenshot = screen_capture.capture_full_screen()
+        screenshot = screen_capture.latest(max_age_ms=CAPTURE_MAX_AGE_MS, monitor=requested_monitor())
 
         # Convertir a base64
         img_base64 = screen_capture.image_to_base64(screenshot)
@@ -158,9 +348,13 @@ def capture_screen():
             'image': f'data:image/png;base64,{img_base64}',
             'width': screenshot.width,
             'height': screenshot.height,
-            'timestamp': datetime.now().isoformat()
+            'origin': screenshot.origin,
+            'monitor': screenshot.monitor,
+            'timestamp': datetime.fromtimestamp(screenshot.timestamp).isoformat()
         })
 
+    except InvalidMonitorError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -217,21 +411,66 @@ def analyze_screen():
         custom_prompt = data.get('prompt', None)
 
         # Capturar pantalla
-        screenshot = screen_capture.capture_full_screen()
+        screenshot, capture_seconds = capture_screen_timed()
 
         # Analizar con IA
         analysis = ai_vision.analyze_screen(screenshot, custom_prompt)
 
-        return jsonify({
+        return jsonify(with_metrics({
             'success': True,
             'analysis': analysis
-        })
+        }, capture_seconds))
 
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), ai_error_status(e)
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Formatea un evento Server-Sent Events."""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/ai/analyze/stream', methods=['POST'])
+def analyze_screen_stream():
+    """Analiza la pantalla con IA enviando el texto por Server-Sent Events a medida que se genera."""
+    if not ai_vision:
+        return jsonify({
+            'success': False,
+            'error': 'IA no configurada. Configure la API key primero.'
+        }), 400
+
+    data = request.get_json(silent=True) or {}
+    custom_prompt = data.get('prompt', None)
+
+    # Validar el monitor antes de empezar el stream, mientras aún se puede responder con 400
+    try:
+        monitor = requested_monitor()
+    except InvalidMonitorError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    def generate():
+        try:
+            # Capturar pantalla
+            screenshot, capture_seconds = capture_screen_timed(monitor)
+
+            # Enviar cada fragmento en cuanto llega
+            for text in ai_vision.stream_analyze_screen(screenshot, custom_prompt):
+                yield sse_event({'delta': text})
+
+            yield sse_event(with_metrics({'success': True}, capture_seconds), event='done')
+
+        except Exception as e:
+            yield sse_event({'success': False, 'error': str(e)}, event='error')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/api/ai/execute', methods=['POST'])
@@ -254,25 +493,47 @@ def execute_instruction():
             }), 400
 
         # Capturar pantalla
-        screenshot = screen_capture.capture_full_screen()
+        screenshot, capture_seconds = capture_screen_timed()
+
+        if data.get('pipelined'):
+            # Modo canalizado: ejecutar cada acción en cuanto se genera, sin revisión
+            # previa del plan; la política de confirmación filtra las acciones peligrosas
+            execution = automation.execute_action_stream(
+                ai_vision.stream_actions_from_instruction(screenshot, instruction),
+                confirm=ConfirmationPolicy()
+            )
+            result = execution['plan'] or {}
+
+            return jsonify(with_metrics({
+                'success': execution['rejected'] is None and execution['plan_valid'],
+                'pipelined': True,
+                'analysis': result.get('analysis', ''),
+                'strategy': result.get('strategy', ''),
+                'executed': execution['executed'],
+                'rejected': execution['rejected'],
+                'reason': execution['reason'],
+                'plan_valid': execution['plan_valid'],
+                'warnings': execution['warnings'] + result.get('warnings', []),
+                'success_criteria': result.get('success_criteria', '')
+            }, capture_seconds))
 
         # Obtener plan de acciones
         result = ai_vision.get_actions_from_instruction(screenshot, instruction)
 
-        return jsonify({
+        return jsonify(with_metrics({
             'success': True,
             'analysis': result.get('analysis', ''),
             'strategy': result.get('strategy', ''),
             'actions': result.get('actions', []),
             'warnings': result.get('warnings', []),
             'success_criteria': result.get('success_criteria', '')
-        })
+        }, capture_seconds))
 
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), ai_error_status(e)
 
 
 @app.route('/api/automation/execute', methods=['POST'])
@@ -400,30 +661,82 @@ def find_element():
             }), 400
 
         # Capturar pantalla
-        screenshot = screen_capture.capture_full_screen()
+        screenshot, capture_seconds = capture_screen_timed()
+
+        # Búsqueda en dos etapas (vista reducida + recorte): devuelve también los tokens usados
+        if data.get('coarse_to_fine'):
+            location = ai_vision.locate_element(screenshot, description)
+            if not location['found']:
+                location['message'] = 'Elemento no encontrado'
+            return jsonify(with_metrics({'success': True, **location}, capture_seconds))
+
+        # Con el título de la ventana, la posición se recuerda para las siguientes búsquedas
+        window_title = (data.get('window_title') or '').strip()
+        window = screen_capture.find_window_by_title(window_title) if window_title else None
 
         # Buscar elemento
-        location = ai_vision.find_element(screenshot, description)
+        location = ai_vision.find_element(screenshot, description, window=window)
 
         if location:
-            return jsonify({
+            return jsonify(with_metrics({
                 'success': True,
                 'found': True,
                 'x': location['x'],
                 'y': location['y']
-            })
+            }, capture_seconds))
         else:
-            return jsonify({
+            return jsonify(with_metrics({
                 'success': True,
                 'found': False,
                 'message': 'Elemento no encontrado'
-            })
+            }, capture_seconds))
 
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), ai_error_status(e)
+
+
+@app.route('/api/ai/find-elements', methods=['POST'])
+def find_elements():
+    """Busca varios elementos en la pantalla con una sola llamada a la IA."""
+    if not ai_vision:
+        return jsonify({
+            'success': False,
+            'error': 'IA no configurada. Configure la API key primero.'
+        }), 400
+
+    try:
+        data = request.get_json()
+        descriptions = [
+            d.strip() for d in data.get('descriptions', [])
+            if isinstance(d, str) and d.strip()
+        ]
+
+        if not descriptions:
+            return jsonify({
+                'success': False,
+                'error': 'Lista de descripciones vacía'
+            }), 400
+
+        # Capturar pantalla
+        screenshot, capture_seconds = capture_screen_timed()
+
+        # Buscar todos los elementos en una sola llamada
+        results = ai_vision.find_elements(screenshot, descriptions)
+
+        return jsonify(with_metrics({
+            'success': True,
+            'elements': results,
+            'found_count': sum(1 for r in results.values() if r['found'])
+        }, capture_seconds))
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), ai_error_status(e)
 
 
 # ===== MANEJO DE ERRORES =====
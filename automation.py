@@ -5,7 +5,7 @@ Permite escribir texto, hacer clics, mover el mouse y ejecutar secuencias de acc
 
 import pyautogui
 import time
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Any, Callable, Iterable
 import keyboard
 from pynput.keyboard import Key, Controller as KeyboardController
 from pynput.mouse import Button, Controller as MouseController
@@ -14,6 +14,130 @@ from pynput.mouse import Button, Controller as MouseController
 pyautogui.FAILSAFE = True  # Mover mouse a esquina superior izquierda para abortar
 pyautogui.PAUSE = 0.1  # Pausa entre acciones
 
+class ConfirmationPolicy:
+    """
+    Política de confirmación para la ejecución canalizada de planes.
+
+    Decide, acción por acción, si una acción generada por la IA puede ejecutarse
+    antes de haber visto el plan completo. Los límites del plan (número de acciones
+    y texto total escrito) se comprueban sobre la parte ya recibida; el resto de la
+    validación del plan solo es posible al final, cuando algunas acciones ya se
+    ejecutaron (ver Automation.execute_action_stream()).
+    """
+
+    DEFAULT_ALLOWED_TYPES = ('click', 'type', 'press', 'hotkey', 'wait', 'scroll', 'move')
+
+    # Atajos que cierran ventanas, sesiones o lanzan programas
+    DEFAULT_BLOCKED_HOTKEYS = (
+        ('alt', 'f4'),
+        ('ctrl', 'w'),
+        ('ctrl', 'q'),
+        ('ctrl', 'alt', 'delete'),
+        ('ctrl', 'shift', 'esc'),
+        ('win', 'r'),
+        ('win', 'l'),
+    )
+
+    # Nombres equivalentes de teclas (pyautogui acepta varios para la misma tecla)
+    KEY_ALIASES = {
+        'control': 'ctrl', 'ctrlleft': 'ctrl', 'ctrlright': 'ctrl',
+        'altleft': 'alt', 'altright': 'alt', 'option': 'alt',
+        'shiftleft': 'shift', 'shiftright': 'shift',
+        'del': 'delete', 'escape': 'esc',
+        'winleft': 'win', 'winright': 'win', 'windows': 'win', 'super': 'win',
+        'command': 'win', 'cmd': 'win',
+    }
+
+    def __init__(self, allowed_types: Iterable[str] = DEFAULT_ALLOWED_TYPES,
+                 blocked_hotkeys: Iterable[Iterable[str]] = DEFAULT_BLOCKED_HOTKEYS,
+                 max_actions: int = 20, max_text_length: int = 500, max_total_text: int = 2000,
+                 ask: Optional[Callable[[Dict, int], bool]] = None):
+        """
+        Args:
+            allowed_types: Tipos de acción permitidos
+            blocked_hotkeys: Combinaciones de teclas que nunca se ejecutan (tampoco
+                             dentro de un atajo con más teclas)
+            max_actions: Número máximo de acciones del plan
+            max_text_length: Longitud máxima del texto de una acción 'type'
+            max_total_text: Longitud máxima del texto escrito por todo el plan
+            ask: Función opcional que pide confirmación al usuario para cada acción
+                 que cumple las reglas (recibe la acción y su índice)
+        """
+        self.allowed_types = set(allowed_types)
+        self.blocked_hotkeys = {self._key_set(keys) for keys in blocked_hotkeys}
+        self.max_actions = max_actions
+        self.max_text_length = max_text_length
+        self.max_total_text = max_total_text
+        self.ask = ask
+        self.last_reason: Optional[str] = None
+        # Texto escrito por las acciones ya aprobadas del plan en curso (se reinicia con el índice 0)
+        self._typed_chars = 0
+
+    @classmethod
+    def _key_set(cls, keys: Iterable[str]) -> frozenset:
+        """Conjunto de teclas en minúsculas con los alias unificados."""
+        names = (str(key).strip().lower() for key in keys)
+        return frozenset(cls.KEY_ALIASES.get(name, name) for name in names)
+
+    def check(self, action: Dict, index: int) -> Optional[str]:
+        """
+        Comprueba una acción contra las reglas de la política y contra la parte del
+        plan ya aprobada.
+
+        Args:
+            action: Acción a comprobar
+            index: Posición de la acción en el plan (desde 0; 0 empieza un plan nuevo)
+
+        Returns:
+            Motivo del rechazo o None si la acción está permitida
+        """
+        action_type = action.get('type')
+
+        if index >= self.max_actions:
+            return f"El plan supera el máximo de {self.max_actions} acciones"
+        if action_type not in self.allowed_types:
+            return f"Tipo de acción no permitido: {action_type}"
+        if action_type == 'hotkey':
+            keys = self._key_set(action.get('keys', []))
+            if any(blocked <= keys for blocked in self.blocked_hotkeys):
+                return f"Atajo bloqueado: {' + '.join(action.get('keys', []))}"
+        if action_type == 'type':
+            length = len(action.get('text', ''))
+            if length > self.max_text_length:
+                return f"Texto demasiado largo ({length} caracteres)"
+            typed = (self._typed_chars if index else 0) + length
+            if typed > self.max_total_text:
+                return f"El plan supera el máximo de {self.max_total_text} caracteres escritos"
+
+        return None
+
+    def __call__(self, action: Dict, index: int) -> bool:
+        """
+        Decide si una acción puede ejecutarse.
+
+        Args:
+            action: Acción a ejecutar
+            index: Posición de la acción en el plan (desde 0)
+
+        Returns:
+            True si la acción se puede ejecutar
+        """
+        if index == 0:
+            self._typed_chars = 0
+
+        self.last_reason = self.check(action, index)
+        if self.last_reason:
+            return False
+
+        if self.ask and not self.ask(action, index):
+            self.last_reason = "Rechazada por el usuario"
+            return False
+
+        if action.get('type') == 'type':
+            self._typed_chars += len(action.get('text', ''))
+        return True
+
+
 class Automation:
     """Clase para manejar automatización de teclado y mouse."""
 
@@ -283,40 +407,124 @@ class Automation:
 
         for idx, action in enumerate(actions):
             print(f"Acción {idx + 1}/{len(actions)}: {action.get('type', 'unknown')}")
+            self.execute_action(action)
 
-            action_type = action.get('type')
+        print("Secuencia completada.\n")
 
-            if action_type == 'type':
-                self.type_text(action.get('text', ''),
-                              interval=action.get('interval', 0.05))
+    def execute_action(self, action: Dict):
+        """
+        Ejecuta una única acción.
 
-            elif action_type == 'press':
-                self.press_key(action.get('key', 'enter'))
+        Args:
+            action: Diccionario con la acción (ej: {'type': 'press', 'key': 'enter'})
+        """
+        action_type = action.get('type')
 
-            elif action_type == 'hotkey':
-                self.hotkey(*action.get('keys', []))
+        if action_type == 'type':
+            self.type_text(action.get('text', ''),
+                          interval=action.get('interval', 0.05))
 
-            elif action_type == 'click':
-                self.click(action.get('x'), action.get('y'),
-                          button=action.get('button', 'left'))
+        elif action_type == 'press':
+            self.press_key(action.get('key', 'enter'))
 
-            elif action_type == 'move':
-                self.move_mouse(action.get('x'), action.get('y'),
-                               duration=action.get('duration', 0.5))
+        elif action_type == 'hotkey':
+            self.hotkey(*action.get('keys', []))
 
-            elif action_type == 'wait':
-                self.wait(action.get('seconds', 1))
+        elif action_type == 'click':
+            self.click(action.get('x'), action.get('y'),
+                      button=action.get('button', 'left'))
 
-            elif action_type == 'scroll':
-                self.scroll(action.get('amount', 0))
+        elif action_type == 'move':
+            self.move_mouse(action.get('x'), action.get('y'),
+                           duration=action.get('duration', 0.5))
 
-            else:
-                print(f"Tipo de acción desconocida: {action_type}")
+        elif action_type == 'wait':
+            self.wait(action.get('seconds', 1))
 
-            # Pausa pequeña entre acciones
-            time.sleep(0.1)
+        elif action_type == 'scroll':
+            self.scroll(action.get('amount', 0))
 
-        print("Secuencia completada.\n")
+        else:
+            print(f"Tipo de acción desconocida: {action_type}")
+
+        # Pausa pequeña entre acciones
+        time.sleep(0.1)
+
+    def execute_action_stream(self, actions: Iterable[Dict],
+                              confirm: Optional[Callable[[Dict, int], bool]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta las acciones a medida que llegan (p. ej. desde
+        AIVision.stream_actions_from_instruction()), sin esperar al plan completo.
+
+        Cada acción pasa por la política de confirmación antes de ejecutarse; si se
+        rechaza, la ejecución se detiene y se cierra el generador de acciones.
+
+        El plan completo solo se valida cuando termina la generación, y para entonces
+        las acciones anteriores ya se ejecutaron. plan_valid solo es True si el plan
+        final es válido y coincide con lo ejecutado; si no lo es tras ejecutar alguna
+        acción, warnings lo indica para que quien llama revise el estado de la pantalla.
+
+        Args:
+            actions: Iterable o generador de acciones
+            confirm: Función que recibe (acción, índice) y devuelve True si se puede
+                     ejecutar (p. ej. una ConfirmationPolicy)
+
+        Returns:
+            Diccionario con las acciones ejecutadas, la acción rechazada (si la hubo),
+            el motivo, el plan completo devuelto por el generador (si terminó),
+            plan_valid y warnings
+        """
+        print("\nEjecutando acciones a medida que se generan...")
+
+        executed = []
+        rejected = None
+        reason = None
+        plan = None
+        iterator = iter(actions)
+
+        try:
+            while True:
+                try:
+                    action = next(iterator)
+                except StopIteration as stop:
+                    plan = stop.value
+                    break
+
+                if confirm is not None and not confirm(action, len(executed)):
+                    rejected = action
+                    reason = getattr(confirm, 'last_reason', None) or "Rechazada por la política"
+                    print(f"Acción rechazada: {action.get('description', action.get('type'))} ({reason})")
+                    break
+
+                print(f"Acción {len(executed) + 1}: {action.get('type', 'unknown')}")
+                self.execute_action(action)
+                executed.append(action)
+        finally:
+            # Detener la generación si se rechazó una acción o hubo un error
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+        print(f"Ejecución canalizada terminada: {len(executed)} acciones.\n")
+
+        # Con la generación completa, el plan validado debe contener lo que ya se ejecutó
+        warnings = []
+        plan_valid = plan is not None and len(plan.get('actions') or []) == len(executed)
+        if rejected is None and not plan_valid and executed:
+            warnings.append(
+                f"Se ejecutaron {len(executed)} acciones antes de que el plan completo fallara la "
+                "validación; revisa el estado de la pantalla"
+            )
+            print(f"Aviso: {warnings[-1]}")
+
+        return {
+            'executed': executed,
+            'rejected': rejected,
+            'reason': reason,
+            'plan': plan,
+            'plan_valid': plan_valid,
+            'warnings': warnings,
+        }
 
 
 # Función de prueba
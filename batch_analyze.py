@@ -0,0 +1,358 @@
+"""
+Módulo de análisis masivo de capturas guardadas.
+Analiza un directorio (o un manifiesto) de capturas con un mismo prompt y escribe
+los resultados en un archivo JSONL. Puede trabajar con un grupo acotado de hilos
+o con la API de lotes de Anthropic (más lenta pero a mitad de precio), guarda el
+progreso y continúa donde se quedó si el proceso se interrumpe.
+
+Uso:
+    python batch_analyze.py capturas/ --output qa.jsonl --mode batch
+    python batch_analyze.py manifiesto.txt --prompt "¿Hay algún error visible?" --workers 8
+"""
+
+from PIL import Image
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from ai_vision import AIVision
+from metrics import estimate_cost
+from request_governor import RequestGovernor
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+
+# Descuento de la API de lotes sobre el precio normal
+BATCH_DISCOUNT = 0.5
+
+# Tamaño máximo de cada lote enviado (la API admite hasta 100.000 peticiones y 256 MB)
+MAX_BATCH_REQUESTS = 5000
+MAX_BATCH_BYTES = 100 * 1024 * 1024
+
+
+def collect_images(source: str) -> List[str]:
+    """
+    Obtiene la lista de capturas a analizar.
+
+    Args:
+        source: Directorio (se recorre recursivamente) o manifiesto: un .txt con una ruta
+                por línea o un .jsonl con un objeto {"path": ...} por línea. Las rutas
+                relativas del manifiesto se resuelven respecto a su directorio.
+
+    Returns:
+        Rutas de las imágenes, sin duplicados y en orden estable
+
+    Raises:
+        FileNotFoundError: Si el origen no existe
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+        return paths
+
+    if not os.path.isfile(source):
+        raise FileNotFoundError(f"No existe el directorio o manifiesto: {source}")
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path = json.loads(line)['path'] if source.lower().endswith('.jsonl') else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base_dir, path))
+    return list(dict.fromkeys(paths))
+
+
+def custom_id_for(path: str) -> str:
+    """Identificador de la petición en el lote (la API solo admite [a-zA-Z0-9_-], hasta 64 caracteres)."""
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+
+
+class BatchAnalyzer:
+    """Trabajo de análisis masivo con resultados en JSONL y reanudación tras un fallo."""
+
+    def __init__(self, ai: AIVision, prompt: Optional[str] = None,
+                 output_path: str = 'batch_results.jsonl', workers: int = 4,
+                 poll_interval: float = 30.0, max_batch_requests: int = MAX_BATCH_REQUESTS,
+                 max_batch_bytes: int = MAX_BATCH_BYTES):
+        """
+        Args:
+            ai: Cliente de AIVision (su governor limita la concurrencia y la tasa del modo 'workers')
+            prompt: Prompt del análisis (por defecto el de analyze_screen())
+            output_path: Archivo JSONL de resultados (se añade al final; una línea por imagen)
+            workers: Hilos del modo 'workers'
+            poll_interval: Segundos entre consultas del estado de los lotes
+            max_batch_requests: Peticiones máximas por lote
+            max_batch_bytes: Tamaño máximo aproximado de cada lote en bytes
+        """
+        self.ai = ai
+        self.prompt = prompt
+        self.output_path = output_path
+        self.checkpoint_path = f"{output_path}.checkpoint.json"
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.max_batch_requests = max_batch_requests
+        self.max_batch_bytes = max_batch_bytes
+
+        self._lock = threading.Lock()
+        self._done: Set[str] = set()
+        self._summary: Dict[str, Any] = {}
+
+    # ===== RESULTADOS Y PROGRESO =====
+
+    def _load_done(self) -> Set[str]:
+        """Imágenes ya analizadas con éxito según el archivo de resultados (las fallidas se repiten)."""
+        done = set()
+        if not os.path.exists(self.output_path):
+            return done
+        with open(self.output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir si el proceso se interrumpió
+                    continue
+                if record.get('status') == 'ok':
+                    done.add(record['path'])
+        return done
+
+    def _write_result(self, path: str, analysis: Optional[str] = None, error: Optional[str] = None,
+                      usage: Optional[Dict[str, int]] = None, model: Optional[str] = None,
+                      cost: Optional[float] = None):
+        """Añade el resultado de una imagen al JSONL y actualiza el resumen."""
+        record = {
+            'path': path,
+            'custom_id': custom_id_for(path),
+            'status': 'ok' if error is None else 'error',
+            'analysis': analysis,
+            'error': error,
+            'model': model,
+            'usage': usage,
+            'cost_usd': cost,
+            'finished_at': time.time(),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+
+        with self._lock:
+            if path in self._done:
+                return
+            with open(self.output_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            if error is None:
+                self._done.add(path)
+                self._summary['succeeded'] += 1
+            else:
+                self._summary['failed'] += 1
+            for key in ('input_tokens', 'output_tokens'):
+                self._summary[key] += (usage or {}).get(key, 0)
+            if cost is not None:
+                self._summary['cost_usd'] += cost
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        """Lotes enviados y aún no recogidos: {'batches': {id: {custom_id: ruta}}}."""
+        if not os.path.exists(self.checkpoint_path):
+            return {'batches': {}}
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError as e:
+            print(f"Error al leer el checkpoint, se ignora: {e}")
+            return {'batches': {}}
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        """Guarda el checkpoint (escritura atómica); lo borra si no quedan lotes pendientes."""
+        if not checkpoint['batches']:
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # ===== EJECUCIÓN =====
+
+    def run(self, source: str, mode: str = 'workers') -> Dict[str, Any]:
+        """
+        Analiza todas las capturas del origen que no tengan ya un resultado correcto.
+
+        Args:
+            source: Directorio o manifiesto (ver collect_images())
+            mode: 'workers' (peticiones normales en paralelo) o 'batch' (API de lotes)
+
+        Returns:
+            Resumen con imágenes, aciertos, fallos, tokens, coste y rendimiento
+        """
+        if mode not in ('workers', 'batch'):
+            raise ValueError(f"Modo desconocido: {mode}")
+
+        paths = collect_images(source)
+        self._done = self._load_done()
+        pending = [path for path in paths if path not in self._done]
+        self._summary = {
+            'mode': mode,
+            'total': len(paths),
+            'skipped': len(paths) - len(pending),
+            'succeeded': 0,
+            'failed': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cost_usd': 0.0,
+        }
+
+        start = time.perf_counter()
+        if mode == 'batch':
+            self._run_batches(pending)
+        else:
+            self._run_workers(pending)
+
+        seconds = time.perf_counter() - start
+        processed = self._summary['succeeded'] + self._summary['failed']
+        self._summary['cost_usd'] = round(self._summary['cost_usd'], 6)
+        self._summary['seconds'] = round(seconds, 2)
+        self._summary['images_per_minute'] = round(processed * 60 / seconds, 1) if seconds else 0.0
+        return dict(self._summary)
+
+    # ----- Grupo de hilos -----
+
+    def _run_workers(self, pending: List[str]):
+        """Analiza las imágenes con un grupo de hilos y una ventana acotada de tareas en curso."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = set()
+            for path in pending:
+                # No encolar más de dos tareas por hilo: el resto de la lista espera sin ocupar memoria
+                if len(in_flight) >= self.workers * 2:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight.add(pool.submit(self._analyze_one, path))
+            wait(in_flight)
+
+    def _analyze_one(self, path: str):
+        """Analiza una imagen con analyze_screen() y guarda el resultado."""
+        try:
+            with Image.open(path) as image:
+                image.load()
+                analysis = self.ai.analyze_screen(image, self.prompt)
+        except Exception as e:
+            self._write_result(path, error=f"{type(e).__name__}: {e}")
+            return
+
+        call = self.ai.last_metrics
+        usage = {'input_tokens': call.input_tokens, 'output_tokens': call.output_tokens} if call else None
+        self._write_result(path, analysis=analysis, usage=usage,
+                           model=call.model if call else None, cost=call.cost if call else None)
+
+    # ----- API de lotes -----
+
+    def _run_batches(self, pending: List[str]):
+        """Recoge los lotes pendientes de una ejecución anterior, envía el resto y espera los resultados."""
+        checkpoint = self._load_checkpoint()
+        submitted = {path for ids in checkpoint['batches'].values() for path in ids.values()}
+        to_submit = [path for path in pending if path not in submitted]
+
+        for requests, ids in self._chunks(to_submit):
+            batch = self.ai.governor.call(
+                'batch_create', lambda: self.ai.client.messages.batches.create(requests=requests))
+            checkpoint['batches'][batch.id] = ids
+            self._save_checkpoint(checkpoint)
+            print(f"Lote {batch.id} enviado ({len(ids)} imágenes)")
+
+        while checkpoint['batches']:
+            for batch_id in list(checkpoint['batches']):
+                batch = self.ai.governor.call(
+                    'batch_retrieve', lambda: self.ai.client.messages.batches.retrieve(batch_id))
+                if batch.processing_status != 'ended':
+                    continue
+                self._collect_batch(batch_id, checkpoint['batches'][batch_id])
+                del checkpoint['batches'][batch_id]
+                self._save_checkpoint(checkpoint)
+
+            if checkpoint['batches']:
+                time.sleep(self.poll_interval)
+
+    def _chunks(self, paths: List[str]) -> Iterator[Tuple[List[Dict[str, Any]], Dict[str, str]]]:
+        """Construye las peticiones de los lotes respetando los límites de número y tamaño."""
+        requests, ids, size = [], {}, 0
+        for path in paths:
+            try:
+                with Image.open(path) as image:
+                    image.load()
+                    params = self.ai.analysis_request(image, self.prompt)
+            except Exception as e:
+                self._write_result(path, error=f"{type(e).__name__}: {e}")
+                continue
+
+            item = {'custom_id': custom_id_for(path), 'params': params}
+            item_size = len(json.dumps(item))
+            if requests and (len(requests) >= self.max_batch_requests or size + item_size > self.max_batch_bytes):
+                yield requests, ids
+                requests, ids, size = [], {}, 0
+            requests.append(item)
+            ids[item['custom_id']] = path
+            size += item_size
+
+        if requests:
+            yield requests, ids
+
+    def _collect_batch(self, batch_id: str, ids: Dict[str, str]):
+        """Escribe los resultados de un lote terminado."""
+        missing = dict(ids)
+        for entry in self.ai.client.messages.batches.results(batch_id):
+            path = missing.pop(entry.custom_id, None)
+            if path is None:
+                continue
+            result = entry.result
+            if result.type != 'succeeded':
+                error = getattr(getattr(result, 'error', None), 'error', None)
+                self._write_result(path, error=getattr(error, 'message', None) or result.type)
+                continue
+
+            message = result.message
+            analysis = self.ai.analysis_from_message(message)
+            usage = self.ai.last_usage
+            cost = estimate_cost(message.model, usage['input_tokens'], usage['output_tokens'],
+                                 usage['cache_creation_input_tokens'], usage['cache_read_input_tokens'])
+            self._write_result(path, analysis=analysis, model=message.model,
+                               usage={'input_tokens': usage['input_tokens'], 'output_tokens': usage['output_tokens']},
+                               cost=cost * BATCH_DISCOUNT if cost is not None else None)
+
+        for path in missing.values():
+            self._write_result(path, error=f"Sin resultado en el lote {batch_id}")
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Análisis masivo de capturas guardadas")
+    parser.add_argument('source', help="Directorio de capturas o manifiesto (.txt o .jsonl)")
+    parser.add_argument('--prompt', default=None, help="Prompt del análisis (por defecto el de analyze_screen)")
+    parser.add_argument('--output', default='batch_results.jsonl', help="Archivo JSONL de resultados")
+    parser.add_argument('--mode', choices=('workers', 'batch'), default='workers',
+                        help="'workers': peticiones en paralelo; 'batch': API de lotes (50%% más barata)")
+    parser.add_argument('--workers', type=int, default=4, help="Hilos del modo workers")
+    parser.add_argument('--rpm', type=float, default=50, help="Peticiones por minuto del modo workers")
+    parser.add_argument('--poll-interval', type=float, default=30.0, help="Segundos entre consultas de los lotes")
+    parser.add_argument('--base-url', default=None, help="URL de la API (p. ej. fake_anthropic_server.py)")
+    args = parser.parse_args()
+
+    # Un trabajo masivo prefiere esperar turno a fallar: cola larga
+    governor = RequestGovernor(max_concurrency=args.workers, requests_per_minute=args.rpm,
+                               queue_timeout=600.0)
+    ai = AIVision(base_url=args.base_url, governor=governor)
+    analyzer = BatchAnalyzer(ai, prompt=args.prompt, output_path=args.output,
+                             workers=args.workers, poll_interval=args.poll_interval)
+
+    summary = analyzer.run(args.source, mode=args.mode)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
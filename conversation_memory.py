@@ -0,0 +1,167 @@
+"""
+Módulo de memoria de conversación acotada para el chat con contexto de pantalla.
+Conserva solo las últimas capturas y un presupuesto de bytes, de modo que una sesión
+larga mantiene un tamaño de petición y un uso de memoria acotados.
+"""
+
+import copy
+import threading
+from typing import Any, Dict, List, Union
+
+
+IMAGE_PLACEHOLDER = "[Captura de pantalla anterior omitida]"
+
+# Al superar max_messages o max_bytes se recorta hasta esta fracción del límite
+COMPACT_TO = 0.75
+
+
+class ConversationMemory:
+    """
+    Historial de conversación con límite de capturas, turnos y bytes.
+
+    El historial se compacta por bloques y no en cada turno: las capturas antiguas se
+    sustituyen de image_block en image_block, y al superar el límite de mensajes o
+    bytes se descartan turnos hasta quedar en COMPACT_TO del límite. Así el historial
+    enviado no cambia entre compactaciones y la caché de prompts de la API (que exige
+    un prefijo idéntico byte a byte) acierta en la mayoría de turnos. A cambio se
+    conservan temporalmente hasta max_images + image_block - 1 capturas.
+    """
+
+    def __init__(self, max_images: int = 2, max_bytes: int = 4_000_000,
+                 max_messages: int = 40, image_placeholder: str = IMAGE_PLACEHOLDER,
+                 image_block: int = 4):
+        """
+        Args:
+            max_images: Número de capturas más recientes que se conservan completas
+            max_bytes: Tamaño máximo aproximado del historial (texto + imágenes en base64)
+            max_messages: Número máximo de mensajes conservados
+            image_placeholder: Texto que sustituye a las capturas antiguas
+            image_block: Capturas que se sustituyen de una vez (1 para hacerlo en cada turno,
+                         sin aprovechar la caché de prompts)
+        """
+        if image_block < 1:
+            raise ValueError("image_block debe ser al menos 1")
+        self.max_images = max_images
+        self.image_block = image_block
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.image_placeholder = image_placeholder
+
+        self._messages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _block_size(block: Union[Dict[str, Any], str]) -> int:
+        """Tamaño aproximado en bytes de un bloque de contenido."""
+        if isinstance(block, str):
+            return len(block.encode('utf-8'))
+        if block.get('type') == 'image':
+            return len(block.get('source', {}).get('data', ''))
+        return len(str(block.get('text', '')).encode('utf-8'))
+
+    def _message_size(self, message: Dict[str, Any]) -> int:
+        """Tamaño aproximado en bytes de un mensaje."""
+        content = message.get('content')
+        if isinstance(content, str):
+            return self._block_size(content)
+        return sum(self._block_size(block) for block in content or [])
+
+    @property
+    def size_bytes(self) -> int:
+        """Tamaño aproximado del historial en bytes."""
+        with self._lock:
+            return sum(self._message_size(m) for m in self._messages)
+
+    @property
+    def image_count(self) -> int:
+        """Número de capturas completas en el historial."""
+        with self._lock:
+            return self._count_images()
+
+    def _count_images(self) -> int:
+        count = 0
+        for message in self._messages:
+            if isinstance(message.get('content'), list):
+                count += sum(1 for b in message['content'] if b.get('type') == 'image')
+        return count
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def add_message(self, role: str, content: Union[str, List[Dict[str, Any]]]):
+        """
+        Agrega un mensaje al historial y lo compacta si supera los límites.
+
+        Args:
+            role: 'user' o 'assistant'
+            content: Texto o lista de bloques de contenido (se copia)
+        """
+        with self._lock:
+            self._messages.append({'role': role, 'content': copy.deepcopy(content)})
+            self._compact()
+
+    def add_user(self, content: Union[str, List[Dict[str, Any]]]):
+        """Agrega un mensaje del usuario."""
+        self.add_message('user', content)
+
+    def add_assistant(self, text: str):
+        """Agrega una respuesta del asistente."""
+        self.add_message('assistant', text)
+
+    def _compact(self):
+        """Aplica los límites de capturas, mensajes y bytes por bloques (requiere el lock)."""
+        # 1. Sustituir las capturas antiguas por un texto breve, image_block a la vez
+        images = self._count_images()
+        if images >= self.max_images + self.image_block:
+            to_replace = images - self.max_images
+            for message in self._messages:
+                content = message.get('content')
+                if not isinstance(content, list):
+                    continue
+                for idx, block in enumerate(content):
+                    if to_replace and block.get('type') == 'image':
+                        content[idx] = {"type": "text", "text": self.image_placeholder}
+                        to_replace -= 1
+
+        # 2. Descartar los turnos más antiguos si se supera el número de mensajes o bytes,
+        #    hasta quedar holgadamente por debajo para no volver a recortar en cada turno
+        def over(max_messages: float, max_bytes: float) -> bool:
+            return len(self._messages) > 1 and (
+                len(self._messages) > max_messages
+                or sum(self._message_size(m) for m in self._messages) > max_bytes
+            )
+
+        if over(self.max_messages, self.max_bytes):
+            while over(self.max_messages * COMPACT_TO, self.max_bytes * COMPACT_TO):
+                self._messages.pop(0)
+
+        # La API exige que el primer mensaje sea del usuario
+        while self._messages and self._messages[0].get('role') != 'user':
+            self._messages.pop(0)
+
+    def to_messages(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene una copia del historial lista para enviar a la API.
+
+        Returns:
+            Lista de mensajes (modificarla no afecta a la memoria)
+        """
+        with self._lock:
+            return copy.deepcopy(self._messages)
+
+    def clear(self):
+        """Vacía el historial."""
+        with self._lock:
+            self._messages.clear()
+
+
+# Función de prueba
+if __name__ == "__main__":
+    memory = ConversationMemory(max_images=1)
+    fake_image = {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": "A" * 1000}}
+
+    for turn in range(5):
+        memory.add_user([fake_image, {"type": "text", "text": f"Pregunta {turn}"}])
+        memory.add_assistant(f"Respuesta {turn}")
+
+    print(f"Mensajes: {len(memory)}, capturas completas: {memory.image_count}, bytes: {memory.size_bytes}")
@@ -0,0 +1,291 @@
+"""
+Módulo de memoria persistente de posiciones de elementos por ventana.
+Recuerda dónde estaba cada elemento buscado dentro de una ventana con una disposición
+concreta, y antes de reutilizar la posición la valida localmente comparando una pequeña
+plantilla alrededor del punto guardado, sin llamar a la IA.
+"""
+
+from PIL import Image
+import numpy as np
+import base64
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from frame import memoized, unwrap
+from response_cache import fingerprint_distance, image_fingerprint
+
+
+class ElementMemory:
+    """Caché persistente descripción -> posición relativa a la ventana, validada por plantilla."""
+
+    def __init__(self, path: Optional[str] = 'element_memory.json', template_radius: int = 16,
+                 max_template_diff: float = 12.0, layout_tolerance: float = 0.1,
+                 layout_hash_width: int = 16, max_layouts: int = 200):
+        """
+        Args:
+            path: Archivo JSON donde se guarda la memoria (None para no persistirla)
+            template_radius: Radio en píxeles de la plantilla guardada alrededor de cada punto
+            max_template_diff: Diferencia media máxima de intensidad (0-255) entre la plantilla
+                               guardada y la pantalla actual para aceptar la posición
+            layout_tolerance: Fracción máxima de celdas de la huella de la ventana que pueden
+                              diferir para considerar que la disposición es la misma
+            layout_hash_width: Ancho en celdas de la huella de la disposición de la ventana
+            max_layouts: Número máximo de disposiciones guardadas (se descartan las menos usadas)
+        """
+        self.path = path
+        self.template_radius = template_radius
+        self.max_template_diff = max_template_diff
+        self.layout_tolerance = layout_tolerance
+        self.layout_hash_width = layout_hash_width
+        self.max_layouts = max_layouts
+
+        self._layouts: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # Serializa las escrituras del archivo: con varias peticiones a la vez, cada save()
+        # escribe su copia completa y la siguiente no empieza hasta que la anterior termina
+        self._save_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    # ===== CLAVES Y PLANTILLAS =====
+
+    @staticmethod
+    def _window_key(window: Dict[str, Any]) -> List[Any]:
+        """Identidad de la ventana: título, clase y tamaño (la posición puede cambiar)."""
+        return [window.get('title', ''), window.get('class_name', ''),
+                int(window.get('width', 0)), int(window.get('height', 0))]
+
+    @staticmethod
+    def _window_box(image: Image.Image, window: Dict[str, Any]) -> Tuple[int, int, int, int]:
+        """Región de la ventana dentro de la captura, limitada a sus bordes."""
+        left, top = int(window.get('left', 0)), int(window.get('top', 0))
+        right = left + int(window.get('width', image.width))
+        bottom = top + int(window.get('height', image.height))
+        return max(0, left), max(0, top), min(image.width, right), min(image.height, bottom)
+
+    @staticmethod
+    def _normalize(description: str) -> str:
+        """Normaliza la descripción para que variaciones de mayúsculas o espacios coincidan."""
+        return " ".join(description.lower().split())
+
+    def _layout_fingerprint(self, image: Image.Image, box: Tuple[int, int, int, int]) -> bytes:
+        """Huella de la disposición de la ventana (memorizada si la captura es un Frame)."""
+        return memoized(image, ('layout_fingerprint', box, self.layout_hash_width),
+                        lambda: image_fingerprint(unwrap(image).crop(box), self.layout_hash_width))
+
+    def _template(self, image: Image.Image, x: int, y: int) -> Optional[np.ndarray]:
+        """Parche en escala de grises alrededor de un punto (None si no cabe en la captura)."""
+        r = self.template_radius
+        box = (x - r, y - r, x + r + 1, y + r + 1)
+        if box[0] < 0 or box[1] < 0 or box[2] > image.width or box[3] > image.height:
+            return None
+        return np.asarray(unwrap(image).crop(box).convert('L'), dtype=np.int16)
+
+    @staticmethod
+    def _encode_template(template: np.ndarray) -> str:
+        return base64.b64encode(template.astype(np.uint8).tobytes()).decode()
+
+    def _decode_template(self, data: str) -> np.ndarray:
+        size = 2 * self.template_radius + 1
+        raw = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+        return raw.reshape(size, size).astype(np.int16)
+
+    def _find_layout(self, key: List[Any], fingerprint: bytes) -> Optional[Dict[str, Any]]:
+        """Busca la disposición guardada de la ventana (requiere el lock)."""
+        best, best_distance = None, None
+        for layout in self._layouts:
+            if layout['window'] != key:
+                continue
+            distance = fingerprint_distance(bytes.fromhex(layout['fingerprint']), fingerprint)
+            if distance <= self.layout_tolerance and (best is None or distance < best_distance):
+                best, best_distance = layout, distance
+        return best
+
+    # ===== CONSULTA Y REGISTRO =====
+
+    def lookup(self, image: Image.Image, window: Dict[str, Any], description: str) -> Optional[Dict[str, int]]:
+        """
+        Busca la posición recordada de un elemento y la valida con su plantilla.
+
+        Args:
+            image: Captura de pantalla completa (imagen PIL o Frame)
+            window: Información de la ventana (title, left, top, width, height y opcionalmente class_name)
+            description: Descripción del elemento
+
+        Returns:
+            Coordenadas {'x': int, 'y': int} en la captura o None si no hay una posición válida
+        """
+        box = self._window_box(image, window)
+        fingerprint = self._layout_fingerprint(image, box)
+        name = self._normalize(description)
+
+        with self._lock:
+            layout = self._find_layout(self._window_key(window), fingerprint)
+            element = layout['elements'].get(name) if layout else None
+            if element is None:
+                self.misses += 1
+                return None
+            x, y = box[0] + element['x'], box[1] + element['y']
+            stored = self._decode_template(element['template'])
+
+        current = self._template(image, x, y)
+        if current is None or float(np.abs(current - stored).mean()) > self.max_template_diff:
+            # El elemento ya no está donde se recordaba: descartar la posición
+            with self._lock:
+                self.rejected += 1
+                self.misses += 1
+                layout['elements'].pop(name, None)
+            self.save()
+            return None
+
+        with self._lock:
+            self.hits += 1
+            element['hits'] = element.get('hits', 0) + 1
+            layout['used_at'] = time.time()
+        return {'x': x, 'y': y}
+
+    def remember(self, image: Image.Image, window: Dict[str, Any], description: str, x: int, y: int):
+        """
+        Guarda la posición de un elemento encontrado en la ventana.
+
+        Args:
+            image: Captura en la que se encontró el elemento (imagen PIL o Frame)
+            window: Información de la ventana
+            description: Descripción del elemento
+            x: Coordenada X en la captura
+            y: Coordenada Y en la captura
+        """
+        box = self._window_box(image, window)
+        if not (box[0] <= x < box[2] and box[1] <= y < box[3]):
+            return
+        template = self._template(image, x, y)
+        if template is None:
+            return
+
+        fingerprint = self._layout_fingerprint(image, box)
+        key = self._window_key(window)
+        now = time.time()
+
+        with self._lock:
+            layout = self._find_layout(key, fingerprint)
+            if layout is None:
+                layout = {'window': key, 'fingerprint': fingerprint.hex(), 'elements': {}}
+                self._layouts.append(layout)
+            layout['used_at'] = now
+            layout['elements'][self._normalize(description)] = {
+                'x': x - box[0],
+                'y': y - box[1],
+                'template': self._encode_template(template),
+                'hits': 0,
+                'updated_at': now,
+            }
+
+            if len(self._layouts) > self.max_layouts:
+                self._layouts.sort(key=lambda item: item.get('used_at', 0), reverse=True)
+                del self._layouts[self.max_layouts:]
+
+        self.save()
+
+    # ===== PERSISTENCIA =====
+
+    def load(self):
+        """Carga la memoria desde el archivo (un archivo dañado se ignora)."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            layouts = data.get('layouts', [])
+        except Exception as e:
+            print(f"Error al cargar la memoria de elementos: {e}")
+            return
+
+        with self._lock:
+            self._layouts = [layout for layout in layouts
+                             if data.get('template_radius') == self.template_radius]
+
+    def save(self):
+        """
+        Guarda la memoria en el archivo (escritura atómica).
+
+        Las llamadas simultáneas se serializan y cada una toma la copia de la memoria
+        justo antes de escribir, así que el archivo nunca se mezcla ni retrocede a una
+        copia más antigua. La búsqueda y el registro de posiciones no esperan a la escritura.
+        """
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps({
+                    'version': 1,
+                    'template_radius': self.template_radius,
+                    'layouts': self._layouts,
+                })
+
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Error al guardar la memoria de elementos: {e}")
+
+    def clear(self):
+        """Olvida todas las posiciones (y las borra del archivo)."""
+        with self._lock:
+            self._layouts.clear()
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Obtiene los contadores de la memoria.
+
+        Returns:
+            Diccionario con aciertos, fallos, posiciones rechazadas, disposiciones y elementos
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rejected': self.rejected,
+                'hit_rate': self.hits / total if total else 0.0,
+                'layouts': len(self._layouts),
+                'elements': sum(len(layout['elements']) for layout in self._layouts),
+            }
+
+
+# Función de prueba
+if __name__ == "__main__":
+    from PIL import ImageDraw
+    import tempfile
+
+    screen = Image.new('RGB', (1920, 1080), color='white')
+    draw = ImageDraw.Draw(screen)
+    draw.rectangle((200, 100, 1200, 800), fill='lightgray')
+    draw.rectangle((1000, 700, 1100, 740), fill='navy')
+    draw.text((1020, 712), "Guardar", fill='white')
+
+    window = {'title': 'Editor - documento.txt', 'left': 200, 'top': 100, 'width': 1000, 'height': 700}
+    path = os.path.join(tempfile.gettempdir(), 'element_memory_test.json')
+
+    memory = ElementMemory(path=path)
+    memory.clear()
+    memory.remember(screen, window, "Botón Guardar", 1050, 720)
+
+    # Nueva instancia: la memoria se recupera del disco
+    memory = ElementMemory(path=path)
+    start = time.perf_counter()
+    location = memory.lookup(screen, window, "botón guardar")
+    print(f"Posición recordada: {location} en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # El botón desaparece: la plantilla ya no coincide
+    draw.rectangle((1000, 700, 1100, 740), fill='lightgray')
+    print(f"Tras cambiar la ventana: {memory.lookup(screen, window, 'botón guardar')}")
+    print(f"Estadísticas: {memory.stats()}")
@@ -0,0 +1,577 @@
+"""
+Servidor local que imita la API de mensajes de Anthropic.
+Permite probar y medir todo el flujo (captura, codificación, parseo, ejecución) sin
+conexión y sin coste: responde con datos de ejemplo o de un fichero de fixtures, con
+latencia, consumo de tokens, errores y streaming configurables.
+
+También implementa la API de lotes (/v1/messages/batches) para probar batch_analyze.py.
+
+Uso:
+    python fake_anthropic_server.py --port 8765 --latency 0.8 --error-rate 0.05
+    AIVision(api_key='fake', base_url='http://127.0.0.1:8765')
+"""
+
+from PIL import Image
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Errores que puede inyectar el servidor: estado HTTP -> tipo de error de la API
+ERROR_TYPES = {
+    429: 'rate_limit_error',
+    500: 'api_error',
+    529: 'overloaded_error',
+}
+
+DEFAULT_TEXT = (
+    "La pantalla muestra una ventana de aplicación con una barra de menú en la parte superior, "
+    "un área de contenido principal y una barra de estado inferior. No se observan errores."
+)
+
+
+class FakeServerConfig:
+    """Configuración del comportamiento del servidor simulado."""
+
+    def __init__(self, latency: float = 0.0, tokens_per_second: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 529, retry_after: Optional[float] = 1.0,
+                 fixtures: Optional[Dict[str, Any]] = None, seed: Optional[int] = None,
+                 chunk_size: int = 12, batch_duration: float = 0.0):
+        """
+        Args:
+            latency: Tiempo hasta el primer token en segundos
+            tokens_per_second: Velocidad de generación simulada (0 para instantánea)
+            error_rate: Probabilidad de devolver un error en cada petición (0-1)
+            error_status: Código HTTP de los errores inyectados (429, 500 o 529)
+            retry_after: Valor de la cabecera retry-after en los errores (None para omitirla)
+            fixtures: Respuestas fijas por herramienta ("report_action_plan", ...) o "text"
+            seed: Semilla para que los errores inyectados sean reproducibles
+            chunk_size: Caracteres por evento de streaming
+            batch_duration: Segundos que tarda un lote en terminar de procesarse
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.fixtures = fixtures or {}
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.batch_duration = batch_duration
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación aproximada de tokens de un texto (≈ 4 caracteres por token)."""
+    return max(1, len(text) // 4)
+
+
+def _image_size(block: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """Tamaño de la imagen de un bloque base64 (None si no se puede leer)."""
+    try:
+        data = base64.b64decode(block['source']['data'])
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+class FakeMessagesBackend:
+    """Genera las respuestas de /v1/messages a partir del cuerpo de la petición."""
+
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    # ===== LECTURA DE LA PETICIÓN =====
+
+    @staticmethod
+    def _blocks(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Todos los bloques de contenido de los mensajes (el texto plano se convierte en bloque)."""
+        blocks = []
+        for message in body.get('messages', []):
+            content = message.get('content')
+            if isinstance(content, str):
+                blocks.append({'type': 'text', 'text': content})
+            else:
+                blocks.extend(content or [])
+        return blocks
+
+    def _last_image_size(self, body: Dict[str, Any]) -> Tuple[int, int]:
+        for block in reversed(self._blocks(body)):
+            if block.get('type') == 'image':
+                size = _image_size(block)
+                if size:
+                    return size
+        return 1280, 720
+
+    def _last_text(self, body: Dict[str, Any]) -> str:
+        for block in reversed(self._blocks(body)):
+            if block.get('type') == 'text':
+                return block.get('text', '')
+        return ''
+
+    def _usage(self, body: Dict[str, Any], output_text: str) -> Dict[str, int]:
+        """Calcula un consumo de tokens verosímil, simulando la caché de prompts."""
+        input_tokens = 0
+        for block in self._blocks(body):
+            if block.get('type') == 'image':
+                width, height = _image_size(block) or (1280, 720)
+                input_tokens += width * height // 750
+            elif block.get('type') == 'text':
+                input_tokens += estimate_tokens(block.get('text', ''))
+
+        system = body.get('system') or []
+        if isinstance(system, str):
+            system = [{'type': 'text', 'text': system}]
+        tools_text = json.dumps(body.get('tools', []))
+        prefix_tokens = estimate_tokens(tools_text) + sum(estimate_tokens(b.get('text', '')) for b in system)
+
+        cache_creation = cache_read = 0
+        if any('cache_control' in b for b in system):
+            prefix_key = hashlib.sha256((tools_text + json.dumps(system)).encode()).hexdigest()
+            with self._lock:
+                if prefix_key in self._seen_prefixes:
+                    cache_read = prefix_tokens
+                else:
+                    self._seen_prefixes.add(prefix_key)
+                    cache_creation = prefix_tokens
+        else:
+            input_tokens += prefix_tokens
+
+        return {
+            'input_tokens': input_tokens,
+            'output_tokens': estimate_tokens(output_text),
+            'cache_creation_input_tokens': cache_creation,
+            'cache_read_input_tokens': cache_read,
+        }
+
+    # ===== RESPUESTAS DE EJEMPLO =====
+
+    def _tool_input(self, tool_name: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Argumentos de ejemplo (o de fixtures) para la herramienta forzada."""
+        if tool_name in self.config.fixtures:
+            return self.config.fixtures[tool_name]
+
+        width, height = self._last_image_size(body)
+        text = self._last_text(body)
+        # Coordenadas deterministas para una misma petición
+        rng = random.Random(hashlib.sha256(text.encode()).hexdigest())
+
+        def point():
+            return rng.randint(width // 10, width * 9 // 10), rng.randint(height // 10, height * 9 // 10)
+
+        if tool_name == 'report_action_plan':
+            quoted = re.findall(r"['\"“]([^'\"”]+)['\"”]", text)
+            to_type = quoted[-1] if quoted else 'Hola Mundo'
+            x, y = point()
+            return {
+                'analysis': 'Se ve una aplicación abierta con un campo de texto en el centro.',
+                'strategy': 'Enfocar el campo de texto, escribir el contenido y confirmar.',
+                'actions': [
+                    {'type': 'click', 'x': x, 'y': y, 'description': 'Clic en el campo de texto'},
+                    {'type': 'wait', 'seconds': 0.5, 'description': 'Esperar a que el campo tenga el foco'},
+                    {'type': 'type', 'text': to_type, 'description': f'Escribir "{to_type}"'},
+                    {'type': 'press', 'key': 'enter', 'description': 'Confirmar con Enter'},
+                ],
+                'warnings': [],
+                'success_criteria': f'El texto "{to_type}" aparece en la aplicación.',
+            }
+
+        if tool_name == 'report_element_location':
+            x, y = point()
+            return {'found': True, 'x': x, 'y': y, 'confidence': 'high'}
+
+        if tool_name == 'report_element_region':
+            x, y = point()
+            half_w, half_h = max(1, width // 50), max(1, height // 50)
+            return {'found': True, 'left': x - half_w, 'top': y - half_h,
+                    'right': x + half_w, 'bottom': y + half_h}
+
+        if tool_name == 'report_elements_locations':
+            count = len(re.findall(r'^\s*\d+\.\s', text, flags=re.M)) or 1
+            elements = []
+            for idx in range(count):
+                x, y = point()
+                elements.append({'index': idx, 'found': True, 'x': x, 'y': y, 'confidence': 'high'})
+            return {'elements': elements}
+
+        if tool_name == 'report_verification':
+            return {
+                'success': True,
+                'changes_detected': ['El contenido de la ventana cambió tras la acción'],
+                'explanation': 'La captura posterior muestra el resultado esperado.',
+                'confidence': 'medium',
+            }
+
+        return {}
+
+    def build_message(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Construye el mensaje de respuesta completo para una petición.
+
+        Args:
+            body: Cuerpo JSON de la petición a /v1/messages
+
+        Returns:
+            Mensaje con el formato de la API
+        """
+        with self._lock:
+            self.request_count += 1
+
+        tool_choice = body.get('tool_choice') or {}
+        if tool_choice.get('type') == 'tool':
+            tool_input = self._tool_input(tool_choice['name'], body)
+            content = [{
+                'type': 'tool_use',
+                'id': f"toolu_fake_{uuid.uuid4().hex[:16]}",
+                'name': tool_choice['name'],
+                'input': tool_input,
+            }]
+            output_text = json.dumps(tool_input)
+            stop_reason = 'tool_use'
+        else:
+            output_text = self.config.fixtures.get('text', DEFAULT_TEXT)
+            content = [{'type': 'text', 'text': output_text}]
+            stop_reason = 'end_turn'
+
+        return {
+            'id': f"msg_fake_{uuid.uuid4().hex[:16]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'fake-model'),
+            'content': content,
+            'stop_reason': stop_reason,
+            'stop_sequence': None,
+            'usage': self._usage(body, output_text),
+        }
+
+    def should_fail(self) -> bool:
+        """Decide si la petición actual debe devolver un error inyectado."""
+        with self._lock:
+            return self.config.random.random() < self.config.error_rate
+
+    # ===== LOTES =====
+
+    def create_batch(self, body: Dict[str, Any]) -> str:
+        """
+        Registra un lote; las respuestas se generan al consultarlo una vez terminado.
+
+        Args:
+            body: Cuerpo de POST /v1/messages/batches ({"requests": [{"custom_id", "params"}]})
+
+        Returns:
+            Id del lote
+        """
+        batch_id = f"msgbatch_fake_{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._batches[batch_id] = {
+                'created_at': datetime.now(timezone.utc),
+                'requests': body.get('requests', []),
+                'results': None,
+            }
+        return batch_id
+
+    def batch_results(self, batch_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Resultados del lote (None si aún se está procesando o no existe)."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is None:
+            return None
+        elapsed = (datetime.now(timezone.utc) - batch['created_at']).total_seconds()
+        if elapsed < self.config.batch_duration:
+            return None
+
+        if batch['results'] is None:
+            results = []
+            for item in batch['requests']:
+                if self.should_fail():
+                    result = {'type': 'errored', 'error': {
+                        'type': 'error',
+                        'error': {'type': 'api_error', 'message': 'Error inyectado por el servidor simulado'},
+                    }}
+                else:
+                    result = {'type': 'succeeded', 'message': self.build_message(item.get('params', {}))}
+                results.append({'custom_id': item.get('custom_id'), 'result': result})
+            batch['results'] = results
+        return batch['results']
+
+    def batch_object(self, batch_id: str, base_url: str) -> Optional[Dict[str, Any]]:
+        """Estado del lote con el formato de la API."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is None:
+            return None
+
+        results = self.batch_results(batch_id)
+        ended = results is not None
+        succeeded = sum(1 for r in results or [] if r['result']['type'] == 'succeeded')
+        created_at = batch['created_at']
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else len(batch['requests']),
+                'succeeded': succeeded,
+                'errored': len(results) - succeeded if ended else 0,
+                'canceled': 0,
+                'expired': 0,
+            },
+            'created_at': created_at.isoformat(),
+            'expires_at': (created_at + timedelta(days=1)).isoformat(),
+            'ended_at': datetime.now(timezone.utc).isoformat() if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Manejador HTTP de /v1/messages (con y sin streaming)."""
+
+    protocol_version = 'HTTP/1.1'
+    backend: FakeMessagesBackend = None
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self):
+        config = self.backend.config
+        headers = {}
+        if config.retry_after is not None:
+            headers['retry-after'] = str(config.retry_after)
+        self._send_json(config.error_status, {
+            'type': 'error',
+            'error': {
+                'type': ERROR_TYPES.get(config.error_status, 'api_error'),
+                'message': 'Error inyectado por el servidor simulado',
+            },
+        }, headers)
+
+    def _sse(self, event: str, data: Dict[str, Any]):
+        chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def _not_found(self):
+        self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def do_GET(self):
+        # /v1/messages/batches/<id> y /v1/messages/batches/<id>/results
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) < 4 or parts[:3] != ['v1', 'messages', 'batches']:
+            self._not_found()
+            return
+
+        batch_id = parts[3]
+        if len(parts) == 4:
+            batch = self.backend.batch_object(batch_id, f"http://{self.headers.get('Host')}")
+            if batch is None:
+                self._not_found()
+            else:
+                self._send_json(200, batch)
+            return
+
+        results = self.backend.batch_results(batch_id)
+        if parts[4:] != ['results'] or results is None:
+            self._not_found()
+            return
+        data = "".join(json.dumps(result) + "\n" for result in results).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-jsonl')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        if path not in ('/v1/messages', '/v1/messages/batches'):
+            self._not_found()
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'type': 'error', 'error': {'type': 'invalid_request_error',
+                                                             'message': 'JSON inválido'}})
+            return
+
+        if path == '/v1/messages/batches':
+            batch_id = self.backend.create_batch(body)
+            self._send_json(200, self.backend.batch_object(batch_id, f"http://{self.headers.get('Host')}"))
+            return
+
+        config = self.backend.config
+        if self.backend.should_fail():
+            time.sleep(config.latency / 4)
+            self._send_error()
+            return
+
+        message = self.backend.build_message(body)
+        output_tokens = message['usage']['output_tokens']
+        generation_time = output_tokens / config.tokens_per_second if config.tokens_per_second else 0.0
+
+        time.sleep(config.latency)
+        if body.get('stream'):
+            self._stream(message, generation_time)
+        else:
+            time.sleep(generation_time)
+            self._send_json(200, message)
+
+    def _stream(self, message: Dict[str, Any], generation_time: float):
+        """Envía el mensaje como eventos Server-Sent Events, en fragmentos."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        usage = message['usage']
+        self._sse('message_start', {
+            'type': 'message_start',
+            'message': {**message, 'content': [], 'stop_reason': None,
+                        'usage': {**usage, 'output_tokens': 1}},
+        })
+
+        size = self.backend.config.chunk_size
+        for index, block in enumerate(message['content']):
+            if block['type'] == 'tool_use':
+                start_block = {**block, 'input': {}}
+                text = json.dumps(block['input'])
+                delta_type, delta_key = 'input_json_delta', 'partial_json'
+            else:
+                start_block = {'type': 'text', 'text': ''}
+                text = block['text']
+                delta_type, delta_key = 'text_delta', 'text'
+
+            self._sse('content_block_start', {'type': 'content_block_start', 'index': index,
+                                              'content_block': start_block})
+            chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+            for chunk in chunks:
+                time.sleep(generation_time / len(chunks))
+                self._sse('content_block_delta', {'type': 'content_block_delta', 'index': index,
+                                                  'delta': {'type': delta_type, delta_key: chunk}})
+            self._sse('content_block_stop', {'type': 'content_block_stop', 'index': index})
+
+        self._sse('message_delta', {
+            'type': 'message_delta',
+            'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+            'usage': {'output_tokens': usage['output_tokens']},
+        })
+        self._sse('message_stop', {'type': 'message_stop'})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeAnthropicServer:
+    """Servidor simulado que se puede arrancar en segundo plano desde pruebas y benchmarks."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 config: Optional[FakeServerConfig] = None, verbose: bool = False):
+        """
+        Args:
+            host: Dirección en la que escuchar
+            port: Puerto (0 para elegir uno libre)
+            config: Configuración de latencia, errores y fixtures
+            verbose: Registrar cada petición en consola
+        """
+        self.config = config or FakeServerConfig()
+        self.backend = FakeMessagesBackend(self.config)
+        handler = type('Handler', (FakeAnthropicHandler,), {'backend': self.backend, 'verbose': verbose})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """URL base para AIVision(base_url=...)."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeAnthropicServer':
+        """Arranca el servidor en un hilo en segundo plano."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Detiene el servidor."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de mensajes de Anthropic")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="Segundos hasta el primer token")
+    parser.add_argument('--tokens-per-second', type=float, default=80.0, help="Velocidad de generación (0 = instantánea)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Probabilidad de error por petición (0-1)")
+    parser.add_argument('--error-status', type=int, default=529, choices=sorted(ERROR_TYPES))
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--fixtures', help="Fichero JSON con respuestas por herramienta o 'text'")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-duration', type=float, default=5.0, help="Segundos que tarda cada lote")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fixtures = None
+    if args.fixtures:
+        with open(args.fixtures, 'r', encoding='utf-8') as f:
+            fixtures = json.load(f)
+
+    config = FakeServerConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        fixtures=fixtures,
+        seed=args.seed,
+        batch_duration=args.batch_duration,
+    )
+    server = FakeAnthropicServer(args.host, args.port, config, verbose=args.verbose)
+
+    print(f"Servidor simulado de Anthropic escuchando en {server.base_url}")
+    print(f"Usa AIVision(base_url='{server.base_url}') o ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServidor detenido")
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Módulo de fotogramas de pantalla con codificaciones memorizadas.
+Un Frame envuelve una captura y guarda cada codificación (para la API, para el
+navegador, huella de caché...) la primera vez que se calcula, de modo que una
+misma captura se comprime y se pasa a base64 una sola vez aunque la usen varios
+consumidores. Puede envolver directamente el búfer BGRA de mss sin copiarlo: la
+imagen RGB y la escala de grises solo se generan si alguien las pide. Con varios
+monitores, el Frame guarda su posición en el escritorio virtual (origin).
+"""
+
+from PIL import Image
+import numpy as np
+import base64
+import io
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from image_encoder import EncodedImage, ImageEncoder
+
+
+class Frame:
+    """
+    Captura de pantalla con caché de codificaciones.
+
+    Delega en la imagen PIL los atributos y métodos de solo lectura (size, width,
+    crop, convert...), así que puede pasarse a AIVision en lugar de la imagen.
+    La imagen no debe modificarse después de crear el Frame (o llamar a invalidate()).
+    """
+
+    def __init__(self, image: Optional[Image.Image] = None, timestamp: Optional[float] = None,
+                 bgra: Optional[np.ndarray] = None, origin: Tuple[int, int] = (0, 0),
+                 monitor: Optional[int] = None):
+        """
+        Args:
+            image: Imagen PIL de la captura
+            timestamp: Momento de la captura (time.time()); por defecto, ahora
+            bgra: Píxeles BGRA de la captura (alto x ancho x 4, uint8) si no se pasa la imagen
+            origin: Posición (x, y) del píxel superior izquierdo en el escritorio virtual
+            monitor: Monitor capturado (índice de mss; 0 para el escritorio completo)
+        """
+        if image is None and bgra is None:
+            raise ValueError("Se requiere la imagen o el búfer BGRA de la captura")
+        self._image = image
+        self._bgra = bgra
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.monitor = monitor
+        self._memo: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_bgra(cls, buffer: Any, size: Tuple[int, int], timestamp: Optional[float] = None,
+                  origin: Tuple[int, int] = (0, 0), monitor: Optional[int] = None) -> 'Frame':
+        """
+        Crea un Frame sobre un búfer BGRA sin copiarlo (p. ej. ScreenShot.raw de mss).
+
+        Args:
+            buffer: Objeto con protocolo de búfer y 4 bytes por píxel, fila a fila
+            size: Tamaño (width, height) de la captura
+            timestamp: Momento de la captura
+            origin: Posición (x, y) de la captura en el escritorio virtual
+            monitor: Monitor capturado
+
+        Returns:
+            Frame cuya matriz bgra es una vista del búfer
+        """
+        width, height = size
+        return cls(bgra=np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 4), timestamp=timestamp,
+                   origin=origin, monitor=monitor)
+
+    def __getattr__(self, name: str) -> Any:
+        # Solo se llama si el atributo no existe en el Frame
+        if name.startswith('_') or name == 'image':
+            raise AttributeError(name)
+        return getattr(self.image, name)
+
+    def __repr__(self) -> str:
+        return f"<Frame {self.width}x{self.height} codificaciones={len(self._memo)}>"
+
+    def to_global(self, x: float, y: float) -> Tuple[int, int]:
+        """Convierte coordenadas de la captura en coordenadas del escritorio virtual."""
+        return int(round(x)) + self.origin[0], int(round(y)) + self.origin[1]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._bgra is not None:
+            return self._bgra.shape[1], self._bgra.shape[0]
+        return self._image.size
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def image(self) -> Image.Image:
+        """Imagen PIL en RGB (si el Frame se creó desde el búfer, se convierte la primera vez)."""
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    # El desempaquetador BGRX de PIL convierte en C y en una sola copia
+                    self._image = Image.frombuffer('RGB', self.size, self._bgra, 'raw', 'BGRX', 0, 1)
+        return self._image
+
+    @property
+    def bgra(self) -> np.ndarray:
+        """Píxeles BGRA (alto x ancho x 4, uint8): una vista del búfer original si existe."""
+        if self._bgra is None:
+            with self._lock:
+                if self._bgra is None:
+                    rgba = np.asarray(self._image.convert('RGBA'))
+                    self._bgra = np.ascontiguousarray(rgba[..., [2, 1, 0, 3]])
+        return self._bgra
+
+    def gray(self) -> np.ndarray:
+        """Matriz en escala de grises (alto x ancho, uint8), memorizada."""
+        return self.memo(('gray_u8',), lambda: np.asarray(self.image.convert('L')))
+
+    def memo(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor guardado para la clave o lo calcula y lo guarda.
+
+        Args:
+            key: Clave de la codificación (debe incluir todos los parámetros que la afectan)
+            compute: Función sin argumentos que calcula el valor
+
+        Returns:
+            Valor memorizado
+        """
+        with self._lock:
+            if key in self._memo:
+                self.hits += 1
+                return self._memo[key]
+            self.misses += 1
+
+        # Calcular fuera del lock: dos hilos pueden calcular a la vez, pero se guarda el primero
+        value = compute()
+        with self._lock:
+            return self._memo.setdefault(key, value)
+
+    def encode(self, encoder: ImageEncoder) -> EncodedImage:
+        """
+        Codifica la captura para la API con el codificador indicado (memorizado por su configuración).
+
+        Args:
+            encoder: Codificador de imágenes
+
+        Returns:
+            EncodedImage compartido por todas las llamadas con la misma configuración
+        """
+        return self.memo(('encoded',) + encoder.cache_key(), lambda: encoder.encode(self.image))
+
+    def to_base64(self, format: str = 'PNG', quality: Optional[int] = None) -> str:
+        """
+        Codifica la captura completa en base64 (p. ej. para mostrarla en el navegador).
+
+        Args:
+            format: Formato de imagen (PNG, JPEG, ...)
+            quality: Calidad para formatos con pérdida
+
+        Returns:
+            String en base64 de la imagen
+        """
+        def compute():
+            buffered = io.BytesIO()
+            save_kwargs = {'quality': quality} if quality is not None else {}
+            self.image.save(buffered, format=format, **save_kwargs)
+            return base64.b64encode(buffered.getvalue()).decode()
+
+        return self.memo(('base64', format.upper(), quality), compute)
+
+    def invalidate(self):
+        """Descarta las codificaciones guardadas (si la imagen se modificó)."""
+        with self._lock:
+            self._memo.clear()
+
+
+def memoized(image: Any, key: Hashable, compute: Callable[[], Any]) -> Any:
+    """
+    Memoriza un cálculo sobre una imagen si es un Frame; si no, simplemente lo calcula.
+
+    Args:
+        image: Imagen PIL o Frame
+        key: Clave del cálculo
+        compute: Función sin argumentos que calcula el valor
+
+    Returns:
+        Valor calculado o memorizado
+    """
+    if isinstance(image, Frame):
+        return image.memo(key, compute)
+    return compute()
+
+
+def gray_array(image: Any) -> np.ndarray:
+    """
+    Matriz en escala de grises (uint8) de una imagen PIL o Frame (memorizada en el Frame).
+
+    Args:
+        image: Imagen PIL o Frame
+
+    Returns:
+        Matriz alto x ancho de solo lectura
+    """
+    if isinstance(image, Frame):
+        return image.gray()
+    return np.asarray(image.convert('L'))
+
+
+def image_origin(image: Any) -> Tuple[int, int]:
+    """Posición de una captura en el escritorio virtual ((0, 0) para imágenes PIL)."""
+    return image.origin if isinstance(image, Frame) else (0, 0)
+
+
+def unwrap(image: Any) -> Image.Image:
+    """Devuelve la imagen PIL de un Frame (o la propia imagen)."""
+    return image.image if isinstance(image, Frame) else image
+
+
+# Función de prueba
+if __name__ == "__main__":
+    from PIL import ImageDraw
+
+    img = Image.new('RGB', (3840, 2160), color='white')
+    ImageDraw.Draw(img).text((100, 100), "Pantalla de prueba 4K", fill='black')
+    frame = Frame(img)
+
+    encoder = ImageEncoder()
+    for _ in range(3):
+        start = time.perf_counter()
+        encoded = frame.encode(encoder)
+        print(f"Codificación: {(time.perf_counter() - start) * 1000:.1f} ms ({encoded.num_bytes} bytes)")
+
+    print(f"{frame!r}, aciertos: {frame.hits}, fallos: {frame.misses}")
+
+    # Frame sobre un búfer BGRA (como ScreenShot.raw de mss): la imagen RGB se crea al pedirla
+    raw = bytearray(np.asarray(img.convert('RGBA'))[..., [2, 1, 0, 3]].tobytes())
+    start = time.perf_counter()
+    frame = Frame.from_bgra(raw, img.size)
+    print(f"Frame desde BGRA: {(time.perf_counter() - start) * 1000:.2f} ms, {frame.size}")
+    start = time.perf_counter()
+    frame.image
+    print(f"Conversión a RGB: {(time.perf_counter() - start) * 1000:.1f} ms, igual: {frame.image.tobytes() == img.tobytes()}")
@@ -15,6 +15,7 @@ from dotenv import load_dotenv
 from screen_capture import ScreenCapture
 from automation import Automation
 from ai_vision import AIVision
+from response_cache import ResponseCache
 
 
 class AIAssistantGUI:
@@ -33,6 +34,7 @@ class AIAssistantGUI:
         self.screen_capture = ScreenCapture()
         self.automation = Automation()
         self.ai_vision = None
+        self.response_cache = ResponseCache()
 
         # Variables
         self.current_screenshot = None
@@ -52,7 +54,7 @@ class AIAssistantGUI:
         try:
             api_key = os.getenv('ANTHROPIC_API_KEY')
             if api_key:
-                self.ai_vision = AIVision(api_key=api_key)
+                self.ai_vision = AIVision(api_key=api_key, cache=self.response_cache)
                 return True
         except Exception as e:
             print(f"No se pudo inicializar IA: {e}")
@@ -401,18 +403,29 @@ https://console.anthropic.com/
         def run_analysis():
             try:
                 screenshot = self.screen_capture.capture_full_screen()
-                analysis = self.ai_vision.analyze_screen(screenshot)
 
-                self.result_text.delete('1.0', tk.END)
-                self.result_text.insert('1.0', f"=== ANÁLISIS DE PANTALLA ===\n\n{analysis}")
+                self.root.after(0, self._reset_result, "=== ANÁLISIS DE PANTALLA ===\n\n")
+
+                # Mostrar el texto a medida que llega
+                for text in self.ai_vision.stream_analyze_screen(screenshot):
+                    self.root.after(0, self._append_result, text)
             except Exception as e:
-                self.result_text.delete('1.0', tk.END)
-                self.result_text.insert('1.0', f'Error: {str(e)}')
+                self.root.after(0, self._reset_result, f'Error: {str(e)}')
 
         thread = threading.Thread(target=run_analysis)
         thread.daemon = True
         thread.start()
 
+    def _reset_result(self, text: str = ''):
+        """Reemplaza el contenido del área de resultados (hilo principal)."""
+        self.result_text.delete('1.0', tk.END)
+        self.result_text.insert('1.0', text)
+
+    def _append_result(self, text: str):
+        """Agrega texto al final del área de resultados (hilo principal)."""
+        self.result_text.insert(tk.END, text)
+        self.result_text.see(tk.END)
+
     def refresh_windows(self):
         """Actualiza la lista de ventanas."""
         # Limpiar árbol
@@ -485,7 +498,8 @@ https://console.anthropic.com/
             os.environ['ANTHROPIC_API_KEY'] = api_key
 
             # Reinicializar IA
-            self.ai_vision = AIVision(api_key=api_key)
+            self.response_cache.clear()
+            self.ai_vision = AIVision(api_key=api_key, cache=self.response_cache)
 
             messagebox.showinfo("Éxito", "API key configurada correctamente")
             self.update_status()
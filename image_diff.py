@@ -0,0 +1,409 @@
+"""
+Módulo de comparación local de capturas de pantalla.
+Detecta si la pantalla cambió entre dos capturas y en qué regiones, para no llamar
+a la IA cuando nada cambió y enviar solo recortes de las zonas modificadas.
+TileDiff compara los píxeles exactos por bloques. Está limitado por el ancho de banda de
+memoria: en un núcleo, con una captura 4K, tarda casi lo mismo que leer las dos capturas una
+vez (unos 7 ms si cambia poco y unos 14 ms si cambia toda la pantalla, medidos en un portátil;
+tests/test_image_diff.py lo compara con np.array_equal en la misma máquina).
+"""
+
+from PIL import Image
+import numpy as np
+from typing import Any, List, Optional, Tuple
+
+from frame import Frame, gray_array, memoized
+
+
+# (left, top, right, bottom) en píxeles, con right/bottom exclusivos como en PIL
+Box = Tuple[int, int, int, int]
+
+# Máscara de los canales de color de un píxel BGRA leído como uint32 (sin el alfa:
+# mss lo deja a 0 y las imágenes PIL convertidas a 255)
+COLOR_MASK = np.array([255, 255, 255, 0], dtype=np.uint8).view(np.uint32)[0]
+
+
+class DiffResult:
+    """Resultado de comparar dos capturas."""
+
+    def __init__(self, changed_fraction: float, regions: List[Box], size: Tuple[int, int],
+                 comparable: bool = True):
+        """
+        Args:
+            changed_fraction: Fracción de píxeles que cambiaron
+            regions: Regiones con cambios (ordenadas de mayor a menor)
+            size: Tamaño (width, height) de las capturas
+            comparable: False si las capturas no se pueden comparar (tamaños distintos)
+        """
+        self.changed_fraction = changed_fraction
+        self.regions = regions
+        self.width, self.height = size
+        self.comparable = comparable
+
+    @property
+    def changed(self) -> bool:
+        """True si hay algún cambio significativo (o no se pudo comparar)."""
+        return not self.comparable or bool(self.regions)
+
+    @property
+    def bbox(self) -> Optional[Box]:
+        """Rectángulo que engloba todas las regiones con cambios."""
+        if not self.regions:
+            return None
+        return (
+            min(r[0] for r in self.regions),
+            min(r[1] for r in self.regions),
+            max(r[2] for r in self.regions),
+            max(r[3] for r in self.regions),
+        )
+
+    @property
+    def region_area_fraction(self) -> float:
+        """Fracción de la pantalla cubierta por las regiones con cambios."""
+        area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in self.regions)
+        return area / float(self.width * self.height) if self.width and self.height else 1.0
+
+
+class ImageDiff:
+    """Comparador de capturas basado en la diferencia de píxeles en escala de grises."""
+
+    def __init__(self, pixel_threshold: int = 24, min_changed_pixels: int = 16,
+                 cell_size: int = 32, padding: int = 48):
+        """
+        Args:
+            pixel_threshold: Diferencia mínima de intensidad (0-255) para contar un píxel como cambiado
+                             (evita el ruido de compresión y antialiasing)
+            min_changed_pixels: Píxeles cambiados mínimos en una región para tenerla en cuenta
+            cell_size: Tamaño en píxeles de las celdas usadas para agrupar cambios en regiones
+            padding: Margen en píxeles que se añade alrededor de cada región al recortar
+        """
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.cell_size = cell_size
+        self.padding = padding
+
+    def compare(self, before: Image.Image, after: Image.Image) -> DiffResult:
+        """
+        Compara dos capturas.
+
+        Args:
+            before: Captura anterior (imagen PIL o Frame)
+            after: Captura posterior (imagen PIL o Frame)
+
+        Returns:
+            DiffResult con la fracción de cambio y las regiones modificadas
+        """
+        if before.size != after.size:
+            return DiffResult(1.0, [], after.size, comparable=False)
+
+        a = self._gray(before)
+        b = self._gray(after)
+        mask = np.abs(a - b) > self.pixel_threshold
+
+        changed_fraction = float(mask.mean())
+        if not changed_fraction:
+            return DiffResult(0.0, [], after.size)
+
+        return DiffResult(changed_fraction, self._regions(mask), after.size)
+
+    @staticmethod
+    def _gray(image: Any) -> np.ndarray:
+        """Matriz en escala de grises de la imagen (memorizada si es un Frame)."""
+        return memoized(image, ('gray',), lambda: gray_array(image).astype(np.int16))
+
+    def _regions(self, mask: np.ndarray) -> List[Box]:
+        """Agrupa los píxeles cambiados en regiones conectadas sobre una rejilla de celdas."""
+        height, width = mask.shape
+        cell = self.cell_size
+        rows, cols = -(-height // cell), -(-width // cell)
+
+        # Píxeles cambiados por celda
+        padded = np.zeros((rows * cell, cols * cell), dtype=np.uint32)
+        padded[:height, :width] = mask
+        counts = padded.reshape(rows, cell, cols, cell).sum(axis=(1, 3))
+
+        active = counts > 0
+        seen = np.zeros_like(active)
+        regions = []
+
+        for row, col in zip(*(axis.tolist() for axis in np.nonzero(active))):
+            if seen[row, col]:
+                continue
+            # Recorrer las celdas vecinas con cambios (incluidas diagonales)
+            stack = [(row, col)]
+            seen[row, col] = True
+            cells = []
+            while stack:
+                r, c = stack.pop()
+                cells.append((r, c))
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        nr, nc = r + dr, c + dc
+                        if 0 <= nr < rows and 0 <= nc < cols and active[nr, nc] and not seen[nr, nc]:
+                            seen[nr, nc] = True
+                            stack.append((nr, nc))
+
+            changed = sum(int(counts[r, c]) for r, c in cells)
+            if changed < self.min_changed_pixels:
+                continue
+
+            # Ajustar el rectángulo a los píxeles reales dentro de las celdas
+            top, bottom = min(r for r, _ in cells) * cell, (max(r for r, _ in cells) + 1) * cell
+            left, right = min(c for _, c in cells) * cell, (max(c for _, c in cells) + 1) * cell
+            sub = mask[top:bottom, left:right]
+            ys, xs = np.nonzero(sub)
+            regions.append((changed, (left + int(xs.min()), top + int(ys.min()),
+                                      left + int(xs.max()) + 1, top + int(ys.max()) + 1)))
+
+        regions.sort(key=lambda item: item[0], reverse=True)
+        return [box for _, box in regions]
+
+    def pad_box(self, box: Box, size: Tuple[int, int]) -> Box:
+        """
+        Amplía una región con el margen configurado, sin salir de la imagen.
+
+        Args:
+            box: Región (left, top, right, bottom)
+            size: Tamaño (width, height) de la imagen
+
+        Returns:
+            Región ampliada
+        """
+        width, height = size
+        left, top, right, bottom = box
+        return (
+            max(0, left - self.padding),
+            max(0, top - self.padding),
+            min(width, right + self.padding),
+            min(height, bottom + self.padding),
+        )
+
+
+class TileDiffResult(DiffResult):
+    """Resultado de TileDiff: añade los bloques cambiados y si la pantalla está estable."""
+
+    def __init__(self, changed_fraction: float, regions: List[Box], size: Tuple[int, int],
+                 changed_tiles: int, total_tiles: int, stable: bool, comparable: bool = True):
+        """
+        Args:
+            changed_fraction: Fracción de píxeles que cambiaron
+            regions: Rectángulos con cambios, ya fusionados
+            size: Tamaño (width, height) de las capturas
+            changed_tiles: Bloques con algún píxel distinto
+            total_tiles: Bloques de la captura
+            stable: True si la fracción de cambio no supera el umbral de estabilidad
+            comparable: False si las capturas no se pueden comparar (tamaños distintos)
+        """
+        super().__init__(changed_fraction, regions, size, comparable)
+        self.changed_tiles = changed_tiles
+        self.total_tiles = total_tiles
+        self.stable = stable
+
+    def to_dict(self) -> dict:
+        return {
+            'changed': self.changed,
+            'stable': self.stable,
+            'changed_fraction': round(self.changed_fraction, 6),
+            'changed_tiles': self.changed_tiles,
+            'total_tiles': self.total_tiles,
+            'regions': [list(box) for box in self.regions],
+        }
+
+
+class TileDiff(ImageDiff):
+    """
+    Detector de regiones cambiadas por bloques sobre los píxeles exactos.
+
+    Compara las capturas como enteros de 32 bits por píxel en BGRA (directamente sobre
+    el búfer de los Frames de mss; las imágenes PIL se convierten a la misma disposición)
+    ignorando el canal alfa, reduce la máscara a bloques de tile_size
+    píxeles y fusiona los bloques cambiados en unos pocos rectángulos. Es exacto
+    (cualquier píxel distinto cuenta) y puede usarse como image_diff de AIVision.
+    """
+
+    def __init__(self, tile_size: int = 32, max_regions: int = 4, merge_gap: int = 1,
+                 stable_fraction: float = 0.0005, padding: int = 48):
+        """
+        Args:
+            tile_size: Lado de los bloques en píxeles
+            max_regions: Número máximo de rectángulos devueltos (se fusionan los más próximos)
+            merge_gap: Bloques sin cambios entre dos regiones por debajo de los cuales se fusionan
+            stable_fraction: Fracción de píxeles cambiados hasta la que la pantalla se considera
+                             estable (cursor parpadeando, reloj...)
+            padding: Margen en píxeles que se añade alrededor de cada región al recortar
+        """
+        super().__init__(pixel_threshold=0, min_changed_pixels=1, cell_size=tile_size, padding=padding)
+        self.tile_size = tile_size
+        self.max_regions = max_regions
+        self.merge_gap = merge_gap
+        self.stable_fraction = stable_fraction
+
+    @staticmethod
+    def _pixels(image: Any) -> np.ndarray:
+        """
+        Matriz alto x ancho de píxeles BGRA como uint32 (sin copia para Frames creados desde mss).
+
+        Todas las entradas usan la misma disposición, así que una imagen PIL y un Frame
+        con el mismo contenido se comparan como iguales.
+        """
+        if not isinstance(image, Frame):
+            image = Frame(image)
+        return image.bgra.view(np.uint32)[..., 0]
+
+    def _changed_tiles(self, before: np.ndarray, after: np.ndarray) -> Tuple[np.ndarray, int]:
+        """
+        Bloques con algún píxel cuyo color cambió (se ignora el alfa) y número de píxeles cambiados.
+
+        Se recorre la captura por franjas de un bloque de alto, que caben en la caché del
+        procesador. Una franja idéntica se descarta con una sola comparación (el caso
+        habitual: casi toda la pantalla sigue igual), así que el coste es el de leer las
+        dos capturas una vez; la máscara sin alfa solo se calcula en las franjas distintas.
+        """
+        tile = self.tile_size
+        height, width = after.shape
+        tiles = np.zeros((-(-height // tile), -(-width // tile)), dtype=bool)
+        starts = np.arange(0, width, tile)
+        difference = np.empty((tile, width), dtype=np.uint32)
+        mask = np.empty((tile, width), dtype=bool)
+        changed_pixels = 0
+
+        for row, top in enumerate(range(0, height, tile)):
+            a, b = before[top:top + tile], after[top:top + tile]
+            if np.array_equal(a, b):
+                continue
+            rows = a.shape[0]
+            np.bitwise_xor(a, b, out=difference[:rows])
+            np.bitwise_and(difference[:rows], COLOR_MASK, out=difference[:rows])
+            np.not_equal(difference[:rows], 0, out=mask[:rows])
+            count = int(np.count_nonzero(mask[:rows]))
+            if count:
+                changed_pixels += count
+                tiles[row] = np.logical_or.reduceat(mask[:rows].any(axis=0), starts)
+        return tiles, changed_pixels
+
+    def _tile_regions(self, tiles: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """Agrupa los bloques cambiados en rectángulos (en bloques: col0, fila0, col1, fila1)."""
+        rows, cols = tiles.shape
+        # Muchos bloques cambiados: un solo rectángulo (recorrerlos uno a uno no compensa)
+        if tiles.sum() > rows * cols // 4:
+            ys, xs = np.nonzero(tiles)
+            return [(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)]
+
+        gap = self.merge_gap
+        seen = np.zeros_like(tiles)
+        boxes = []
+        for row, col in zip(*(axis.tolist() for axis in np.nonzero(tiles))):
+            if seen[row, col]:
+                continue
+            # Recorrer los bloques cambiados a menos de merge_gap bloques de distancia
+            stack = [(row, col)]
+            seen[row, col] = True
+            top, left, bottom, right = row, col, row, col
+            while stack:
+                r, c = stack.pop()
+                top, left, bottom, right = min(top, r), min(left, c), max(bottom, r), max(right, c)
+                r0, r1 = max(0, r - gap - 1), min(rows, r + gap + 2)
+                c0, c1 = max(0, c - gap - 1), min(cols, c + gap + 2)
+                for nr, nc in zip(*(axis.tolist() for axis in np.nonzero(tiles[r0:r1, c0:c1] & ~seen[r0:r1, c0:c1]))):
+                    seen[r0 + nr, c0 + nc] = True
+                    stack.append((r0 + nr, c0 + nc))
+            boxes.append((left, top, right + 1, bottom + 1))
+
+        # Fusionar los rectángulos que más se acercan hasta no pasar de max_regions
+        while len(boxes) > self.max_regions:
+            best = None
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    union = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    growth = (_area(union) - _area(a) - _area(b))
+                    if best is None or growth < best[0]:
+                        best = (growth, i, j, union)
+            _, i, j, union = best
+            boxes = [box for k, box in enumerate(boxes) if k not in (i, j)] + [union]
+        return boxes
+
+    def compare(self, before: Image.Image, after: Image.Image) -> TileDiffResult:
+        """
+        Compara dos capturas.
+
+        Args:
+            before: Captura anterior (imagen PIL o Frame)
+            after: Captura posterior (imagen PIL o Frame)
+
+        Returns:
+            TileDiffResult con la fracción de píxeles cambiados, las regiones fusionadas
+            (ordenadas de mayor a menor) y si la pantalla está estable
+        """
+        width, height = after.size
+        tile = self.tile_size
+        total_tiles = (-(-width // tile)) * (-(-height // tile))
+        if before.size != after.size:
+            return TileDiffResult(1.0, [], after.size, total_tiles, total_tiles, stable=False, comparable=False)
+
+        tiles, changed_pixels = self._changed_tiles(self._pixels(before), self._pixels(after))
+        if not changed_pixels:
+            return TileDiffResult(0.0, [], after.size, 0, total_tiles, stable=True)
+
+        regions = [(left * tile, top * tile, min(width, right * tile), min(height, bottom * tile))
+                   for left, top, right, bottom in self._tile_regions(tiles)]
+        regions.sort(key=_area, reverse=True)
+
+        changed_fraction = changed_pixels / float(width * height)
+        return TileDiffResult(changed_fraction, regions, after.size, int(tiles.sum()), total_tiles,
+                              stable=changed_fraction <= self.stable_fraction)
+
+
+def _area(box: Box) -> int:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+# Función de prueba
+if __name__ == "__main__":
+    from PIL import ImageDraw
+    import time
+
+    before = Image.new('RGB', (1920, 1080), color='white')
+    ImageDraw.Draw(before).text((100, 100), "Documento sin guardar", fill='black')
+
+    after = before.copy()
+    ImageDraw.Draw(after).rectangle((800, 500, 1000, 550), fill='navy')
+
+    differ = ImageDiff()
+    print(f"Sin cambios: {differ.compare(before, before.copy()).changed}")
+
+    result = differ.compare(before, after)
+    print(f"Cambio: {result.changed_fraction:.4%}, regiones: {result.regions}")
+    print(f"Recorte con margen: {differ.pad_box(result.bbox, after.size)}")
+
+    # Benchmark de TileDiff sobre capturas 4K en BGRA (como las de mss)
+    def bgra_frame(image: Image.Image) -> Frame:
+        raw = bytearray(np.asarray(image.convert('RGBA'))[..., [2, 1, 0, 3]].tobytes())
+        return Frame.from_bgra(raw, image.size)
+
+    screen = Image.new('RGB', (3840, 2160), color='white')
+    draw = ImageDraw.Draw(screen)
+    for line in range(60):
+        draw.text((80, 40 + line * 34), f"Línea {line} de un documento de prueba", fill='black')
+    small = screen.copy()
+    ImageDraw.Draw(small).rectangle((2000, 1200, 2300, 1260), fill='navy')
+    ImageDraw.Draw(small).text((3700, 2120), "12:01", fill='black')
+    full = Image.new('RGB', screen.size, color='lightgray')
+
+    tile_diff = TileDiff()
+    base = bgra_frame(screen)
+    cases = {'sin cambios': bgra_frame(screen), 'cambio pequeño': bgra_frame(small),
+             'pantalla completa': bgra_frame(full)}
+    for name, other in cases.items():
+        timings = []
+        for _ in range(30):
+            start = time.perf_counter()
+            result = tile_diff.compare(base, other)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"TileDiff 4K, {name}: p50 {timings[len(timings) // 2]:.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms -> {result.to_dict()}")
+
+    start = time.perf_counter()
+    ImageDiff().compare(screen, small)
+    print(f"ImageDiff 4K (escala de grises, referencia): {(time.perf_counter() - start) * 1000:.1f} ms")
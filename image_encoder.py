@@ -0,0 +1,246 @@
+"""
+Módulo de codificación adaptativa de capturas para la API de visión.
+Reduce la resolución, elige formato (PNG/JPEG/WebP) y calidad según el contenido
+y conserva la escala para convertir coordenadas de vuelta a píxeles reales.
+"""
+
+from PIL import Image
+import base64
+import io
+from typing import Optional, Tuple, Dict, Any
+
+
+# Tipos MIME aceptados por la API para cada formato de PIL
+MEDIA_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+}
+
+
+class EncodedImage:
+    """Imagen codificada lista para enviar a la API, con su información de escala."""
+
+    def __init__(self, data: str, media_type: str, size: Tuple[int, int],
+                 original_size: Tuple[int, int], num_bytes: int, offset: Tuple[int, int] = (0, 0),
+                 full_size: Optional[Tuple[int, int]] = None):
+        """
+        Args:
+            data: Imagen codificada en base64
+            media_type: Tipo MIME de la imagen codificada
+            size: Tamaño (width, height) de la imagen enviada
+            original_size: Tamaño (width, height) de la imagen original (o del recorte enviado)
+            num_bytes: Tamaño en bytes de la imagen codificada (antes de base64)
+            offset: Posición (x, y) del recorte dentro de la imagen original
+            full_size: Tamaño de la imagen original completa si solo se envía un recorte
+        """
+        self.data = data
+        self.media_type = media_type
+        self.width, self.height = size
+        self.original_width, self.original_height = original_size
+        self.num_bytes = num_bytes
+        self.offset = offset
+        self.full_size = full_size
+
+    @property
+    def is_crop(self) -> bool:
+        """True si la imagen enviada es solo una parte de la original."""
+        return self.full_size is not None
+
+    @property
+    def scale_x(self) -> float:
+        """Factor para pasar de X en la imagen enviada a X en la imagen original."""
+        return self.original_width / self.width
+
+    @property
+    def scale_y(self) -> float:
+        """Factor para pasar de Y en la imagen enviada a Y en la imagen original."""
+        return self.original_height / self.height
+
+    def to_content_block(self) -> Dict[str, Any]:
+        """
+        Construye el bloque de contenido 'image' para la API de mensajes.
+
+        Returns:
+            Diccionario con el bloque de imagen
+        """
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": self.media_type,
+                "data": self.data,
+            },
+        }
+
+    def to_original_coords(self, x: float, y: float) -> Tuple[int, int]:
+        """
+        Convierte coordenadas de la imagen enviada a coordenadas de la imagen original.
+
+        Args:
+            x: Posición X devuelta por el modelo
+            y: Posición Y devuelta por el modelo
+
+        Returns:
+            Tupla (x, y) en píxeles de la imagen original
+        """
+        orig_x = int(round(float(x) * self.scale_x))
+        orig_y = int(round(float(y) * self.scale_y))
+        # Limitar a los bordes de la imagen original
+        orig_x = min(max(orig_x, 0), self.original_width - 1)
+        orig_y = min(max(orig_y, 0), self.original_height - 1)
+        return orig_x + self.offset[0], orig_y + self.offset[1]
+
+
+class ImageEncoder:
+    """Etapa de codificación configurable para las capturas que se envían a Claude."""
+
+    # Límite recomendado por la API: imágenes mayores se reescalan en el servidor
+    DEFAULT_MAX_LONG_EDGE = 1568
+    DEFAULT_MAX_PIXELS = 1_150_000
+
+    def __init__(self, max_long_edge: Optional[int] = DEFAULT_MAX_LONG_EDGE,
+                 max_pixels: Optional[int] = DEFAULT_MAX_PIXELS,
+                 format: str = 'auto', lossy_format: str = 'JPEG', quality: int = 80,
+                 grayscale: bool = False, palette_colors: Optional[int] = None,
+                 flat_color_threshold: int = 4096):
+        """
+        Args:
+            max_long_edge: Lado mayor máximo en píxeles (None para no limitar)
+            max_pixels: Número máximo de píxeles (None para no limitar)
+            format: 'auto', 'PNG', 'JPEG' o 'WEBP'
+            lossy_format: Formato con pérdida que usa 'auto' para contenido fotográfico
+            quality: Calidad para formatos con pérdida (1-100)
+            grayscale: Convertir a escala de grises (útil en pantallas con mucho texto)
+            palette_colors: Reducir a una paleta de N colores al usar PNG (None para desactivar)
+            flat_color_threshold: Máximo de colores distintos en la miniatura para
+                                  considerar la imagen como interfaz plana (PNG)
+        """
+        format = format.upper()
+        if format != 'AUTO' and format not in MEDIA_TYPES:
+            raise ValueError(f"Formato de imagen no soportado: {format}")
+        lossy_format = lossy_format.upper()
+        if lossy_format not in ('JPEG', 'WEBP'):
+            raise ValueError(f"Formato con pérdida no soportado: {lossy_format}")
+
+        self.max_long_edge = max_long_edge
+        self.max_pixels = max_pixels
+        self.format = format
+        self.lossy_format = lossy_format
+        self.quality = quality
+        self.grayscale = grayscale
+        self.palette_colors = palette_colors
+        self.flat_color_threshold = flat_color_threshold
+
+    def cache_key(self) -> Tuple:
+        """
+        Clave con toda la configuración que afecta al resultado de encode().
+
+        Returns:
+            Tupla usable como clave de caché (p. ej. en Frame)
+        """
+        return (self.max_long_edge, self.max_pixels, self.format, self.lossy_format,
+                self.quality, self.grayscale, self.palette_colors, self.flat_color_threshold)
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """
+        Calcula el tamaño al que se reescalará una imagen.
+
+        Args:
+            width: Ancho original
+            height: Alto original
+
+        Returns:
+            Tupla (width, height) destino
+        """
+        scale = 1.0
+        if self.max_long_edge and max(width, height) > self.max_long_edge:
+            scale = self.max_long_edge / max(width, height)
+        if self.max_pixels and width * height * scale * scale > self.max_pixels:
+            scale = (self.max_pixels / (width * height)) ** 0.5
+
+        if scale >= 1.0:
+            return width, height
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def choose_format(self, image: Image.Image) -> str:
+        """
+        Elige el formato según el contenido de la imagen.
+
+        Las interfaces planas (pocos colores, mucho texto) comprimen mejor y se leen
+        mejor en PNG; el contenido fotográfico se envía en JPEG o WebP.
+
+        Args:
+            image: Imagen PIL (ya reescalada)
+
+        Returns:
+            Nombre del formato de PIL
+        """
+        if self.format != 'AUTO':
+            return self.format
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((256, 256))
+        colors = thumbnail.getcolors(maxcolors=self.flat_color_threshold)
+        if colors is not None:
+            return 'PNG'
+        return self.lossy_format
+
+    def encode(self, image: Image.Image) -> EncodedImage:
+        """
+        Reescala y codifica una imagen para la API.
+
+        Args:
+            image: Imagen PIL
+
+        Returns:
+            EncodedImage con los datos en base64, tipo MIME y escala
+        """
+        original_size = image.size
+
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        size = self.target_size(*original_size)
+        if size != original_size:
+            image = image.resize(size, Image.LANCZOS)
+
+        if self.grayscale:
+            image = image.convert('L')
+
+        format = self.choose_format(image)
+
+        save_kwargs = {}
+        if format == 'PNG':
+            if self.palette_colors:
+                image = image.quantize(colors=self.palette_colors)
+        elif format in ('JPEG', 'WEBP'):
+            save_kwargs['quality'] = self.quality
+
+        buffered = io.BytesIO()
+        image.save(buffered, format=format, **save_kwargs)
+        raw = buffered.getvalue()
+
+        return EncodedImage(
+            data=base64.standard_b64encode(raw).decode(),
+            media_type=MEDIA_TYPES[format],
+            size=image.size,
+            original_size=original_size,
+            num_bytes=len(raw),
+        )
+
+
+# Función de prueba
+if __name__ == "__main__":
+    from PIL import ImageDraw
+
+    img = Image.new('RGB', (3840, 2160), color='white')
+    draw = ImageDraw.Draw(img)
+    draw.text((100, 100), "Pantalla de prueba 4K", fill='black')
+
+    encoder = ImageEncoder()
+    encoded = encoder.encode(img)
+    print(f"Original: {img.size} -> Enviada: {encoded.width}x{encoded.height}")
+    print(f"Formato: {encoded.media_type}, {encoded.num_bytes} bytes")
+    print(f"(100, 100) en la imagen enviada = {encoded.to_original_coords(100, 100)} en pantalla")
@@ -12,8 +12,10 @@ from dotenv import load_dotenv
 
 # Importar módulos propios
 from screen_capture import ScreenCapture
-from automation import Automation
+from automation import Automation, ConfirmationPolicy
 from ai_vision import AIVision
+from element_memory import ElementMemory
+from conversation_memory import ConversationMemory
 
 # Inicializar colorama para colores en terminal
 init(autoreset=True)
@@ -39,7 +41,8 @@ class AIAssistant:
         print(f"{Fore.GREEN}✓{Style.RESET_ALL} Automatización inicializada")
 
         try:
-            self.ai = AIVision()
+            # Las posiciones encontradas en cada ventana se recuerdan entre ejecuciones
+            self.ai = AIVision(element_memory=ElementMemory())
             print(f"{Fore.GREEN}✓{Style.RESET_ALL} IA inicializada (Claude {self.ai.model})")
             self.ai_enabled = True
         except ValueError as e:
@@ -129,7 +132,7 @@ class AIAssistant:
         print(f"\n{Fore.CYAN}=== Análisis de Pantalla ==={Style.RESET_ALL}")
         print("Capturando pantalla...")
 
-        screenshot = self.screen.capture_full_screen()
+        screenshot = self.screen.capture_frame()
 
         print("Enviando a IA para análisis...")
         analysis = self.ai.analyze_screen(screenshot)
@@ -150,8 +153,14 @@ class AIAssistant:
             print(f"{Fore.YELLOW}Instrucción vacía{Style.RESET_ALL}")
             return
 
+        pipelined = input("¿Ejecutar cada acción mientras se genera el plan? (s/N): ").strip().lower() == 's'
+
         print("\nCapturando pantalla actual...")
-        screenshot = self.screen.capture_full_screen()
+        screenshot = self.screen.capture_frame()
+
+        if pipelined:
+            self.execute_instruction_pipelined(screenshot, instruction)
+            return
 
         print("Analizando y generando plan de acciones...")
         result = self.ai.get_actions_from_instruction(screenshot, instruction)
@@ -186,6 +195,41 @@ class AIAssistant:
         else:
             print("Ejecución cancelada")
 
+    def execute_instruction_pipelined(self, screenshot, instruction: str):
+        """
+        Ejecuta las acciones a medida que la IA las genera, confirmando cada una.
+
+        Args:
+            screenshot: Captura de la pantalla actual
+            instruction: Instrucción del usuario
+        """
+        def ask(action, index):
+            answer = input(
+                f"  {index + 1}. {action.get('description', action.get('type', 'Acción'))} "
+                f"- ¿Ejecutar? (s/n): "
+            ).strip().lower()
+            return answer == 's'
+
+        print("Generando y ejecutando acciones...")
+        execution = self.automation.execute_action_stream(
+            self.ai.stream_actions_from_instruction(screenshot, instruction),
+            confirm=ConfirmationPolicy(ask=ask)
+        )
+
+        if execution['rejected'] is not None:
+            print(f"\n{Fore.YELLOW}Ejecución detenida: {execution['reason']}{Style.RESET_ALL}")
+        else:
+            print(f"\n{Fore.GREEN}Acciones ejecutadas!{Style.RESET_ALL}")
+
+        result = execution['plan'] or {}
+        warnings = execution['warnings'] + result.get('warnings', [])
+        if warnings:
+            print(f"\n{Fore.YELLOW}Advertencias:{Style.RESET_ALL}")
+            for warning in warnings:
+                print(f"  - {warning}")
+        if result:
+            print(f"Criterio de éxito: {result.get('success_criteria', 'N/A')}")
+
     def find_element_menu(self):
         """Busca un elemento en la pantalla."""
         if not self.ai_enabled:
@@ -198,11 +242,17 @@ class AIAssistant:
         if not description:
             return
 
+        # Con la ventana, la posición se recuerda y las siguientes búsquedas no llaman a la IA
+        window_title = input("Título de la ventana (opcional, Enter para toda la pantalla): ").strip()
+        window = self.screen.find_window_by_title(window_title) if window_title else None
+        if window_title and window is None:
+            print(f"{Fore.YELLOW}Ventana no encontrada, se buscará en toda la pantalla{Style.RESET_ALL}")
+
         print("\nCapturando pantalla...")
-        screenshot = self.screen.capture_full_screen()
+        screenshot = self.screen.capture_frame()
 
         print("Buscando elemento...")
-        result = self.ai.find_element(screenshot, description)
+        result = self.ai.find_element(screenshot, description, window=window)
 
         if result:
             print(f"\n{Fore.GREEN}Elemento encontrado en: ({result['x']}, {result['y']}){Style.RESET_ALL}")
@@ -226,7 +276,8 @@ class AIAssistant:
         print("Habla con la IA sobre lo que ves en pantalla")
         print("Escribe 'salir' para volver al menú\n")
 
-        conversation_history = []
+        # Historial acotado: solo conserva las últimas capturas completas
+        conversation = ConversationMemory()
 
         while True:
             user_input = input(f"{Fore.GREEN}Tú:{Style.RESET_ALL} ").strip()
@@ -238,22 +289,20 @@ class AIAssistant:
                 continue
 
             # Capturar pantalla actual
-            screenshot = self.screen.capture_full_screen()
+            screenshot = self.screen.capture_frame()
 
-            # Enviar a IA
-            response = self.ai.chat_with_context(screenshot, user_input, conversation_history)
+            # Enviar a IA (el turno queda registrado en la memoria de conversación)
+            response = self.ai.chat_with_context(screenshot, user_input, conversation)
 
-            print(f"{Fore.CYAN}IA:{Style.RESET_ALL} {response}\n")
+            print(f"{Fore.CYAN}IA:{Style.RESET_ALL} {response}")
 
-            # Actualizar historial
-            conversation_history.append({
-                "role": "user",
-                "content": user_input
-            })
-            conversation_history.append({
-                "role": "assistant",
-                "content": response
-            })
+            # Mostrar el uso de la caché de prompts en esta llamada
+            usage = self.ai.last_usage
+            if usage:
+                print(f"{Fore.YELLOW}(tokens: {usage['input_tokens']} entrada, "
+                      f"{usage['cache_read_input_tokens']} leídos de caché, "
+                      f"{usage['cache_creation_input_tokens']} escritos en caché){Style.RESET_ALL}")
+            print()
 
     def manual_sequence(self):
         """Ejecuta una secuencia de acciones manual."""
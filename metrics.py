@@ -0,0 +1,450 @@
+"""
+Módulo de métricas de las llamadas a la IA.
+Registra por llamada el tiempo de cada etapa (caché, codificación, API, parseo),
+los tokens consumidos, los bytes enviados y el coste estimado, y los agrega por método.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+# Precios en USD por millón de tokens: (entrada, salida, escritura en caché, lectura de caché)
+MODEL_PRICES = {
+    'claude-3-5-sonnet': (3.00, 15.00, 3.75, 0.30),
+    'claude-3-7-sonnet': (3.00, 15.00, 3.75, 0.30),
+    'claude-sonnet-4': (3.00, 15.00, 3.75, 0.30),
+    'claude-3-5-haiku': (0.80, 4.00, 1.00, 0.08),
+    'claude-3-haiku': (0.25, 1.25, 0.30, 0.03),
+    'claude-3-opus': (15.00, 75.00, 18.75, 1.50),
+    'claude-opus-4': (15.00, 75.00, 18.75, 1.50),
+}
+
+# Píxeles por token de imagen según la documentación de visión
+PIXELS_PER_IMAGE_TOKEN = 750
+
+_current_call: contextvars.ContextVar = contextvars.ContextVar('current_call', default=None)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int,
+                  cache_creation_input_tokens: int = 0, cache_read_input_tokens: int = 0) -> Optional[float]:
+    """
+    Estima el coste en USD de una llamada.
+
+    Args:
+        model: Modelo usado
+        input_tokens: Tokens de entrada (sin contar la caché)
+        output_tokens: Tokens de salida
+        cache_creation_input_tokens: Tokens escritos en la caché de prompts
+        cache_read_input_tokens: Tokens leídos de la caché de prompts
+
+    Returns:
+        Coste estimado o None si el modelo no está en la tabla de precios
+    """
+    for prefix, prices in MODEL_PRICES.items():
+        if model.startswith(prefix):
+            input_price, output_price, write_price, read_price = prices
+            return (
+                input_tokens * input_price
+                + output_tokens * output_price
+                + cache_creation_input_tokens * write_price
+                + cache_read_input_tokens * read_price
+            ) / 1_000_000
+    return None
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estima los tokens que consume una imagen del tamaño indicado.
+
+    Args:
+        width: Ancho de la imagen enviada
+        height: Alto de la imagen enviada
+
+    Returns:
+        Número aproximado de tokens
+    """
+    return int(width * height / PIXELS_PER_IMAGE_TOKEN)
+
+
+class CallMetrics:
+    """Métricas de una llamada a un método de AIVision."""
+
+    def __init__(self, method: str, model: str):
+        """
+        Args:
+            method: Nombre del método
+            model: Modelo usado
+        """
+        self.method = method
+        self.model = model
+        self.started_at = time.perf_counter()
+        self.total_seconds = 0.0
+        self.stages: Dict[str, float] = {}
+        self.api_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.image_tokens = 0
+        self.payload_bytes = 0
+        self.cropped_images = 0
+        # Tokens de entrada estimados antes de enviar y presupuesto de las peticiones
+        self.estimated_input_tokens = 0
+        self.token_budget = 0
+        self.cache_hit = False
+        self.coalesced = False
+        # Sin llamadas a la API el coste es 0 (o None si el modelo no tiene precio conocido)
+        self._cost: Optional[float] = estimate_cost(model, 0, 0)
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        """Suma tiempo a una etapa (una etapa puede repetirse en la misma llamada)."""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def mark(self, name: str):
+        """Registra como etapa el tiempo transcurrido desde el inicio de la llamada."""
+        with self._lock:
+            self.stages.setdefault(name, time.perf_counter() - self.started_at)
+
+    def add_usage(self, usage: Dict[str, int], model: Optional[str] = None):
+        """
+        Suma el consumo de tokens de una respuesta de la API.
+
+        Args:
+            usage: Contadores de tokens de la respuesta
+            model: Modelo que respondió (una llamada puede usar varios al escalar);
+                   por defecto el de la llamada
+        """
+        with self._lock:
+            if model:
+                self.model = model
+            self.api_calls += 1
+            self.input_tokens += usage.get('input_tokens', 0)
+            self.output_tokens += usage.get('output_tokens', 0)
+            self.cache_creation_input_tokens += usage.get('cache_creation_input_tokens', 0)
+            self.cache_read_input_tokens += usage.get('cache_read_input_tokens', 0)
+
+            # El coste se calcula por respuesta con el precio de su modelo
+            cost = estimate_cost(
+                self.model, usage.get('input_tokens', 0), usage.get('output_tokens', 0),
+                usage.get('cache_creation_input_tokens', 0), usage.get('cache_read_input_tokens', 0)
+            )
+            if cost is not None:
+                self._cost = (self._cost or 0.0) + cost
+
+    def add_image(self, width: int, height: int, num_bytes: int, cropped: bool = False):
+        """Registra una imagen enviada (tamaño tras reescalar, bytes en base64 y si se recortó)."""
+        with self._lock:
+            self.image_tokens += estimate_image_tokens(width, height)
+            self.payload_bytes += num_bytes
+            self.cropped_images += 1 if cropped else 0
+
+    def add_estimate(self, tokens: int, budget: int):
+        """Registra los tokens de entrada estimados de una petición y su presupuesto."""
+        with self._lock:
+            self.estimated_input_tokens += tokens
+            self.token_budget += budget
+
+    @property
+    def actual_input_tokens(self) -> int:
+        """Tokens de entrada reales, incluidos los leídos y escritos en la caché de prompts."""
+        return self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+
+    @property
+    def cost(self) -> Optional[float]:
+        """Coste estimado en USD (None si ningún modelo usado está en la tabla de precios)."""
+        return self._cost
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Cierra la llamada y calcula el tiempo total."""
+        self.total_seconds = time.perf_counter() - self.started_at
+        # Cerrar un generador antes de agotarlo no es un error
+        if error is not None and not isinstance(error, GeneratorExit):
+            self.error = type(error).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Devuelve las métricas como diccionario (apto para JSON)."""
+        return {
+            'method': self.method,
+            'model': self.model,
+            'total_seconds': round(self.total_seconds, 4),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'api_calls': self.api_calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cache_creation_input_tokens': self.cache_creation_input_tokens,
+            'cache_read_input_tokens': self.cache_read_input_tokens,
+            'image_tokens': self.image_tokens,
+            'payload_bytes': self.payload_bytes,
+            'cropped_images': self.cropped_images,
+            'estimated_input_tokens': self.estimated_input_tokens,
+            'token_budget': self.token_budget,
+            'actual_input_tokens': self.actual_input_tokens,
+            'cost_usd': self.cost,
+            'cache_hit': self.cache_hit,
+            'coalesced': self.coalesced,
+            'error': self.error,
+        }
+
+
+def current_call() -> Optional[CallMetrics]:
+    """Obtiene las métricas de la llamada en curso en el contexto actual (o None)."""
+    return _current_call.get()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Mide el tiempo de una etapa de la llamada en curso (no hace nada fuera de una llamada).
+
+    Args:
+        name: Nombre de la etapa ('encode', 'api', 'parse', ...)
+    """
+    call = _current_call.get()
+    if call is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        call.add_stage(name, time.perf_counter() - start)
+
+
+class MetricsSink:
+    """Destino de las métricas. La implementación base las descarta."""
+
+    def record(self, call: CallMetrics):
+        """
+        Recibe las métricas de una llamada terminada.
+
+        Args:
+            call: Métricas de la llamada
+        """
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumen de las métricas recibidas."""
+        return {}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por rango más cercano de una lista ordenada."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class InMemoryMetrics(MetricsSink):
+    """Agregador en memoria con latencias p50/p95/p99, tokens y coste por método."""
+
+    def __init__(self, max_samples: int = 1000):
+        """
+        Args:
+            max_samples: Número de llamadas recientes por método usadas para los percentiles
+        """
+        self.max_samples = max_samples
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stages: Dict[str, Dict[str, Deque[float]]] = {}
+        self._totals: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, call: CallMetrics):
+        with self._lock:
+            latencies = self._latencies.setdefault(call.method, deque(maxlen=self.max_samples))
+            latencies.append(call.total_seconds)
+
+            stages = self._stages.setdefault(call.method, {})
+            for name, seconds in call.stages.items():
+                stages.setdefault(name, deque(maxlen=self.max_samples)).append(seconds)
+
+            totals = self._totals.setdefault(call.method, {
+                'calls': 0, 'errors': 0, 'cache_hits': 0, 'coalesced': 0, 'api_calls': 0,
+                'input_tokens': 0, 'output_tokens': 0,
+                'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0,
+                'image_tokens': 0, 'payload_bytes': 0, 'cropped_images': 0, 'cost_usd': 0.0,
+                'estimated_input_tokens': 0, 'estimated_actual_input_tokens': 0, 'over_budget': 0,
+            })
+            totals['calls'] += 1
+            totals['errors'] += 1 if call.error else 0
+            totals['cache_hits'] += 1 if call.cache_hit else 0
+            totals['coalesced'] += 1 if call.coalesced else 0
+            for key in ('api_calls', 'input_tokens', 'output_tokens', 'cache_creation_input_tokens',
+                        'cache_read_input_tokens', 'image_tokens', 'payload_bytes', 'cropped_images'):
+                totals[key] += getattr(call, key)
+            totals['cost_usd'] += call.cost or 0.0
+
+            # Precisión de la estimación: solo llamadas con estimación y respuesta de la API
+            if call.estimated_input_tokens and call.api_calls:
+                totals['estimated_input_tokens'] += call.estimated_input_tokens
+                totals['estimated_actual_input_tokens'] += call.actual_input_tokens
+            if call.token_budget and call.estimated_input_tokens > call.token_budget:
+                totals['over_budget'] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Obtiene el resumen por método.
+
+        Returns:
+            Diccionario método -> totales, percentiles de latencia y de cada etapa
+        """
+        with self._lock:
+            result = {}
+            for method, totals in self._totals.items():
+                latencies = sorted(self._latencies[method])
+                estimated = totals['estimated_input_tokens']
+                result[method] = {
+                    **totals,
+                    'cost_usd': round(totals['cost_usd'], 6),
+                    # Consumo real / estimado (>1: la estimación se queda corta)
+                    'estimate_ratio': round(totals['estimated_actual_input_tokens'] / estimated, 3) if estimated else None,
+                    'latency': {
+                        'p50': round(percentile(latencies, 0.50), 4),
+                        'p95': round(percentile(latencies, 0.95), 4),
+                        'p99': round(percentile(latencies, 0.99), 4),
+                    },
+                    'stages': {
+                        name: {
+                            'p50': round(percentile(sorted(values), 0.50), 4),
+                            'p95': round(percentile(sorted(values), 0.95), 4),
+                        }
+                        for name, values in self._stages[method].items()
+                    },
+                }
+            return result
+
+    def clear(self):
+        """Descarta todas las métricas."""
+        with self._lock:
+            self._latencies.clear()
+            self._stages.clear()
+            self._totals.clear()
+
+
+def instrumented(method: str) -> Callable:
+    """
+    Decorador que mide una llamada completa a un método de AIVision.
+
+    Crea un CallMetrics visible para stage() durante la llamada y lo entrega al
+    sink del objeto (self.metrics) al terminar. Admite funciones normales,
+    corrutinas, generadores y generadores asíncronos.
+
+    Args:
+        method: Nombre con el que se agregan las métricas
+    """
+    def decorator(func: Callable) -> Callable:
+        def start(self) -> CallMetrics:
+            return CallMetrics(method, getattr(self, 'model', ''))
+
+        def finish(self, call: CallMetrics, error: Optional[BaseException] = None):
+            call.finish(error)
+            self._finish_call(call)
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(self, *args, **kwargs):
+                call = start(self)
+                agen = func(self, *args, **kwargs)
+                try:
+                    while True:
+                        # Activar la llamada solo mientras se ejecuta el generador
+                        token = _current_call.set(call)
+                        try:
+                            value = await agen.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _current_call.reset(token)
+                        yield value
+                except BaseException as e:
+                    finish(self, call, e)
+                    raise
+                finally:
+                    await agen.aclose()
+                finish(self, call)
+            return async_gen_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(self, *args, **kwargs):
+                call = start(self)
+                gen = func(self, *args, **kwargs)
+                try:
+                    while True:
+                        token = _current_call.set(call)
+                        try:
+                            value = next(gen)
+                        except StopIteration as stop:
+                            result = stop.value
+                            break
+                        finally:
+                            _current_call.reset(token)
+                        yield value
+                except BaseException as e:
+                    finish(self, call, e)
+                    raise
+                finally:
+                    gen.close()
+                finish(self, call)
+                return result
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                call = start(self)
+                token = _current_call.set(call)
+                try:
+                    result = await func(self, *args, **kwargs)
+                except BaseException as e:
+                    finish(self, call, e)
+                    raise
+                finally:
+                    _current_call.reset(token)
+                finish(self, call)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            call = start(self)
+            token = _current_call.set(call)
+            try:
+                result = func(self, *args, **kwargs)
+            except BaseException as e:
+                finish(self, call, e)
+                raise
+            finally:
+                _current_call.reset(token)
+            finish(self, call)
+            return result
+        return wrapper
+
+    return decorator
+
+
+# Función de prueba
+if __name__ == "__main__":
+    sink = InMemoryMetrics()
+
+    for latency in (0.8, 1.2, 0.9, 3.5):
+        call = CallMetrics('analyze_screen', 'claude-3-5-sonnet-20241022')
+        call.add_stage('encode', 0.05)
+        call.add_stage('api', latency)
+        call.add_usage({'input_tokens': 1600, 'output_tokens': 300})
+        call.add_image(1568, 882, 250_000)
+        call.finish()
+        call.total_seconds = latency + 0.05
+        sink.record(call)
+
+    print(sink.summary())
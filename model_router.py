@@ -0,0 +1,327 @@
+"""
+Módulo de enrutado de modelos por tarea.
+Asigna a cada operación de AIVision un nivel de modelo (rápido, equilibrado, grande),
+un presupuesto de tokens de salida y secuencias de parada, escala a un modelo mayor
+cuando la respuesta tiene confianza baja y mide la latencia de cada ruta.
+"""
+
+from collections import deque
+import copy
+import json
+import os
+import threading
+from typing import Any, Deque, Dict, List, Optional
+
+from metrics import percentile
+
+
+# Modelos por nivel (todos con capacidades de visión)
+DEFAULT_MODELS = {
+    'fast': 'claude-3-haiku-20240307',
+    'balanced': 'claude-3-5-sonnet-20241022',
+    'large': 'claude-sonnet-4-20250514',
+}
+
+DEFAULT_TIER = 'balanced'
+
+# Ruta por operación: nivel, presupuesto de salida, secuencias de parada y nivel al que escalar
+DEFAULT_ROUTES = {
+    'analyze_screen': {'tier': 'balanced', 'max_tokens': 1024},
+    'chat_with_context': {'tier': 'balanced', 'max_tokens': 2048},
+    # La planificación sigue en el modelo de siempre; para usar el grande:
+    # AI_ROUTES='{"get_actions_from_instruction": {"tier": "large"}}'
+    'get_actions_from_instruction': {'tier': 'balanced', 'max_tokens': 2048},
+    'find_element': {'tier': 'fast', 'max_tokens': 256, 'escalate_to': 'balanced'},
+    'find_elements': {'tier': 'fast', 'max_tokens': 2048, 'escalate_to': 'balanced'},
+    'locate_element': {'tier': 'fast', 'max_tokens': 256, 'escalate_to': 'balanced'},
+    'verify_action_completed': {'tier': 'fast', 'max_tokens': 512, 'escalate_to': 'balanced'},
+}
+
+# Niveles de confianza que provocan el escalado
+ESCALATE_ON_CONFIDENCE = ('low',)
+
+
+class Route:
+    """Configuración de una operación."""
+
+    def __init__(self, tier: str = DEFAULT_TIER, max_tokens: int = 1024,
+                 stop_sequences: Optional[List[str]] = None, escalate_to: Optional[str] = None):
+        """
+        Args:
+            tier: Nivel de modelo ('fast', 'balanced', 'large')
+            max_tokens: Presupuesto máximo de tokens de salida
+            stop_sequences: Secuencias que detienen la generación
+            escalate_to: Nivel al que repetir la petición si la confianza es baja (None para no escalar)
+        """
+        self.tier = tier
+        self.max_tokens = int(max_tokens)
+        self.stop_sequences = list(stop_sequences or [])
+        self.escalate_to = escalate_to or None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tier': self.tier,
+            'max_tokens': self.max_tokens,
+            'stop_sequences': self.stop_sequences,
+            'escalate_to': self.escalate_to,
+        }
+
+
+class ModelRouter:
+    """Política de enrutado: operación -> modelo, presupuesto de salida y escalado."""
+
+    def __init__(self, models: Optional[Dict[str, str]] = None,
+                 routes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 enabled: bool = True, max_samples: int = 500, path: Optional[str] = None):
+        """
+        Args:
+            models: Modelo de cada nivel (se combina con DEFAULT_MODELS)
+            routes: Rutas por operación (se combinan con DEFAULT_ROUTES)
+            enabled: Si es False todas las operaciones usan el nivel por defecto
+                     (se mantienen los presupuestos)
+            max_samples: Latencias recientes por ruta usadas para los percentiles
+            path: Archivo donde save() guarda la configuración
+        """
+        self.max_samples = max_samples
+        self.path = path
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Dict[str, Deque[float]]] = {}
+        self._escalations: Dict[str, int] = {}
+
+        self.models: Dict[str, str] = dict(DEFAULT_MODELS)
+        self.routes: Dict[str, Route] = {op: Route(**cfg) for op, cfg in DEFAULT_ROUTES.items()}
+        self.enabled = enabled
+        self.configure(models=models, routes=routes)
+
+    @classmethod
+    def from_env(cls, path: Optional[str] = None) -> 'ModelRouter':
+        """
+        Crea la política a partir de las variables de entorno y del archivo de configuración.
+
+        Variables:
+            AI_MODEL_FAST, AI_MODEL_BALANCED, AI_MODEL_LARGE: modelo de cada nivel
+            AI_ROUTES: JSON operación -> {tier, max_tokens, stop_sequences, escalate_to}
+            AI_ROUTING: 0/false para usar siempre el nivel por defecto
+            AI_ROUTING_PATH: archivo donde /settings guarda la configuración
+
+        Args:
+            path: Archivo de configuración (por defecto AI_ROUTING_PATH)
+
+        Returns:
+            ModelRouter configurado
+        """
+        models = {tier: os.environ[f'AI_MODEL_{tier.upper()}']
+                  for tier in DEFAULT_MODELS if os.getenv(f'AI_MODEL_{tier.upper()}')}
+
+        routes = None
+        if os.getenv('AI_ROUTES'):
+            try:
+                routes = json.loads(os.environ['AI_ROUTES'])
+            except ValueError as e:
+                print(f"AI_ROUTES no es JSON válido, se ignora: {e}")
+
+        enabled = os.getenv('AI_ROUTING', '1').lower() not in ('0', 'false', 'no', 'off')
+        router = cls(models=models, routes=routes, enabled=enabled,
+                     path=path or os.getenv('AI_ROUTING_PATH'))
+
+        if router.path and os.path.exists(router.path):
+            router.load(router.path)
+        return router
+
+    # ===== CONFIGURACIÓN =====
+
+    def configure(self, models: Optional[Dict[str, str]] = None,
+                  routes: Optional[Dict[str, Dict[str, Any]]] = None,
+                  enabled: Optional[bool] = None):
+        """
+        Actualiza la configuración (solo las claves indicadas).
+
+        Args:
+            models: Modelo de cada nivel
+            routes: Rutas por operación (cada ruta puede indicar solo algunos campos)
+            enabled: Activar o desactivar el enrutado
+
+        Raises:
+            ValueError: Si una ruta usa un nivel inexistente o un presupuesto no válido
+        """
+        with self._lock:
+            new_models = dict(self.models)
+            new_models.update({tier: model for tier, model in (models or {}).items() if model})
+
+            new_routes = {op: Route(**route.to_dict()) for op, route in self.routes.items()}
+            for operation, cfg in (routes or {}).items():
+                merged = new_routes[operation].to_dict() if operation in new_routes else {}
+                merged.update({k: v for k, v in cfg.items() if k in Route().to_dict()})
+                new_routes[operation] = Route(**merged)
+
+            for operation, route in new_routes.items():
+                for tier in (route.tier, route.escalate_to):
+                    if tier is not None and tier not in new_models:
+                        raise ValueError(f"Nivel de modelo desconocido en '{operation}': {tier}")
+                if route.max_tokens <= 0:
+                    raise ValueError(f"Presupuesto de salida no válido en '{operation}': {route.max_tokens}")
+
+            self.models = new_models
+            self.routes = new_routes
+            if enabled is not None:
+                self.enabled = bool(enabled)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Configuración actual (apta para JSON)."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'models': dict(self.models),
+                'routes': {op: route.to_dict() for op, route in self.routes.items()},
+            }
+
+    def load(self, path: str):
+        """Carga la configuración guardada por save() (un archivo dañado se ignora)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.configure(models=data.get('models'), routes=data.get('routes'), enabled=data.get('enabled'))
+        except Exception as e:
+            print(f"Error al cargar la configuración de modelos: {e}")
+
+    def save(self, path: Optional[str] = None):
+        """Guarda la configuración en un archivo JSON."""
+        path = path or self.path
+        if not path:
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    # ===== ENRUTADO =====
+
+    def route(self, operation: str) -> Route:
+        """Ruta de una operación (la ruta por defecto si no está configurada)."""
+        return self.routes.get(operation) or Route()
+
+    @property
+    def default_model(self) -> str:
+        """Modelo del nivel por defecto."""
+        return self.models[DEFAULT_TIER]
+
+    def model_for(self, operation: str) -> str:
+        """Modelo asignado a una operación."""
+        tier = self.route(operation).tier if self.enabled else DEFAULT_TIER
+        return self.models.get(tier, self.default_model)
+
+    def params(self, operation: str, needed_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Argumentos de messages.create() que dependen de la ruta.
+
+        Args:
+            operation: Nombre de la operación
+            needed_tokens: Tokens de salida que necesita la petición (se limita al presupuesto)
+
+        Returns:
+            Diccionario con model, max_tokens y, si hay, stop_sequences
+        """
+        route = self.route(operation)
+        max_tokens = min(route.max_tokens, needed_tokens) if needed_tokens else route.max_tokens
+        params = {'model': self.model_for(operation), 'max_tokens': max_tokens}
+        if route.stop_sequences:
+            params['stop_sequences'] = list(route.stop_sequences)
+        return params
+
+    def escalation(self, operation: str, request: Dict[str, Any], message) -> Optional[Dict[str, Any]]:
+        """
+        Decide si repetir una petición con un modelo mayor.
+
+        Se escala solo si la herramienta informa de confianza baja; un "no encontrado"
+        con confianza suficiente es una respuesta válida y no se repite.
+
+        Args:
+            operation: Nombre de la operación
+            request: Argumentos enviados
+            message: Respuesta recibida
+
+        Returns:
+            Petición con el modelo escalado o None si no hay que escalar
+        """
+        route = self.route(operation)
+        if not self.enabled or route.escalate_to is None:
+            return None
+        model = self.models.get(route.escalate_to)
+        if not model or model == request.get('model') or not self._low_confidence(message):
+            return None
+
+        with self._lock:
+            self._escalations[operation] = self._escalations.get(operation, 0) + 1
+        escalated = copy.copy(request)
+        escalated['model'] = model
+        return escalated
+
+    @staticmethod
+    def _low_confidence(message) -> bool:
+        """True si los argumentos de la herramienta indican confianza baja."""
+        for block in getattr(message, 'content', None) or []:
+            if getattr(block, 'type', None) != 'tool_use' or not isinstance(block.input, dict):
+                continue
+            items = block.input.get('elements')
+            for item in items if isinstance(items, list) else [block.input]:
+                if not isinstance(item, dict):
+                    continue
+                if item.get('confidence') in ESCALATE_ON_CONFIDENCE:
+                    return True
+        return False
+
+    # ===== ESTADÍSTICAS =====
+
+    def record(self, operation: str, model: str, seconds: float):
+        """
+        Registra la latencia de una petición de la ruta.
+
+        Args:
+            operation: Nombre de la operación
+            model: Modelo usado
+            seconds: Duración de la petición
+        """
+        with self._lock:
+            by_model = self._latencies.setdefault(operation, {})
+            by_model.setdefault(model, deque(maxlen=self.max_samples)).append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas por ruta.
+
+        Returns:
+            Diccionario operación -> modelo actual, llamadas, escalados y latencias p50/p95 por modelo
+        """
+        with self._lock:
+            result = {}
+            for operation in sorted(set(self.routes) | set(self._latencies)):
+                by_model = self._latencies.get(operation, {})
+                all_values = sorted(v for values in by_model.values() for v in values)
+                result[operation] = {
+                    'model': self.model_for(operation),
+                    'calls': len(all_values),
+                    'escalations': self._escalations.get(operation, 0),
+                    'latency': {
+                        'p50': round(percentile(all_values, 0.50), 4),
+                        'p95': round(percentile(all_values, 0.95), 4),
+                    },
+                    'by_model': {
+                        model: {
+                            'calls': len(values),
+                            'p50': round(percentile(sorted(values), 0.50), 4),
+                            'p95': round(percentile(sorted(values), 0.95), 4),
+                        }
+                        for model, values in by_model.items()
+                    },
+                }
+            return result
+
+
+# Función de prueba
+if __name__ == "__main__":
+    router = ModelRouter.from_env()
+
+    for operation in DEFAULT_ROUTES:
+        print(f"{operation}: {router.params(operation)}")
+
+    router.configure(routes={'analyze_screen': {'tier': 'fast', 'stop_sequences': ['\n\n\n']}})
+    print(f"analyze_screen tras configurar: {router.params('analyze_screen')}")
+    print(json.dumps(router.to_dict(), indent=2))
@@ -0,0 +1,564 @@
+"""
+Módulo de control de peticiones a la API de Claude.
+Limita la tasa (token bucket) y la concurrencia, reintenta con backoff exponencial
+con jitter respetando retry-after y, opcionalmente, duplica (hedging) las peticiones
+críticas en latencia que tardan demasiado.
+"""
+
+import anthropic
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FuturesTimeout, wait
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+
+# Códigos HTTP que indican un fallo transitorio (529 = API sobrecargada)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class GovernorTimeout(RuntimeError):
+    """No se obtuvo turno para llamar a la API dentro del tiempo de espera."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Indica si un error de la API es transitorio y merece reintentarse.
+
+    Args:
+        error: Excepción lanzada por el cliente
+
+    Returns:
+        True para límites de tasa, sobrecarga, errores 5xx y fallos de conexión
+    """
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    Obtiene la espera indicada por el servidor (cabeceras retry-after-ms / retry-after).
+
+    Args:
+        error: Excepción lanzada por el cliente
+
+    Returns:
+        Segundos a esperar o None si el servidor no lo indica
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    for header, factor in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * factor)
+        except ValueError:
+            # retry-after también puede ser una fecha HTTP: usar el backoff normal
+            continue
+    return None
+
+
+class TokenBucket:
+    """Limitador de tasa tipo token bucket, seguro entre hilos."""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Tokens (peticiones) que se reponen por segundo
+            capacity: Máximo de tokens acumulables (ráfaga permitida)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Repone los tokens según el tiempo transcurrido (requiere el lock)."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Reserva un token, aunque todavía no esté disponible.
+
+        Las reservas se atienden en orden: cada una deja el saldo en negativo y
+        devuelve lo que hay que esperar hasta que el token exista.
+
+        Args:
+            max_wait: Espera máxima aceptable en segundos
+
+        Returns:
+            Segundos a esperar antes de hacer la petición, o None si superaría max_wait
+        """
+        with self._lock:
+            self._refill()
+            wait_seconds = max(0.0, (1 - self._tokens) / self.rate)
+            if wait_seconds > max_wait:
+                return None
+            self._tokens -= 1
+            return wait_seconds
+
+    def try_take(self) -> bool:
+        """Toma un token solo si está disponible ahora mismo."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class RequestGovernor:
+    """
+    Controlador compartido de las llamadas a la API.
+
+    Una misma instancia puede compartirse entre varios AIVision (síncronos y
+    asíncronos) para aplicar un único límite de tasa y de concurrencia.
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: Optional[float] = 50,
+                 burst: int = 5, max_retries: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 20.0, queue_timeout: float = 30.0,
+                 hedge_after: Optional[float] = None,
+                 hedged_operations: Iterable[str] = ('find_element',)):
+        """
+        Args:
+            max_concurrency: Número máximo de peticiones simultáneas
+            requests_per_minute: Límite de peticiones por minuto (None para no limitar)
+            burst: Peticiones que pueden salir seguidas antes de aplicar el límite de tasa
+            max_retries: Reintentos ante errores transitorios
+            base_delay: Espera base del backoff exponencial en segundos
+            max_delay: Espera máxima entre reintentos en segundos
+            queue_timeout: Tiempo máximo de espera en cola antes de fallar
+            hedge_after: Segundos tras los que se lanza una petición duplicada para las
+                         operaciones de hedged_operations (None para desactivar)
+            hedged_operations: Operaciones críticas en latencia que admiten duplicado
+        """
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self.hedge_after = hedge_after
+        self.hedged_operations = set(hedged_operations)
+
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst) if requests_per_minute else None
+
+        self._active = 0
+        self._condition = threading.Condition()
+        # Esperas asíncronas de un hueco (bucle, futuro): se despiertan al liberar uno
+        self._async_waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        # Los hilos del ejecutor se crean al primer uso (solo con hedging)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix='hedge')
+        self._stats_lock = threading.Lock()
+
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    # ===== CONCURRENCIA Y TASA =====
+
+    def _try_acquire_slot(self) -> bool:
+        """Ocupa un hueco de concurrencia si hay alguno libre."""
+        with self._condition:
+            if self._active < self.max_concurrency:
+                self._active += 1
+                return True
+            return False
+
+    def _acquire_slot(self, timeout: float) -> bool:
+        """Espera un hueco de concurrencia durante como mucho timeout segundos."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._active >= self.max_concurrency:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._active += 1
+            return True
+
+    async def _aacquire_slot(self, timeout: float) -> bool:
+        """Versión asíncrona de _acquire_slot() (espera sin bloquear ni sondear el event loop)."""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                if self._active < self.max_concurrency:
+                    self._active += 1
+                    return True
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    return False
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                return self._try_acquire_slot()
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _release_slot(self):
+        """Libera un hueco de concurrencia y despierta a quien lo espera (hilos y corrutinas)."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+            # Las corrutinas despertadas vuelven a competir por el hueco; si lo pierden, esperan de nuevo
+            while self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_resolve_waiter, waiter)
+                except RuntimeError:
+                    # Bucle ya cerrado: nadie espera ese futuro
+                    continue
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _timeout(self, reason: str) -> GovernorTimeout:
+        self._count('timeouts')
+        return GovernorTimeout(f"{reason} tras {self.queue_timeout:.0f} s en cola")
+
+    def _acquire(self):
+        """
+        Reserva un hueco de concurrencia y un token de tasa (el hueco queda ocupado
+        hasta llamar a _release_slot()).
+
+        Raises:
+            GovernorTimeout: Si no hay turno dentro de queue_timeout
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        if not self._acquire_slot(self.queue_timeout):
+            raise self._timeout("Demasiadas peticiones simultáneas a la API")
+        try:
+            if self.bucket is not None:
+                wait_seconds = self.bucket.reserve(max(0.0, deadline - time.monotonic()))
+                if wait_seconds is None:
+                    raise self._timeout("Límite de peticiones por minuto alcanzado")
+                if wait_seconds:
+                    time.sleep(wait_seconds)
+        except BaseException:
+            self._release_slot()
+            raise
+
+    @contextmanager
+    def limit(self):
+        """
+        Reserva un hueco de concurrencia y un token de tasa durante el bloque.
+
+        Raises:
+            GovernorTimeout: Si no hay turno dentro de queue_timeout
+        """
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    async def _aacquire(self):
+        """Versión asíncrona de _acquire() (no bloquea el event loop)."""
+        deadline = time.monotonic() + self.queue_timeout
+        if not await self._aacquire_slot(self.queue_timeout):
+            raise self._timeout("Demasiadas peticiones simultáneas a la API")
+        try:
+            if self.bucket is not None:
+                wait_seconds = self.bucket.reserve(max(0.0, deadline - time.monotonic()))
+                if wait_seconds is None:
+                    raise self._timeout("Límite de peticiones por minuto alcanzado")
+                if wait_seconds:
+                    await asyncio.sleep(wait_seconds)
+        except BaseException:
+            self._release_slot()
+            raise
+
+    @asynccontextmanager
+    async def alimit(self):
+        """Versión asíncrona de limit() (no bloquea el event loop)."""
+        await self._aacquire()
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    def _try_acquire_extra(self) -> bool:
+        """Reserva hueco y token para un duplicado solo si están libres ahora mismo."""
+        if not self._try_acquire_slot():
+            return False
+        if self.bucket is not None and not self.bucket.try_take():
+            self._release_slot()
+            return False
+        return True
+
+    # ===== REINTENTOS =====
+
+    def backoff_delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """
+        Calcula la espera antes de un reintento.
+
+        Args:
+            attempt: Número de reintento (desde 0)
+            error: Error que provocó el reintento (para leer retry-after)
+
+        Returns:
+            Segundos a esperar (retry-after se limita a max_delay)
+        """
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            # Respetar al servidor (sin pasar de max_delay: un valor enorme no debe dejar
+            # el hilo dormido), con un pequeño jitter para no sincronizar clientes
+            return min(retry_after, self.max_delay) + random.uniform(0, self.base_delay)
+        # Backoff exponencial con jitter completo
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _retry_delay(self, operation: str, attempt: int, error: BaseException) -> float:
+        """
+        Decide si se reintenta un error y cuánto esperar.
+
+        Returns:
+            Segundos a esperar antes del reintento
+
+        Raises:
+            Exception: El propio error si no es transitorio o se agotaron los reintentos
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            raise error
+        delay = self.backoff_delay(attempt, error)
+        self._count('retries')
+        print(f"Error transitorio en {operation} ({type(error).__name__}); reintentando en {delay:.1f}s")
+        return delay
+
+    def _should_hedge(self, operation: str) -> bool:
+        return self.hedge_after is not None and operation in self.hedged_operations
+
+    def call(self, operation: str, func: Callable[[], Any]) -> Any:
+        """
+        Ejecuta una petición respetando los límites y reintentando los errores transitorios.
+
+        Args:
+            operation: Nombre de la operación (decide si se usa hedging)
+            func: Función sin argumentos que hace la petición
+
+        Returns:
+            Resultado de func()
+
+        Raises:
+            GovernorTimeout: Si no hay turno dentro de queue_timeout
+            Exception: El último error si se agotan los reintentos o no es transitorio
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._should_hedge(operation):
+                    # El hueco pasa a la petición principal: se libera cuando termina ella,
+                    # aunque gane el duplicado y la llamada ya haya devuelto el resultado
+                    self._acquire()
+                    return self._call_hedged(func)
+                with self.limit():
+                    return func()
+            except GovernorTimeout:
+                raise
+            except Exception as e:
+                time.sleep(self._retry_delay(operation, attempt, e))
+
+    def _call_hedged(self, func: Callable[[], Any]) -> Any:
+        """
+        Ejecuta func() y lanza un duplicado si no responde en hedge_after segundos.
+
+        Recibe ya ocupado el hueco de la petición principal. Cada petición libera su
+        hueco al terminar, de modo que la perdedora, que sigue en curso, cuenta para
+        max_concurrency hasta que acaba.
+        """
+        try:
+            primary = self._executor.submit(func)
+        except BaseException:
+            self._release_slot()
+            raise
+        primary.add_done_callback(lambda _: self._release_slot())
+
+        try:
+            return primary.result(timeout=self.hedge_after)
+        except FuturesTimeout:
+            pass
+
+        # Solo duplicar si no hay que esperar turno: el duplicado no debe encolar a otros
+        if not self._try_acquire_extra():
+            return primary.result()
+
+        self._count('hedges')
+        secondary = self._executor.submit(func)
+        secondary.add_done_callback(lambda _: self._release_slot())
+
+        done, _ = wait([primary, secondary], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is None:
+            if first is secondary:
+                self._count('hedge_wins')
+            return first.result()
+
+        other = secondary if first is primary else primary
+        return other.result()
+
+    async def acall(self, operation: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Versión asíncrona de call().
+
+        Args:
+            operation: Nombre de la operación
+            factory: Función sin argumentos que devuelve la corrutina de la petición
+                     (se llama una vez por intento)
+
+        Returns:
+            Resultado de la petición
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.alimit():
+                    if self._should_hedge(operation):
+                        return await self._acall_hedged(factory)
+                    return await factory()
+            except GovernorTimeout:
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(operation, attempt, e))
+
+    async def _acall_hedged(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Versión asíncrona de _call_hedged(); el duplicado perdedor se cancela."""
+        primary = asyncio.ensure_future(factory())
+        tasks = [primary]
+        extra_acquired = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done and self._try_acquire_extra():
+                extra_acquired = True
+                self._count('hedges')
+                tasks.append(asyncio.ensure_future(factory()))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if extra_acquired:
+                self._release_slot()
+
+    # ===== STREAMING =====
+
+    @contextmanager
+    def stream(self, operation: str, open_stream: Callable[[], Any]):
+        """
+        Abre un stream respetando los límites y reintentando los errores transitorios
+        al abrirlo (429, 529...), igual que call(). El hueco queda ocupado mientras dura el bloque.
+
+        Solo se reintenta la apertura: los errores posteriores al primer evento se propagan,
+        porque el consumidor ya ha recibido (y quizá ejecutado) parte de la respuesta.
+        Los streams no usan hedging.
+
+        Args:
+            operation: Nombre de la operación
+            open_stream: Función sin argumentos que devuelve el gestor de contexto del stream
+                         (p. ej. lambda: client.messages.stream(**request))
+
+        Yields:
+            El stream abierto
+
+        Raises:
+            GovernorTimeout: Si no hay turno dentro de queue_timeout
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                manager = open_stream()
+                stream = manager.__enter__()
+                break
+            except Exception as e:
+                self._release_slot()
+                time.sleep(self._retry_delay(operation, attempt, e))
+                attempt += 1
+
+        with ExitStack() as stack:
+            stack.callback(self._release_slot)
+            stack.push(manager)
+            yield stream
+
+    @asynccontextmanager
+    async def astream(self, operation: str, open_stream: Callable[[], Any]):
+        """Versión asíncrona de stream(); open_stream devuelve un gestor de contexto asíncrono."""
+        attempt = 0
+        while True:
+            await self._aacquire()
+            try:
+                manager = open_stream()
+                stream = await manager.__aenter__()
+                break
+            except Exception as e:
+                self._release_slot()
+                await asyncio.sleep(self._retry_delay(operation, attempt, e))
+                attempt += 1
+
+        async with AsyncExitStack() as stack:
+            stack.callback(self._release_slot)
+            stack.push_async_exit(manager)
+            yield stream
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado del controlador.
+
+        Returns:
+            Diccionario con peticiones en curso, reintentos, duplicados y esperas agotadas
+        """
+        with self._stats_lock:
+            return {
+                'in_flight': self._active,
+                'max_concurrency': self.max_concurrency,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'timeouts': self.timeouts,
+            }
+
+
+def _resolve_waiter(waiter: asyncio.Future):
+    """Despierta una espera asíncrona de hueco (en el hilo de su event loop)."""
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# Función de prueba
+if __name__ == "__main__":
+    governor = RequestGovernor(max_concurrency=2, requests_per_minute=600, burst=2, base_delay=0.1)
+    attempts = []
+
+    def flaky_request():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise anthropic.APIConnectionError(request=None)
+        return "respuesta"
+
+    print(f"Resultado: {governor.call('analyze_screen', flaky_request)} tras {len(attempts)} intentos")
+    print(f"Estadísticas: {governor.stats()}")
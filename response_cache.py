@@ -0,0 +1,392 @@
+"""
+Módulo de caché de respuestas de la IA basado en la huella visual de la pantalla.
+Evita repetir llamadas a la API cuando la pantalla no ha cambiado desde una petición idéntica,
+y agrupa las peticiones idénticas simultáneas en una sola llamada (single-flight).
+"""
+
+from PIL import Image
+from collections import OrderedDict
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from frame import gray_array
+
+
+# Ancho en celdas por defecto de la huella perceptual
+DEFAULT_HASH_WIDTH = 64
+
+
+def image_fingerprint(image: Image.Image, hash_width: int = DEFAULT_HASH_WIDTH) -> bytes:
+    """
+    Calcula la huella perceptual de una imagen.
+
+    La imagen se reduce a una miniatura en escala de grises y cada celda se
+    cuantiza a 16 niveles, de modo que el ruido de compresión o antialiasing
+    no altera la huella.
+
+    Args:
+        image: Imagen PIL o Frame (en un Frame se reutiliza su escala de grises)
+        hash_width: Ancho en celdas de la miniatura
+
+    Returns:
+        Bytes con un valor cuantizado por celda
+    """
+    width, height = image.size
+    hash_height = max(1, round(hash_width * height / width))
+    thumbnail = Image.fromarray(gray_array(image)).resize((hash_width, hash_height), Image.BOX)
+    return bytes(value >> 4 for value in thumbnail.tobytes())
+
+
+def fingerprint_distance(a: bytes, b: bytes) -> float:
+    """Fracción de celdas distintas entre dos huellas."""
+    if len(a) != len(b):
+        return 1.0
+    if a == b:
+        return 0.0
+    changed = sum(1 for x, y in zip(a, b) if x != y)
+    return changed / len(a)
+
+
+def request_key(method: str, model: str, *params: Any, size: Tuple[int, int] = (0, 0)) -> str:
+    """
+    Construye la clave de una petición (sin la huella de la imagen).
+
+    Args:
+        method: Nombre del método de AIVision
+        model: Modelo usado
+        *params: Prompt y demás parámetros que afectan a la respuesta
+        size: Tamaño de la imagen original (las coordenadas dependen de él)
+
+    Returns:
+        Clave en texto
+    """
+    raw = repr((method, model, params, tuple(size)))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class CacheEntry:
+    """Entrada de la caché: huella de la pantalla, respuesta y momento de creación."""
+
+    def __init__(self, fingerprint: bytes, value: Any, created_at: float):
+        self.fingerprint = fingerprint
+        self.value = value
+        self.created_at = created_at
+
+
+class ResponseCache:
+    """Caché LRU + TTL de respuestas indexada por huella perceptual de la captura."""
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 300.0,
+                 tolerance: float = 0.005, hash_width: int = DEFAULT_HASH_WIDTH):
+        """
+        Args:
+            max_entries: Número máximo de respuestas guardadas (LRU)
+            ttl_seconds: Tiempo de vida de cada respuesta en segundos
+            tolerance: Fracción máxima de celdas de la huella que pueden diferir
+                       (cursor parpadeante, reloj, etc.) para considerar la pantalla igual
+            hash_width: Ancho en celdas de la miniatura usada como huella
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.tolerance = tolerance
+        self.hash_width = hash_width
+
+        self._entries: "OrderedDict[Tuple[str, int], CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fingerprint(self, image: Image.Image) -> bytes:
+        """
+        Calcula la huella perceptual de una imagen con el ancho configurado.
+
+        Args:
+            image: Imagen PIL
+
+        Returns:
+            Bytes con un valor cuantizado por celda
+        """
+        return image_fingerprint(image, self.hash_width)
+
+    def make_key(self, method: str, model: str, *params: Any, size: Tuple[int, int] = (0, 0)) -> str:
+        """
+        Construye la clave de una petición (sin la huella de la imagen).
+
+        Args:
+            method: Nombre del método de AIVision
+            model: Modelo usado
+            *params: Prompt y demás parámetros que afectan a la respuesta
+            size: Tamaño de la imagen original (las coordenadas dependen de él)
+
+        Returns:
+            Clave en texto
+        """
+        return request_key(method, model, *params, size=size)
+
+    def _distance(self, a: bytes, b: bytes) -> float:
+        """Fracción de celdas distintas entre dos huellas."""
+        return fingerprint_distance(a, b)
+
+    def get(self, key: str, fingerprint: bytes) -> Optional[CacheEntry]:
+        """
+        Busca una respuesta para la clave y una pantalla equivalente.
+
+        Args:
+            key: Clave devuelta por make_key()
+            fingerprint: Huella de la captura actual
+
+        Returns:
+            Copia de la entrada encontrada o None si no hay coincidencia válida
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            for entry_key in reversed(self._entries):
+                if entry_key[0] != key:
+                    continue
+                entry = self._entries[entry_key]
+                if self._distance(entry.fingerprint, fingerprint) <= self.tolerance:
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return CacheEntry(entry.fingerprint, copy.deepcopy(entry.value), entry.created_at)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, fingerprint: bytes, value: Any):
+        """
+        Guarda una respuesta en la caché.
+
+        Args:
+            key: Clave devuelta por make_key()
+            fingerprint: Huella de la captura usada en la petición
+            value: Respuesta a guardar
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Reemplazar una entrada equivalente en lugar de duplicarla
+            for entry_key in list(self._entries):
+                if entry_key[0] == key and self._entries[entry_key].fingerprint == fingerprint:
+                    del self._entries[entry_key]
+
+            self._next_id += 1
+            self._entries[(key, self._next_id)] = CacheEntry(fingerprint, copy.deepcopy(value), now)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _purge_expired(self, now: float):
+        """Elimina las entradas que superaron su tiempo de vida (requiere el lock)."""
+        if self.ttl_seconds is None:
+            return
+        expired: List[Tuple[str, int]] = [
+            entry_key for entry_key, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for entry_key in expired:
+            del self._entries[entry_key]
+            self.evictions += 1
+
+    def clear(self):
+        """Vacía la caché (los contadores se mantienen)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Obtiene los contadores de la caché.
+
+        Returns:
+            Diccionario con aciertos, fallos, tasa de acierto, tamaño y desalojos
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'evictions': self.evictions,
+            }
+
+
+class _Flight:
+    """Petición en curso a la que se pueden unir otras idénticas."""
+
+    def __init__(self, fingerprint: bytes):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        # Versión asíncrona: tarea compartida y número de corrutinas esperándola
+        self.task: Optional["asyncio.Task"] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa peticiones idénticas simultáneas (misma clave y pantalla equivalente).
+
+    La primera petición (líder) llama a la API; las que llegan mientras está en curso
+    esperan su resultado en lugar de repetir la llamada. Cada una recibe una copia.
+    """
+
+    def __init__(self, tolerance: float = 0.005):
+        """
+        Args:
+            tolerance: Fracción máxima de celdas de la huella que pueden diferir
+                       para considerar que dos peticiones son sobre la misma pantalla
+        """
+        self.tolerance = tolerance
+
+        self._flights: Dict[str, List[_Flight]] = {}
+        self._async_flights: Dict[Tuple[int, str], List[_Flight]] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _find(self, flights: List[_Flight], fingerprint: bytes) -> Optional[_Flight]:
+        """Busca una petición en curso sobre una pantalla equivalente (requiere el lock)."""
+        for flight in flights:
+            if fingerprint_distance(flight.fingerprint, fingerprint) <= self.tolerance:
+                return flight
+        return None
+
+    def do(self, key: str, fingerprint: bytes, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Ejecuta la petición o se une a una idéntica en curso.
+
+        Args:
+            key: Clave de la petición (request_key())
+            fingerprint: Huella de la captura
+            func: Función sin argumentos que hace la petición
+
+        Returns:
+            Tupla (resultado, compartido); compartido es True si se reutilizó otra petición
+        """
+        with self._lock:
+            flights = self._flights.setdefault(key, [])
+            flight = self._find(flights, fingerprint)
+            shared = flight is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                flight = _Flight(fingerprint)
+                flights.append(flight)
+                self.leaders += 1
+
+        if shared:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.value), True
+
+        try:
+            value = func()
+            # Copia para los que esperan: el líder puede modificar su resultado
+            flight.value = copy.deepcopy(value)
+            return value, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._remove(self._flights, key, flight)
+            flight.done.set()
+
+    async def ado(self, key: str, fingerprint: bytes,
+                  factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Versión asíncrona de do(): las corrutinas idénticas esperan la misma tarea.
+
+        Si todas las corrutinas que esperan se cancelan, la petición también se cancela.
+
+        Args:
+            key: Clave de la petición (request_key())
+            fingerprint: Huella de la captura
+            factory: Función sin argumentos que devuelve la corrutina de la petición
+
+        Returns:
+            Tupla (resultado, compartido)
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            flights = self._async_flights.setdefault(loop_key, [])
+            flight = self._find(flights, fingerprint)
+            shared = flight is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                flight = _Flight(fingerprint)
+                flight.task = asyncio.ensure_future(factory())
+                flight.task.add_done_callback(
+                    lambda _: self._remove(self._async_flights, loop_key, flight)
+                )
+                flights.append(flight)
+                self.leaders += 1
+            flight.waiters += 1
+
+        try:
+            value = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                flight.waiters -= 1
+                if flight.waiters == 0:
+                    flight.task.cancel()
+            raise
+        return copy.deepcopy(value), shared
+
+    def _remove(self, table: Dict, key: Any, flight: _Flight):
+        """Quita una petición terminada para que las siguientes vuelvan a llamar a la API."""
+        with self._lock:
+            flights = table.get(key)
+            if flights and flight in flights:
+                flights.remove(flight)
+                if not flights:
+                    del table[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Obtiene los contadores de agrupación.
+
+        Returns:
+            Diccionario con peticiones líder, agrupadas, tasa de agrupación y en curso
+        """
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_rate': self.coalesced / total if total else 0.0,
+                'in_flight': sum(len(f) for f in self._flights.values())
+                             + sum(len(f) for f in self._async_flights.values()),
+            }
+
+
+# Función de prueba
+if __name__ == "__main__":
+    from PIL import ImageDraw
+
+    cache = ResponseCache()
+
+    img = Image.new('RGB', (1920, 1080), color='white')
+    draw = ImageDraw.Draw(img)
+    draw.text((50, 50), "Pantalla de prueba", fill='black')
+
+    key = cache.make_key('analyze_screen', 'modelo', 'prompt', size=img.size)
+    cache.put(key, cache.fingerprint(img), "Respuesta guardada")
+
+    # Simular un cursor parpadeante
+    img2 = img.copy()
+    ImageDraw.Draw(img2).rectangle((300, 300, 302, 320), fill='black')
+
+    entry = cache.get(key, cache.fingerprint(img2))
+    print(f"Respuesta con cursor distinto: {entry.value if entry else None}")
+    print(f"Estadísticas: {cache.stats()}")
@@ -1,24 +1,281 @@
 """
 Módulo para captura de pantalla y gestión de ventanas.
 Permite capturar screenshots, listar ventanas y obtener información sobre aplicaciones abiertas.
+Con varios monitores captura cada uno en paralelo y puede unirlos en el escritorio virtual.
 """
 
 import mss
 import mss.tools
 from PIL import Image
 import pygetwindow as gw
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import io
+import os
 import base64
-from typing import List, Dict, Optional, Tuple
+import threading
+import time
+from typing import Any, Callable, Deque, List, Dict, Optional, Tuple
 import platform
+import numpy as np
+
+from frame import Frame
+from image_diff import TileDiff, TileDiffResult
+
+
+# Índices de mss: 0 es el escritorio virtual completo y 1 el monitor principal
+VIRTUAL_DESKTOP = 0
+PRIMARY_MONITOR = 1
+
+
+# Memoria máxima del búfer de captura continua: unas 30 capturas 1080p o 7 capturas 4K
+# (cada captura ocupa ancho x alto x 4 bytes en BGRA: unos 8 MB en 1080p y 33 MB en 4K)
+DEFAULT_RING_MAX_BYTES = 256 * 1024 * 1024
+
+
+def default_capture_workers() -> int:
+    """Hilos de captura por defecto: uno por núcleo, entre 2 y 8 (cada uno mantiene su instancia de mss)."""
+    return min(8, max(2, os.cpu_count() or 1))
+
+
+class FrameRing:
+    """Búfer circular de capturas con marca de tiempo, seguro entre hilos."""
+
+    def __init__(self, capacity: int = 30, max_bytes: Optional[int] = DEFAULT_RING_MAX_BYTES):
+        """
+        Args:
+            capacity: Número máximo de capturas guardadas (las más antiguas se descartan)
+            max_bytes: Memoria máxima de las capturas guardadas (None para no limitarla);
+                       siempre se conserva al menos la más reciente
+        """
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._frames: Deque[Frame] = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria ocupada por los píxeles de las capturas guardadas."""
+        with self._lock:
+            return self._bytes
+
+    @staticmethod
+    def _frame_bytes(frame: Frame) -> int:
+        return frame.width * frame.height * 4
+
+    def append(self, frame: Frame):
+        """Añade una captura (descarta las más antiguas si se supera capacity o max_bytes)."""
+        with self._lock:
+            self._frames.append(frame)
+            self._bytes += self._frame_bytes(frame)
+            while len(self._frames) > 1 and (
+                    len(self._frames) > self.capacity
+                    or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._bytes -= self._frame_bytes(self._frames.popleft())
+
+    def latest(self, max_age_ms: Optional[float] = None) -> Optional[Frame]:
+        """
+        Obtiene la captura más reciente.
+
+        Args:
+            max_age_ms: Antigüedad máxima en milisegundos (None para no limitar)
+
+        Returns:
+            Frame o None si no hay ninguna captura suficientemente reciente
+        """
+        with self._lock:
+            frame = self._frames[-1] if self._frames else None
+        if frame is None or (max_age_ms is not None and (time.time() - frame.timestamp) * 1000 > max_age_ms):
+            return None
+        return frame
+
+    def frames_since(self, timestamp: float) -> List[Frame]:
+        """
+        Obtiene las capturas posteriores a un instante, de la más antigua a la más reciente.
+
+        Args:
+            timestamp: Instante (time.time())
+
+        Returns:
+            Lista de Frames con timestamp mayor que el indicado
+        """
+        with self._lock:
+            return [frame for frame in self._frames if frame.timestamp > timestamp]
+
+    def clear(self):
+        """Descarta todas las capturas."""
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+
+class MssPool:
+    """
+    Instancias de mss por hilo.
+
+    Una instancia de mss no se puede compartir entre hilos (en Windows los contextos
+    GDI y en Linux la conexión con X pertenecen al hilo que la creó), así que cada hilo
+    obtiene la suya. La consulta habitual solo lee un atributo del hilo (sin bloqueo);
+    el bloqueo se usa únicamente al crear una instancia, y las de los hilos que ya
+    terminaron se cierran entonces.
+    """
+
+    def __init__(self, factory=None):
+        """
+        Args:
+            factory: Función que crea una instancia de mss (por defecto mss.mss)
+        """
+        self._factory = factory or mss.mss
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._instances: Dict[int, Tuple[threading.Thread, Any]] = {}
+        self._stats = {'created': 0, 'closed': 0}
+
+    def get(self):
+        """Instancia de mss del hilo actual (se crea la primera vez)."""
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            return sct
+        return self._create()
+
+    def _create(self):
+        """Crea la instancia del hilo actual y cierra las de hilos terminados."""
+        sct = self._factory()
+        thread = threading.current_thread()
+        with self._lock:
+            stale = self._take_dead_locked()
+            self._instances[thread.ident] = (thread, sct)
+            self._stats['created'] += 1
+        self._local.sct = sct
+        self._close_all(stale)
+        return sct
+
+    def _take_dead_locked(self) -> List[Any]:
+        """Retira del registro las instancias de hilos terminados (con el bloqueo tomado)."""
+        dead = [ident for ident, (thread, _) in self._instances.items() if not thread.is_alive()]
+        return [self._instances.pop(ident)[1] for ident in dead]
+
+    def _close_all(self, instances: List[Any]):
+        """Cierra instancias de mss ignorando los errores."""
+        for sct in instances:
+            try:
+                sct.close()
+            except Exception as e:
+                print(f"Error al cerrar mss: {e}")
+        if instances:
+            with self._lock:
+                self._stats['closed'] += len(instances)
+
+    def release(self):
+        """Cierra la instancia del hilo actual (p. ej. al terminar un hilo de trabajo)."""
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            return
+        self._local.sct = None
+        with self._lock:
+            self._instances.pop(threading.current_thread().ident, None)
+        self._close_all([sct])
+
+    def close(self):
+        """Cierra todas las instancias (los hilos que sigan vivos crearán otra si la piden)."""
+        with self._lock:
+            instances = [sct for _, sct in self._instances.values()]
+            self._instances.clear()
+        self._local = threading.local()
+        self._close_all(instances)
+
+    def stats(self) -> Dict[str, int]:
+        """Instancias abiertas, creadas y cerradas (cierra antes las de hilos terminados)."""
+        with self._lock:
+            stale = self._take_dead_locked()
+        self._close_all(stale)
+        with self._lock:
+            return {'open': len(self._instances), **self._stats}
+
 
 class ScreenCapture:
     """Clase para manejar capturas de pantalla y gestión de ventanas."""
 
-    def __init__(self):
-        self.sct = mss.mss()
+    def __init__(self, capture_workers: Optional[int] = None):
+        """
+        Args:
+            capture_workers: Hilos fijos que hacen las capturas pedidas desde otros hilos
+                             (por defecto default_capture_workers()). Hasta ese número de
+                             capturas simultáneas se hacen en paralelo; las demás esperan turno
+        """
+        # Una instancia de mss por hilo de captura. Los demás hilos (las peticiones de
+        # Flask, los hilos de trabajo) no crean la suya: capturan a través de los hilos
+        # fijos de _with_sct(), así que el número de instancias no crece con las peticiones
+        self.mss_pool = MssPool()
+        self.capture_workers = capture_workers or default_capture_workers()
+        self._capture_local = threading.local()
+        self._capture_executor: Optional[ThreadPoolExecutor] = None
         self.is_windows = platform.system() == 'Windows'
 
+        # Captura continua en segundo plano (opcional, ver start_continuous_capture)
+        self.ring: Optional[FrameRing] = None
+        self._capture_thread: Optional[threading.Thread] = None
+        self._capture_stop = threading.Event()
+        self._capture_fps = 0.0
+        self._capture_stats = {'frames': 0, 'errors': 0, 'grab_seconds': 0.0}
+
+        # Detección de regiones cambiadas entre capturas
+        self.tile_diff = TileDiff()
+
+        # Hilos para capturar los monitores en paralelo (cada uno con su instancia de mss)
+        self._monitor_executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def sct(self):
+        """Instancia de mss del hilo actual."""
+        return self.mss_pool.get()
+
+    def _own_sct(self):
+        """Marca el hilo actual como hilo de captura (usa su propia instancia de mss)."""
+        self._capture_local.owns_sct = True
+
+    def _with_sct(self, func: Callable[[Any], Any]) -> Any:
+        """
+        Ejecuta func(sct) con la instancia de mss de un hilo de captura.
+
+        Los hilos de captura (los fijos, los de monitores y el de captura continua) usan
+        la suya directamente. Desde cualquier otro hilo la llamada se hace en uno de los
+        capture_workers hilos fijos, que reutilizan su instancia entre peticiones; si todos
+        están ocupados, la captura espera a que quede uno libre.
+
+        Args:
+            func: Función que recibe la instancia de mss
+
+        Returns:
+            Resultado de func
+        """
+        if getattr(self._capture_local, 'owns_sct', False):
+            return func(self.sct)
+        with self._executor_lock:
+            if self._capture_executor is None:
+                self._capture_executor = ThreadPoolExecutor(max_workers=self.capture_workers,
+                                                            thread_name_prefix='screen-capture',
+                                                            initializer=self._own_sct)
+            executor = self._capture_executor
+        return executor.submit(lambda: func(self.sct)).result()
+
+    def close(self):
+        """Detiene la captura continua y cierra todas las instancias de mss."""
+        self.stop_continuous_capture()
+        with self._executor_lock:
+            executors = [self._capture_executor, self._monitor_executor]
+            self._capture_executor = self._monitor_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.mss_pool.close()
+
     def get_all_windows(self) -> List[Dict[str, any]]:
         """
         Obtiene una lista de todas las ventanas abiertas.
@@ -41,6 +298,7 @@ class ScreenCapture:
                         'height': window.height,
                         'is_active': window.isActive,
                         'is_maximized': window.isMaximized,
+                        'class_name': self._window_class_name(window),
                         'window_object': window
                     })
         except Exception as e:
@@ -48,6 +306,26 @@ class ScreenCapture:
 
         return windows
 
+    def _window_class_name(self, window) -> str:
+        """
+        Obtiene la clase de una ventana (solo en Windows; vacío en otros sistemas).
+
+        Args:
+            window: Ventana de pygetwindow
+
+        Returns:
+            Nombre de la clase de la ventana o cadena vacía
+        """
+        if not self.is_windows:
+            return ''
+        try:
+            import ctypes
+            buffer = ctypes.create_unicode_buffer(256)
+            ctypes.windll.user32.GetClassNameW(window._hWnd, buffer, 256)
+            return buffer.value
+        except Exception:
+            return ''
+
     def find_window_by_title(self, title_substring: str) -> Optional[Dict[str, any]]:
         """
         Busca una ventana por substring en el título.
@@ -84,17 +362,274 @@ class ScreenCapture:
             print(f"Error al enfocar ventana: {e}")
             return False
 
-    def capture_full_screen(self) -> Image.Image:
+    def capture_full_screen(self, monitor: int = PRIMARY_MONITOR) -> Image.Image:
         """
         Captura la pantalla completa.
 
+        Args:
+            monitor: Monitor a capturar (1 el principal; 0 todos unidos)
+
         Returns:
             Imagen PIL de la captura
         """
-        monitor = self.sct.monitors[1]  # Monitor principal
-        screenshot = self.sct.grab(monitor)
-        img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-        return img
+        if monitor == VIRTUAL_DESKTOP:
+            return self.capture_virtual_desktop().image
+        return self._to_image(self._with_sct(lambda sct: sct.grab(self._monitor_rect(sct, monitor))))
+
+    @staticmethod
+    def _to_image(screenshot) -> Image.Image:
+        """
+        Convierte una captura de mss en imagen PIL RGB.
+
+        Lee directamente el búfer BGRA (una sola copia, en C) en lugar de pasar por
+        screenshot.rgb, que genera antes otra copia convertida.
+        """
+        return Image.frombuffer('RGB', screenshot.size, screenshot.raw, 'raw', 'BGRX', 0, 1)
+
+    @staticmethod
+    def _monitor_rect(sct, monitor: int) -> Dict[str, int]:
+        """
+        Rectángulo de un monitor en el escritorio virtual.
+
+        Raises:
+            ValueError: Si el monitor no existe
+        """
+        if not 0 <= monitor < len(sct.monitors):
+            raise ValueError(f"Monitor inexistente: {monitor} (hay {len(sct.monitors) - 1})")
+        return sct.monitors[monitor]
+
+    @classmethod
+    def _grab_frame(cls, sct, monitor: int = PRIMARY_MONITOR) -> Frame:
+        """Captura un monitor como Frame sobre el búfer de mss (sin convertirlo), con su origen."""
+        rect = cls._monitor_rect(sct, monitor)
+        screenshot = sct.grab(rect)
+        return Frame.from_bgra(screenshot.raw, screenshot.size,
+                               origin=(rect['left'], rect['top']), monitor=monitor)
+
+    def capture_frame(self, monitor: int = PRIMARY_MONITOR) -> Frame:
+        """
+        Captura la pantalla completa como Frame, para que todas las codificaciones
+        de esta captura (API, navegador, caché) se calculen una sola vez.
+
+        El Frame envuelve el búfer BGRA de mss sin copiarlo; la imagen RGB y la
+        escala de grises se generan solo si algún consumidor las pide. Frame.origin
+        indica la posición del monitor en el escritorio virtual, y AIVision la usa
+        para devolver las coordenadas en posiciones globales.
+
+        Args:
+            monitor: Monitor a capturar (1 el principal; 0 todos unidos, ver capture_virtual_desktop)
+
+        Returns:
+            Frame de la captura
+        """
+        if monitor == VIRTUAL_DESKTOP:
+            return self.capture_virtual_desktop()
+        return self._with_sct(lambda sct: self._grab_frame(sct, monitor))
+
+    # ===== VARIOS MONITORES =====
+
+    def get_monitors(self) -> List[Dict[str, Any]]:
+        """
+        Lista los monitores conectados.
+
+        Returns:
+            Lista de diccionarios con index (para capture_frame), left, top, width,
+            height (posición en el escritorio virtual) y primary
+        """
+        return [
+            {'index': index, 'left': rect['left'], 'top': rect['top'],
+             'width': rect['width'], 'height': rect['height'], 'primary': index == PRIMARY_MONITOR}
+            for index, rect in enumerate(self._with_sct(lambda sct: sct.monitors)) if index != VIRTUAL_DESKTOP
+        ]
+
+    def _executor(self) -> ThreadPoolExecutor:
+        """Hilos de captura por monitor (se mantienen para reutilizar sus instancias de mss)."""
+        executor = self._monitor_executor
+        if executor is not None:
+            return executor
+        workers = max(1, len(self.get_monitors()))
+        with self._executor_lock:
+            if self._monitor_executor is None:
+                self._monitor_executor = ThreadPoolExecutor(max_workers=workers,
+                                                            thread_name_prefix='monitor-capture',
+                                                            initializer=self._own_sct)
+            return self._monitor_executor
+
+    def capture_monitors(self, monitors: Optional[List[int]] = None) -> List[Frame]:
+        """
+        Captura varios monitores en paralelo, cada uno en su hilo y con su instancia de mss.
+
+        Args:
+            monitors: Índices de los monitores (por defecto todos)
+
+        Returns:
+            Lista de Frames en el mismo orden, cada uno con su origin y monitor
+        """
+        if monitors is None:
+            monitors = [monitor['index'] for monitor in self.get_monitors()]
+        if len(monitors) == 1:
+            return [self._with_sct(lambda sct: self._grab_frame(sct, monitors[0]))]
+
+        executor = self._executor()
+        futures = [executor.submit(lambda m=m: self._grab_frame(self.sct, m)) for m in monitors]
+        return [future.result() for future in futures]
+
+    def capture_virtual_desktop(self, monitors: Optional[List[int]] = None) -> Frame:
+        """
+        Captura los monitores en paralelo y los une en un Frame del escritorio virtual.
+
+        Las zonas del rectángulo que no cubre ningún monitor quedan en negro. Las
+        coordenadas de la imagen se convierten en globales con Frame.origin.
+
+        Args:
+            monitors: Índices de los monitores a unir (por defecto todos)
+
+        Returns:
+            Frame con la unión de las capturas (monitor 0)
+        """
+        frames = self.capture_monitors(monitors)
+        if len(frames) == 1:
+            return frames[0]
+
+        left = min(frame.origin[0] for frame in frames)
+        top = min(frame.origin[1] for frame in frames)
+        right = max(frame.origin[0] + frame.width for frame in frames)
+        bottom = max(frame.origin[1] + frame.height for frame in frames)
+
+        canvas = np.zeros((bottom - top, right - left, 4), dtype=np.uint8)
+        for frame in frames:
+            x, y = frame.origin[0] - left, frame.origin[1] - top
+            canvas[y:y + frame.height, x:x + frame.width] = frame.bgra
+
+        return Frame(bgra=canvas, timestamp=min(frame.timestamp for frame in frames),
+                     origin=(left, top), monitor=VIRTUAL_DESKTOP)
+
+    # ===== CAPTURA CONTINUA =====
+
+    def start_continuous_capture(self, fps: float = 5.0, capacity: int = 30,
+                                 max_bytes: Optional[int] = DEFAULT_RING_MAX_BYTES):
+        """
+        Inicia un hilo que captura la pantalla completa a ritmo fijo en un búfer circular.
+
+        Las consultas con latest() o frames_since() obtienen entonces una captura
+        reciente sin esperar a mss ni a la conversión de la imagen.
+
+        Args:
+            fps: Capturas por segundo
+            capacity: Capturas guardadas en el búfer (historial de capacity / fps segundos)
+            max_bytes: Memoria máxima del búfer; con capturas grandes guarda menos de capacity
+                       (cada captura ocupa ancho x alto x 4 bytes, unos 33 MB en 4K)
+        """
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return
+        if fps <= 0:
+            raise ValueError("fps debe ser mayor que 0")
+
+        self.ring = FrameRing(capacity, max_bytes)
+        self._capture_fps = fps
+        self._capture_stats = {'frames': 0, 'errors': 0, 'grab_seconds': 0.0}
+        self._capture_stop.clear()
+        self._capture_thread = threading.Thread(target=self._capture_loop, name='continuous-capture', daemon=True)
+        self._capture_thread.start()
+
+    def stop_continuous_capture(self):
+        """Detiene el hilo de captura continua (el búfer conserva las últimas capturas)."""
+        self._capture_stop.set()
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=2.0)
+        self._capture_thread = None
+
+    @property
+    def continuous_capture_active(self) -> bool:
+        """True si el hilo de captura continua está en marcha."""
+        return self._capture_thread is not None and self._capture_thread.is_alive()
+
+    def _capture_loop(self):
+        """Bucle del hilo de captura (con la instancia de mss del propio hilo)."""
+        interval = 1.0 / self._capture_fps
+        self._own_sct()
+        try:
+            sct = self.sct
+            while not self._capture_stop.is_set():
+                start = time.perf_counter()
+                try:
+                    self.ring.append(self._grab_frame(sct))
+                    self._capture_stats['frames'] += 1
+                except Exception as e:
+                    self._capture_stats['errors'] += 1
+                    print(f"Error en la captura continua: {e}")
+                elapsed = time.perf_counter() - start
+                self._capture_stats['grab_seconds'] += elapsed
+                self._capture_stop.wait(max(0.0, interval - elapsed))
+        finally:
+            self.mss_pool.release()
+
+    def latest(self, max_age_ms: Optional[float] = None, monitor: int = PRIMARY_MONITOR) -> Frame:
+        """
+        Obtiene una captura de la pantalla completa con una antigüedad máxima.
+
+        Con la captura continua activa devuelve la última del búfer si es suficientemente
+        reciente; si no (o si la captura continua está parada) captura en el momento.
+
+        Args:
+            max_age_ms: Antigüedad máxima aceptada en milisegundos (None para cualquiera)
+            monitor: Monitor (el búfer solo guarda el principal; los demás se capturan en el momento)
+
+        Returns:
+            Frame de la captura
+        """
+        if monitor == PRIMARY_MONITOR and self.ring is not None and self.continuous_capture_active:
+            frame = self.ring.latest(max_age_ms)
+            if frame is not None:
+                return frame
+        return self.capture_frame(monitor)
+
+    def frames_since(self, timestamp: float) -> List[Frame]:
+        """
+        Obtiene las capturas del búfer posteriores a un instante (p. ej. para comparar
+        el antes y el después de una acción o esperar a que la pantalla se estabilice).
+
+        Args:
+            timestamp: Instante (time.time())
+
+        Returns:
+            Lista de Frames de la más antigua a la más reciente (vacía sin captura continua)
+        """
+        return self.ring.frames_since(timestamp) if self.ring is not None else []
+
+    def changes(self, before: Frame, after: Optional[Frame] = None) -> TileDiffResult:
+        """
+        Detecta qué cambió en la pantalla entre dos capturas.
+
+        Args:
+            before: Captura anterior
+            after: Captura posterior (por defecto la más reciente, ver latest())
+
+        Returns:
+            TileDiffResult con los rectángulos cambiados, la fracción de píxeles
+            cambiados y si la pantalla está estable
+        """
+        return self.tile_diff.compare(before, after if after is not None else self.latest())
+
+    def continuous_capture_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado de la captura continua.
+
+        Returns:
+            Diccionario con estado, fps configurados, capturas, errores, tiempo medio de
+            captura, y capturas y memoria (MB) en el búfer
+        """
+        stats = dict(self._capture_stats)
+        grabs = stats['frames'] + stats['errors']
+        return {
+            'active': self.continuous_capture_active,
+            'fps': self._capture_fps,
+            'frames': stats['frames'],
+            'errors': stats['errors'],
+            'avg_grab_ms': round(stats['grab_seconds'] * 1000 / grabs, 2) if grabs else 0.0,
+            'buffered': len(self.ring) if self.ring is not None else 0,
+            'buffered_mb': round(self.ring.nbytes / 2 ** 20, 1) if self.ring is not None else 0.0,
+        }
 
     def capture_window(self, window_info: Dict[str, any]) -> Optional[Image.Image]:
         """
@@ -113,9 +648,7 @@ class ScreenCapture:
                 'width': window_info['width'],
                 'height': window_info['height']
             }
-            screenshot = self.sct.grab(monitor)
-            img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-            return img
+            return self._to_image(self._with_sct(lambda sct: sct.grab(monitor)))
         except Exception as e:
             print(f"Error al capturar ventana: {e}")
             return None
@@ -139,21 +672,22 @@ class ScreenCapture:
             'width': width,
             'height': height
         }
-        screenshot = self.sct.grab(monitor)
-        img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-        return img
+        return self._to_image(self._with_sct(lambda sct: sct.grab(monitor)))
 
     def image_to_base64(self, image: Image.Image, format: str = 'PNG') -> str:
         """
         Convierte una imagen PIL a base64 para enviar a la API.
 
         Args:
-            image: Imagen PIL
+            image: Imagen PIL o Frame (en un Frame la codificación se memoriza)
             format: Formato de imagen (PNG, JPEG, etc.)
 
         Returns:
             String en base64 de la imagen
         """
+        if isinstance(image, Frame):
+            return image.to_base64(format)
+
         buffered = io.BytesIO()
         image.save(buffered, format=format)
         img_str = base64.b64encode(buffered.getvalue()).decode()
@@ -170,15 +704,18 @@ class ScreenCapture:
         image.save(filepath)
         print(f"Screenshot guardado en: {filepath}")
 
-    def get_screen_size(self) -> Tuple[int, int]:
+    def get_screen_size(self, monitor: int = PRIMARY_MONITOR) -> Tuple[int, int]:
         """
-        Obtiene el tamaño de la pantalla principal.
+        Obtiene el tamaño de una pantalla.
+
+        Args:
+            monitor: Monitor (1 el principal; 0 el escritorio virtual completo)
 
         Returns:
             Tupla (width, height)
         """
-        monitor = self.sct.monitors[1]
-        return (monitor['width'], monitor['height'])
+        rect = self._with_sct(lambda sct: self._monitor_rect(sct, monitor))
+        return (rect['width'], rect['height'])
 
     def print_windows_list(self):
         """Imprime una lista formateada de todas las ventanas abiertas."""
@@ -202,6 +739,12 @@ if __name__ == "__main__":
     screenshot = capture.capture_full_screen()
     capture.save_screenshot(screenshot, "screenshot_full.png")
 
+    # Varios monitores: capturas en paralelo y escritorio virtual completo
+    for monitor in capture.get_monitors():
+        print(f"Monitor {monitor['index']}: {monitor['width']}x{monitor['height']} en ({monitor['left']}, {monitor['top']})")
+    desktop = capture.capture_virtual_desktop()
+    print(f"Escritorio virtual: {desktop.width}x{desktop.height}, origen {desktop.origin}")
+
     # Buscar una ventana específica (ejemplo: Chrome)
     chrome_window = capture.find_window_by_title("Chrome")
     if chrome_window:
@@ -200,15 +200,73 @@ async function captureScreen() {
     }
 }
 
-// Analizar Pantalla
+// Leer eventos Server-Sent Events de una respuesta fetch
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const raw of events) {
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+// Analizar Pantalla (el texto aparece a medida que la IA lo genera)
 async function analyzeScreen() {
     showLoading('Analizando pantalla con IA...');
 
+    const analysisBox = document.getElementById('analysisResult');
+    const paragraph = document.createElement('p');
+    paragraph.style.whiteSpace = 'pre-wrap';
+
     try {
-        const result = await apiCall('/api/ai/analyze', 'POST', {});
-        const analysisBox = document.getElementById('analysisResult');
-        analysisBox.innerHTML = `<p>${result.analysis}</p>`;
-        analysisBox.style.display = 'block';
+        const response = await fetch(API_BASE + '/api/ai/analyze/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({})
+        });
+
+        if (!response.ok) {
+            const result = await response.json();
+            throw new Error(result.error || 'Error desconocido');
+        }
+
+        let streamError = null;
+        let started = false;
+
+        await readEventStream(response, (event, data) => {
+            if (event === 'error') {
+                streamError = data.error;
+            } else if (data.delta) {
+                if (!started) {
+                    // Mostrar el resultado en cuanto llega el primer fragmento
+                    started = true;
+                    hideLoading();
+                    analysisBox.innerHTML = '';
+                    analysisBox.appendChild(paragraph);
+                    analysisBox.style.display = 'block';
+                }
+                paragraph.textContent += data.delta;
+            }
+        });
+
+        if (streamError) throw new Error(streamError);
+
         hideLoading();
         showToast('Análisis completado', 'success');
     } catch (error) {
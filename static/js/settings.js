@@ -166,10 +166,96 @@ async function testConnection() {
     }
 }
 
+// Modelos por Tarea
+const ROUTING_TIERS = ['fast', 'balanced', 'large'];
+
+function tierOptions(selected, allowNone = false) {
+    const options = allowNone ? [''].concat(ROUTING_TIERS) : ROUTING_TIERS;
+    return options.map(tier =>
+        `<option value="${tier}" ${tier === (selected || '') ? 'selected' : ''}>${tier || 'No escalar'}</option>`
+    ).join('');
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+async function loadRouting() {
+    try {
+        const result = await apiCall('/api/config/routing');
+        const routing = result.routing;
+        const stats = result.stats;
+
+        document.getElementById('routingEnabled').checked = routing.enabled;
+        document.getElementById('modelFast').value = routing.models.fast || '';
+        document.getElementById('modelBalanced').value = routing.models.balanced || '';
+        document.getElementById('modelLarge').value = routing.models.large || '';
+
+        const tbody = document.getElementById('routesTableBody');
+        tbody.innerHTML = Object.entries(routing.routes).map(([operation, route]) => {
+            const routeStats = stats[operation] || { calls: 0, escalations: 0, latency: { p50: 0, p95: 0 } };
+            return `
+                <tr data-operation="${operation}">
+                    <td>${operation}</td>
+                    <td><select class="input-field route-tier">${tierOptions(route.tier)}</select></td>
+                    <td><input type="number" min="1" class="input-field route-max-tokens" value="${route.max_tokens}" /></td>
+                    <td><select class="input-field route-escalate">${tierOptions(route.escalate_to, true)}</select></td>
+                    <td><input type="text" class="input-field route-stop" placeholder="separadas por |"
+                               value="${escapeHtml(route.stop_sequences.join('|'))}" /></td>
+                    <td>${routeStats.calls}</td>
+                    <td>${routeStats.escalations}</td>
+                    <td>${routeStats.latency.p50} / ${routeStats.latency.p95}</td>
+                </tr>
+            `;
+        }).join('');
+
+    } catch (error) {
+        showToast('Error al cargar los modelos: ' + error.message, 'error');
+    }
+}
+
+async function saveRouting() {
+    const routes = {};
+    document.querySelectorAll('#routesTableBody tr').forEach(row => {
+        const stop = row.querySelector('.route-stop').value;
+        routes[row.dataset.operation] = {
+            tier: row.querySelector('.route-tier').value,
+            max_tokens: parseInt(row.querySelector('.route-max-tokens').value, 10),
+            escalate_to: row.querySelector('.route-escalate').value || null,
+            stop_sequences: stop ? stop.split('|').filter(item => item) : []
+        };
+    });
+
+    try {
+        await apiCall('/api/config/routing', 'POST', {
+            enabled: document.getElementById('routingEnabled').checked,
+            models: {
+                fast: document.getElementById('modelFast').value.trim(),
+                balanced: document.getElementById('modelBalanced').value.trim(),
+                large: document.getElementById('modelLarge').value.trim()
+            },
+            routes
+        });
+
+        showToast('Modelos guardados correctamente', 'success');
+        loadRouting();
+        loadStatus();
+    } catch (error) {
+        showToast('Error al guardar los modelos: ' + error.message, 'error');
+    }
+}
+
 // Event Listeners
 document.addEventListener('DOMContentLoaded', function() {
     // Cargar estado inicial
     loadStatus();
+    loadRouting();
+
+    // Modelos por tarea
+    document.getElementById('saveRoutingBtn').addEventListener('click', saveRouting);
+    document.getElementById('refreshRoutingBtn').addEventListener('click', loadRouting);
 
     // API Key
     document.getElementById('saveApiKeyBtn').addEventListener('click', saveApiKey);
@@ -0,0 +1,413 @@
+"""
+Módulo de salidas estructuradas de la IA mediante herramientas (tool use).
+Define los esquemas de las respuestas de planificación, localización y verificación,
+y un único modelo de resultado validado compartido por todos ellos.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+CONFIDENCE_LEVELS = ["high", "medium", "low"]
+
+ACTION_TYPES = ["click", "type", "press", "hotkey", "wait", "scroll", "move"]
+
+ACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": ACTION_TYPES},
+        "x": {"type": "integer", "description": "Coordenada X en la imagen"},
+        "y": {"type": "integer", "description": "Coordenada Y en la imagen"},
+        "button": {"type": "string", "enum": ["left", "right", "middle"]},
+        "text": {"type": "string"},
+        "key": {"type": "string"},
+        "keys": {"type": "array", "items": {"type": "string"}},
+        "seconds": {"type": "number"},
+        "amount": {"type": "integer"},
+        "description": {"type": "string"},
+    },
+    "required": ["type", "description"],
+}
+
+ACTION_PLAN_TOOL = {
+    "name": "report_action_plan",
+    "description": "Reporta el análisis de la pantalla y el plan de acciones para cumplir la instrucción.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "analysis": {"type": "string", "description": "Breve análisis de lo que ves en la pantalla"},
+            "strategy": {"type": "string", "description": "Estrategia general para cumplir la instrucción"},
+            "actions": {"type": "array", "items": ACTION_SCHEMA},
+            "warnings": {"type": "array", "items": {"type": "string"}},
+            "success_criteria": {"type": "string", "description": "Cómo saber si se completó exitosamente"},
+        },
+        "required": ["analysis", "strategy", "actions", "warnings", "success_criteria"],
+    },
+}
+
+ELEMENT_LOCATION_TOOL = {
+    "name": "report_element_location",
+    "description": "Reporta la posición del elemento buscado o que no se encontró.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "found": {"type": "boolean"},
+            "x": {"type": "integer", "description": "Coordenada X del centro del elemento"},
+            "y": {"type": "integer", "description": "Coordenada Y del centro del elemento"},
+            "confidence": {"type": "string", "enum": CONFIDENCE_LEVELS},
+            "reason": {"type": "string", "description": "Explicación breve si no se encontró"},
+        },
+        "required": ["found"],
+    },
+}
+
+ELEMENT_REGION_TOOL = {
+    "name": "report_element_region",
+    "description": "Reporta la región aproximada que contiene el elemento buscado o que no se encontró.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "found": {"type": "boolean"},
+            "left": {"type": "integer", "description": "Borde izquierdo de la región"},
+            "top": {"type": "integer", "description": "Borde superior de la región"},
+            "right": {"type": "integer", "description": "Borde derecho de la región"},
+            "bottom": {"type": "integer", "description": "Borde inferior de la región"},
+            "reason": {"type": "string", "description": "Explicación breve si no se encontró"},
+        },
+        "required": ["found"],
+    },
+}
+
+ELEMENTS_LOCATION_TOOL = {
+    "name": "report_elements_locations",
+    "description": "Reporta la posición de cada elemento buscado, en el mismo orden de la lista.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "elements": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {"type": "integer"},
+                        **ELEMENT_LOCATION_TOOL["input_schema"]["properties"],
+                    },
+                    "required": ["index", "found"],
+                },
+            },
+        },
+        "required": ["elements"],
+    },
+}
+
+VERIFICATION_TOOL = {
+    "name": "report_verification",
+    "description": "Reporta si la acción se completó comparando las capturas ANTES y DESPUÉS.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "success": {"type": "boolean"},
+            "changes_detected": {"type": "array", "items": {"type": "string"}},
+            "explanation": {"type": "string"},
+            "confidence": {"type": "string", "enum": CONFIDENCE_LEVELS},
+        },
+        "required": ["success", "changes_detected", "explanation", "confidence"],
+    },
+}
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "number": (int, float),
+    "integer": int,
+}
+
+
+class StructuredOutputError(ValueError):
+    """Error cuando la respuesta no contiene datos válidos para el esquema."""
+
+
+def tool_choice(tool: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Construye el tool_choice que obliga al modelo a responder con una herramienta.
+
+    Args:
+        tool: Definición de la herramienta
+
+    Returns:
+        Diccionario tool_choice para la API
+    """
+    return {"type": "tool", "name": tool["name"]}
+
+
+def extract_json(response_text: str) -> Any:
+    """
+    Extrae y parsea el JSON de una respuesta de texto (respaldo si no hay tool use).
+
+    Args:
+        response_text: Texto devuelto por el modelo
+
+    Returns:
+        Objeto JSON parseado
+
+    Raises:
+        json.JSONDecodeError: Si la respuesta no contiene JSON válido
+    """
+    # Limpiar posibles marcadores de código
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0]
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0]
+
+    return json.loads(response_text.strip())
+
+
+def validate(data: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Valida datos contra el subconjunto de JSON Schema usado en las herramientas.
+
+    Args:
+        data: Datos a validar
+        schema: Esquema (type, properties, required, items, enum)
+        path: Ruta del valor (para los mensajes de error)
+
+    Returns:
+        Lista de errores (vacía si los datos son válidos)
+    """
+    errors = []
+    expected = schema.get("type")
+    if expected:
+        python_type = _JSON_TYPES[expected]
+        # bool es subclase de int: no aceptarlo como número
+        if not isinstance(data, python_type) or (expected in ("integer", "number") and isinstance(data, bool)):
+            return [f"{path}: se esperaba {expected}"]
+
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: valor no permitido {data!r}")
+
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key}: campo obligatorio")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate(data[key], sub_schema, f"{path}.{key}"))
+
+    if expected == "array" and "items" in schema:
+        for idx, item in enumerate(data):
+            errors.extend(validate(item, schema["items"], f"{path}[{idx}]"))
+
+    return errors
+
+
+def _coerce_numbers(data: Any, schema: Dict[str, Any]) -> Any:
+    """Convierte a int los números enteros que el modelo devuelva como float (p. ej. 120.0)."""
+    expected = schema.get("type")
+    if expected == "integer" and isinstance(data, float) and data.is_integer():
+        return int(data)
+    if expected == "object" and isinstance(data, dict):
+        properties = schema.get("properties", {})
+        return {k: _coerce_numbers(v, properties[k]) if k in properties else v for k, v in data.items()}
+    if expected == "array" and isinstance(data, list) and "items" in schema:
+        return [_coerce_numbers(item, schema["items"]) for item in data]
+    return data
+
+
+def normalize(data: Any, schema: Dict[str, Any]) -> Tuple[Any, List[str]]:
+    """
+    Normaliza los números enteros y valida un valor contra un esquema.
+
+    Args:
+        data: Datos devueltos por el modelo
+        schema: Esquema de los datos
+
+    Returns:
+        Tupla (datos normalizados, lista de errores)
+    """
+    data = _coerce_numbers(data, schema)
+    return data, validate(data, schema)
+
+
+class StructuredResult:
+    """Resultado estructurado y validado de una llamada con herramienta."""
+
+    def __init__(self, tool_name: str, data: Optional[Dict[str, Any]], errors: List[str],
+                 stop_reason: Optional[str] = None):
+        """
+        Args:
+            tool_name: Nombre de la herramienta esperada
+            data: Datos devueltos por el modelo (None si no hubo datos)
+            errors: Errores de validación
+            stop_reason: Motivo de parada de la respuesta
+        """
+        self.tool_name = tool_name
+        self.data = data
+        self.errors = errors
+        self.stop_reason = stop_reason
+
+    @property
+    def ok(self) -> bool:
+        """True si hay datos y cumplen el esquema."""
+        return self.data is not None and not self.errors
+
+    def raise_for_errors(self):
+        """
+        Lanza una excepción si el resultado no es válido.
+
+        Raises:
+            StructuredOutputError: Si no hay datos o no cumplen el esquema
+        """
+        if not self.ok:
+            raise StructuredOutputError(
+                f"Respuesta inválida para {self.tool_name}: {'; '.join(self.errors) or 'sin datos'}"
+            )
+
+    @classmethod
+    def from_data(cls, data: Any, tool: Dict[str, Any], stop_reason: Optional[str] = None) -> 'StructuredResult':
+        """
+        Valida datos ya extraídos contra el esquema de una herramienta.
+
+        Args:
+            data: Datos devueltos por el modelo
+            tool: Definición de la herramienta
+            stop_reason: Motivo de parada de la respuesta
+
+        Returns:
+            StructuredResult validado
+        """
+        data, errors = normalize(data, tool["input_schema"])
+        return cls(tool["name"], data if isinstance(data, dict) else None, errors, stop_reason)
+
+    @classmethod
+    def from_message(cls, message, tool: Dict[str, Any]) -> 'StructuredResult':
+        """
+        Extrae y valida el resultado de una respuesta de la API.
+
+        Usa el bloque tool_use de la herramienta; si el modelo respondió con texto,
+        intenta interpretarlo como JSON.
+
+        Args:
+            message: Mensaje de respuesta de la API
+            tool: Definición de la herramienta
+
+        Returns:
+            StructuredResult (consultar .ok / .errors)
+        """
+        stop_reason = getattr(message, 'stop_reason', None)
+
+        for block in message.content:
+            if getattr(block, 'type', None) == 'tool_use' and block.name == tool["name"]:
+                return cls.from_data(block.input, tool, stop_reason)
+
+        text = "".join(getattr(block, 'text', '') or '' for block in message.content
+                       if getattr(block, 'type', None) == 'text')
+        try:
+            return cls.from_data(extract_json(text), tool, stop_reason)
+        except (json.JSONDecodeError, IndexError) as e:
+            reason = "respuesta truncada (max_tokens)" if stop_reason == 'max_tokens' else str(e)
+            return cls(tool["name"], None, [f"Sin datos estructurados: {reason}"], stop_reason)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Devuelve los datos como diccionario (vacío si no hay datos)."""
+        return dict(self.data or {})
+
+
+class IncrementalArrayParser:
+    """
+    Parser JSON incremental que emite cada elemento de un array del objeto raíz
+    en cuanto está completo en el flujo de texto (p. ej. "actions" del plan).
+    """
+
+    def __init__(self, key: str = "actions"):
+        """
+        Args:
+            key: Clave del objeto raíz cuyo array se quiere emitir elemento a elemento
+        """
+        self.key = key
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_root_string: Optional[str] = None
+        self._in_target = False
+        self._element_start: Optional[int] = None
+        self.emitted = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Procesa un fragmento de JSON.
+
+        Args:
+            chunk: Siguiente fragmento del texto JSON
+
+        Returns:
+            Lista de elementos del array completados con este fragmento
+        """
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_root_string = json.loads(buffer[self._string_start:self._pos + 1])
+
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+
+            elif char in '{[':
+                self._depth += 1
+                if char == '[' and self._depth == 2 and self._last_root_string == self.key:
+                    self._in_target = True
+                elif self._in_target and self._depth == 3:
+                    self._element_start = self._pos
+
+            elif char in '}]':
+                if self._in_target and self._depth == 3 and self._element_start is not None:
+                    completed.append(json.loads(buffer[self._element_start:self._pos + 1]))
+                    self._element_start = None
+                self._depth -= 1
+                if self._in_target and self._depth == 1:
+                    self._in_target = False
+                    self._last_root_string = None
+
+            self._pos += 1
+
+        self.emitted += len(completed)
+        return completed
+
+    @property
+    def text(self) -> str:
+        """Texto JSON acumulado hasta ahora."""
+        return self._buffer
+
+
+# Función de prueba
+if __name__ == "__main__":
+    result = StructuredResult.from_data(
+        {"found": True, "x": 120.0, "y": 45, "confidence": "high"},
+        ELEMENT_LOCATION_TOOL
+    )
+    print(f"Válido: {result.ok}, datos: {result.data}")
+
+    result = StructuredResult.from_data({"found": "sí"}, ELEMENT_LOCATION_TOOL)
+    print(f"Válido: {result.ok}, errores: {result.errors}")
+
+    parser = IncrementalArrayParser("actions")
+    stream = '{"analysis": "a", "actions": [{"type": "press", "key": "}"}, {"type": "wait", "seconds": 1}]}'
+    for start in range(0, len(stream), 7):
+        for action in parser.feed(stream[start:start + 7]):
+            print(f"Acción completa: {action}")
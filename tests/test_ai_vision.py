@@ -0,0 +1,92 @@
+"""
+Pruebas de extremo a extremo de AIVision contra el servidor simulado de la API.
+"""
+
+import asyncio
+import threading
+
+from PIL import Image, ImageDraw
+
+from ai_vision import AIVision, AsyncAIVision
+from element_memory import ElementMemory
+from fake_anthropic_server import FakeAnthropicServer, FakeServerConfig
+from request_governor import RequestGovernor
+from response_cache import SingleFlight
+
+
+def textured_screen(size=(800, 600)) -> Image.Image:
+    """Captura con contenido suficiente para que las plantillas de la memoria sean distinguibles."""
+    image = Image.new('RGB', size, color='white')
+    draw = ImageDraw.Draw(image)
+    for row in range(0, size[1], 20):
+        for col in range(0, size[0], 40):
+            draw.text((col, row), str((row * 7 + col) % 97), fill='black')
+    return image
+
+
+def test_find_element_agrupado_recuerda_cada_ventana():
+    image = textured_screen()
+    windows = [
+        {'title': f'Editor {idx}', 'left': 0, 'top': 0, 'width': image.width, 'height': image.height}
+        for idx in range(2)
+    ]
+    memory = ElementMemory(path=None)
+    single_flight = SingleFlight()
+
+    with FakeAnthropicServer(config=FakeServerConfig(latency=0.3)) as server:
+        ai = AIVision(api_key='test', base_url=server.base_url,
+                      single_flight=single_flight, element_memory=memory)
+        barrier = threading.Barrier(len(windows))
+        results = [None] * len(windows)
+
+        def worker(idx):
+            barrier.wait()
+            results[idx] = ai.find_element(image, "botón Guardar", window=windows[idx])
+
+        threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(len(windows))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert server.backend.request_count == 1
+
+    assert single_flight.coalesced == 1
+    assert results[0] is not None and results[0] == results[1]
+    for window in windows:
+        assert memory.lookup(image, window, "botón Guardar") == results[0]
+
+
+def test_stream_actions_asincrono_emite_las_acciones_del_plan():
+    image = textured_screen()
+    instruction = "Escribe 'Hola' en el editor"
+
+    async def stream(base_url):
+        async with AsyncAIVision(api_key='test', base_url=base_url) as ai:
+            plan = {}
+            actions = [action async for action in ai.stream_actions_from_instruction(image, instruction, plan)]
+            return actions, plan, ai.usage_totals['calls']
+
+    with FakeAnthropicServer(config=FakeServerConfig(chunk_size=8)) as server:
+        actions, plan, calls = asyncio.run(stream(server.base_url))
+        expected = AIVision(api_key='test', base_url=server.base_url).get_actions_from_instruction(image, instruction)
+
+    assert [action['type'] for action in actions] == ['click', 'wait', 'type', 'press']
+    assert actions == plan['actions'] == expected['actions']
+    assert plan['success_criteria'] == expected['success_criteria']
+    assert calls == 1
+
+
+def test_stream_reintenta_si_la_api_esta_sobrecargada():
+    image = textured_screen()
+    # Con esta semilla la primera petición recibe un 529 y la segunda se atiende
+    config = FakeServerConfig(error_rate=0.5, error_status=529, retry_after=0.01, seed=1)
+
+    with FakeAnthropicServer(config=config) as server:
+        governor = RequestGovernor(requests_per_minute=None, base_delay=0.01)
+        ai = AIVision(api_key='test', base_url=server.base_url, governor=governor)
+        text = "".join(ai.stream_analyze_screen(image))
+
+    assert text
+    assert governor.stats()['retries'] == 1
+    assert governor.stats()['in_flight'] == 0
@@ -0,0 +1,56 @@
+"""
+Pruebas de la validación de parámetros de la API web.
+Necesitan las dependencias de la interfaz web y de automatización.
+"""
+
+import pytest
+
+pytest.importorskip('flask_cors')
+pytest.importorskip('dotenv')
+pytest.importorskip('pyautogui')
+pytest.importorskip('pygetwindow')
+
+import app as web  # noqa: E402
+from frame import Frame  # noqa: E402
+
+
+MONITORS = [
+    {'index': 1, 'left': 0, 'top': 0, 'width': 64, 'height': 48, 'primary': True},
+    {'index': 2, 'left': 64, 'top': 0, 'width': 64, 'height': 48, 'primary': False},
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(web.screen_capture, 'get_monitors', lambda: MONITORS)
+    monkeypatch.setattr(
+        web.screen_capture, 'latest',
+        lambda max_age_ms=None, monitor=1: Frame.from_bgra(bytearray(64 * 48 * 4), (64, 48), monitor=monitor)
+    )
+    monkeypatch.setattr(web, 'ai_vision', object())
+    return web.app.test_client()
+
+
+@pytest.mark.parametrize('monitor', ['abc', '3', '-1', '1.5'])
+def test_monitor_no_valido_responde_400(client, monitor):
+    response = client.get(f'/api/capture/screen?monitor={monitor}')
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert 'onitor' in response.get_json()['error']
+
+
+def test_monitor_no_valido_en_rutas_de_ia(client):
+    for path, body in [('/api/ai/find-element', {'description': 'botón', 'monitor': 'abc'}),
+                       ('/api/ai/analyze/stream', {'monitor': 7}),
+                       ('/api/ai/analyze', {'monitor': True})]:
+        response = client.post(path, json=body)
+        assert response.status_code == 400, path
+        assert response.get_json()['success'] is False
+
+
+def test_monitor_valido(client):
+    for monitor in ('0', '2'):
+        response = client.get(f'/api/capture/screen?monitor={monitor}')
+        assert response.status_code == 200
+        assert response.get_json()['monitor'] == int(monitor)
@@ -0,0 +1,88 @@
+"""
+Pruebas de la política de confirmación y de la ejecución canalizada de acciones.
+Necesitan las dependencias de automatización (pyautogui, keyboard, pynput).
+"""
+
+import pytest
+
+pytest.importorskip('pyautogui')
+pytest.importorskip('keyboard')
+pytest.importorskip('pynput')
+
+from automation import Automation, ConfirmationPolicy  # noqa: E402
+
+
+def hotkey(*keys):
+    return {'type': 'hotkey', 'keys': list(keys), 'description': 'atajo'}
+
+
+def type_text(text):
+    return {'type': 'type', 'text': text, 'description': 'escribir'}
+
+
+def test_bloquea_atajos_que_contienen_una_combinacion_bloqueada():
+    policy = ConfirmationPolicy()
+    assert not policy(hotkey('ctrl', 'alt', 'delete'), 0)
+    assert not policy(hotkey('ctrl', 'alt', 'delete', 'shift'), 0)
+    assert not policy(hotkey('shift', 'alt', 'F4'), 0)
+    assert not policy(hotkey('control', 'w'), 0)
+    assert not policy(hotkey('winleft', 'r'), 0)
+    assert policy(hotkey('ctrl', 's'), 0)
+
+
+def test_limite_de_acciones():
+    policy = ConfirmationPolicy(max_actions=2)
+    assert policy({'type': 'wait', 'seconds': 1}, 1)
+    assert not policy({'type': 'wait', 'seconds': 1}, 2)
+
+
+def test_limite_de_texto_total_del_plan():
+    policy = ConfirmationPolicy(max_text_length=10, max_total_text=15)
+    assert policy(type_text('a' * 10), 0)
+    assert not policy(type_text('b' * 6), 1)
+    assert 'caracteres escritos' in policy.last_reason
+    # Un plan nuevo empieza de cero
+    assert policy(type_text('c' * 10), 0)
+
+
+class RecordingAutomation(Automation):
+    """Automation que registra las acciones en lugar de ejecutarlas."""
+
+    def __init__(self):
+        self.done = []
+
+    def execute_action(self, action):
+        self.done.append(action)
+
+
+def stream(actions, plan):
+    yield from actions
+    return plan
+
+
+def test_ejecucion_canalizada_con_plan_final_valido():
+    actions = [{'type': 'wait', 'seconds': 0}, type_text('hola')]
+    execution = RecordingAutomation().execute_action_stream(
+        stream(actions, {'actions': actions}), confirm=ConfirmationPolicy())
+    assert execution['plan_valid']
+    assert execution['warnings'] == []
+
+
+def test_ejecucion_canalizada_avisa_si_el_plan_final_no_es_valido():
+    actions = [{'type': 'wait', 'seconds': 0}]
+    automation = RecordingAutomation()
+    execution = automation.execute_action_stream(
+        stream(actions, {'actions': [], 'warnings': ['Error al procesar respuesta de IA']}),
+        confirm=ConfirmationPolicy())
+    assert automation.done == actions
+    assert not execution['plan_valid']
+    assert execution['warnings'][0].startswith('Se ejecutaron 1 acciones')
+
+
+def test_ejecucion_canalizada_se_detiene_al_rechazar():
+    actions = [hotkey('ctrl', 's'), hotkey('alt', 'f4'), type_text('no')]
+    automation = RecordingAutomation()
+    execution = automation.execute_action_stream(stream(actions, None), confirm=ConfirmationPolicy())
+    assert automation.done == actions[:1]
+    assert execution['rejected'] == actions[1]
+    assert execution['warnings'] == []
@@ -0,0 +1,89 @@
+"""
+Pruebas del historial de conversación acotado.
+"""
+
+import pytest
+
+from conversation_memory import IMAGE_PLACEHOLDER, ConversationMemory
+
+
+def image(turn: int) -> dict:
+    return {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": str(turn) * 100}}
+
+
+def chat(memory: ConversationMemory, turns: int):
+    """Simula turnos de chat y devuelve el historial enviado antes de cada turno."""
+    sent = []
+    for turn in range(turns):
+        sent.append(memory.to_messages())
+        memory.add_user([image(turn), {"type": "text", "text": f"Pregunta {turn}"}])
+        memory.add_assistant(f"Respuesta {turn}")
+    return sent
+
+
+def test_capturas_acotadas_por_bloques():
+    memory = ConversationMemory(max_images=2, image_block=3)
+    counts = []
+    for turn in range(12):
+        memory.add_user([image(turn), {"type": "text", "text": f"Pregunta {turn}"}])
+        counts.append(memory.image_count)
+    assert max(counts) == 4
+    assert min(counts[2:]) == 2
+    # Las capturas que quedan son las más recientes
+    last = memory.to_messages()[-1]['content'][0]
+    assert last['type'] == 'image' and last['source']['data'].startswith('11')
+
+
+def test_el_historial_es_estable_entre_compactaciones():
+    memory = ConversationMemory(max_images=2, image_block=4)
+    sent = chat(memory, 20)
+
+    stable = sum(1 for before, after in zip(sent, sent[1:]) if after[:len(before)] == before)
+    # Solo cambia el prefijo en los turnos en que se sustituye un bloque de capturas
+    assert stable >= len(sent) - 1 - (20 // 4)
+
+
+def test_image_block_1_sustituye_en_cada_turno():
+    memory = ConversationMemory(max_images=1, image_block=1)
+    chat(memory, 4)
+    assert memory.image_count == 1
+    texts = [block.get('text') for message in memory.to_messages() if isinstance(message['content'], list)
+             for block in message['content']]
+    assert texts.count(IMAGE_PLACEHOLDER) == 3
+
+
+def test_limite_de_mensajes_con_holgura():
+    memory = ConversationMemory(max_messages=8, image_block=1)
+    lengths = []
+    for turn in range(20):
+        memory.add_user(f"Pregunta {turn}")
+        memory.add_assistant(f"Respuesta {turn}")
+        lengths.append(len(memory))
+    assert max(lengths) <= 8
+    assert memory.to_messages()[0]['role'] == 'user'
+    # No recorta en cada turno
+    drops = sum(1 for before, after in zip(lengths, lengths[1:]) if after <= before)
+    assert drops < 10
+
+
+def test_limite_de_bytes():
+    memory = ConversationMemory(max_bytes=1000, max_images=10)
+    for turn in range(20):
+        memory.add_user([image(turn)])
+        memory.add_assistant("ok")
+    assert memory.size_bytes <= 1000
+
+
+def test_el_contenido_se_copia():
+    memory = ConversationMemory()
+    content = [{"type": "text", "text": "hola"}]
+    memory.add_user(content)
+    content[0]['text'] = 'cambiado'
+    messages = memory.to_messages()
+    messages[0]['content'][0]['text'] = 'otro'
+    assert memory.to_messages()[0]['content'][0]['text'] == 'hola'
+
+
+def test_image_block_no_valido():
+    with pytest.raises(ValueError):
+        ConversationMemory(image_block=0)
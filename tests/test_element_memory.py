@@ -0,0 +1,70 @@
+"""
+Pruebas de la memoria persistente de posiciones de elementos por ventana.
+"""
+
+import json
+import threading
+import time
+
+from PIL import Image, ImageDraw
+
+import element_memory
+from element_memory import ElementMemory
+
+
+WINDOW = {'title': 'Editor', 'class_name': '', 'left': 0, 'top': 0, 'width': 800, 'height': 600}
+
+
+def screen() -> Image.Image:
+    image = Image.new('RGB', (800, 600), color='white')
+    draw = ImageDraw.Draw(image)
+    for row in range(0, 600, 20):
+        for col in range(0, 800, 40):
+            draw.text((col, row), str((row * 7 + col) % 97), fill='black')
+    return image
+
+
+def test_memoria_recuerda_y_valida_la_posicion(tmp_path):
+    image = screen()
+    memory = ElementMemory(path=str(tmp_path / 'memoria.json'))
+    memory.remember(image, WINDOW, "Botón Guardar", 120, 80)
+
+    assert memory.lookup(image, WINDOW, "botón guardar") == {'x': 120, 'y': 80}
+    assert ElementMemory(path=memory.path).lookup(image, WINDOW, "Botón Guardar") == {'x': 120, 'y': 80}
+
+    # El contenido bajo el punto cambió: la posición se descarta
+    changed = image.copy()
+    ImageDraw.Draw(changed).rectangle((100, 60, 140, 100), fill='navy')
+    assert memory.lookup(changed, WINDOW, "Botón Guardar") is None
+    assert memory.stats()['rejected'] == 1
+
+
+def test_guardados_simultaneos_dejan_el_archivo_completo(tmp_path, monkeypatch, capsys):
+    # Disco lento: amplía el intervalo entre escribir el temporal y reemplazar el archivo
+    replace = element_memory.os.replace
+
+    def slow_replace(src, dst):
+        time.sleep(0.002)
+        replace(src, dst)
+
+    monkeypatch.setattr(element_memory.os, 'replace', slow_replace)
+    image = screen()
+    memory = ElementMemory(path=str(tmp_path / 'memoria.json'))
+    barrier = threading.Barrier(8)
+
+    def worker(idx):
+        barrier.wait()
+        for n in range(10):
+            memory.remember(image, WINDOW, f"elemento {idx}-{n}", 50 + idx * 80, 40 + n * 50)
+
+    threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(memory.path, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert sum(len(layout['elements']) for layout in saved['layouts']) == 80
+    assert not (tmp_path / 'memoria.json.tmp').exists()
+    assert "Error al guardar" not in capsys.readouterr().out
@@ -0,0 +1,133 @@
+"""
+Pruebas de la comparación local de capturas (ImageDiff y TileDiff).
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from frame import Frame
+from image_diff import ImageDiff, TileDiff
+
+
+def screen(size=(640, 360)) -> Image.Image:
+    image = Image.new('RGB', size, color='white')
+    draw = ImageDraw.Draw(image)
+    for line in range(8):
+        draw.text((20, 20 + line * 30), f"Línea {line}", fill='black')
+    return image
+
+
+def mss_frame(image: Image.Image) -> Frame:
+    """Frame sobre un búfer BGRA con alfa 0, como los que devuelve mss."""
+    bgra = np.asarray(image.convert('RGBA'))[..., [2, 1, 0, 3]].copy()
+    bgra[..., 3] = 0
+    return Frame.from_bgra(bytearray(bgra.tobytes()), image.size)
+
+
+def test_imagediff_sin_cambios():
+    image = screen()
+    assert not ImageDiff().compare(image, image.copy()).changed
+
+
+def test_imagediff_detecta_region():
+    before = screen()
+    after = before.copy()
+    ImageDraw.Draw(after).rectangle((300, 200, 360, 240), fill='navy')
+
+    result = ImageDiff().compare(before, after)
+    assert result.changed
+    left, top, right, bottom = result.bbox
+    assert left <= 300 and top <= 200 and right >= 361 and bottom >= 241
+
+
+def test_imagediff_tamanos_distintos_no_comparables():
+    result = ImageDiff().compare(screen((640, 360)), screen((320, 180)))
+    assert not result.comparable
+
+
+def test_tilediff_pil_y_frame_con_mismo_contenido():
+    image = screen()
+    differ = TileDiff()
+
+    for before, after in ((image, mss_frame(image)), (mss_frame(image), image), (Frame(image), mss_frame(image))):
+        result = differ.compare(before, after)
+        assert not result.changed
+        assert result.changed_fraction == 0.0
+
+
+def test_tilediff_regiones_alineadas_a_bloques():
+    before = screen()
+    after = before.copy()
+    after.putpixel((100, 50), (255, 0, 0))
+    after.putpixel((639, 359), (0, 0, 255))
+
+    result = TileDiff(tile_size=32).compare(mss_frame(before), after)
+    assert result.changed
+    assert result.changed_tiles == 2
+    assert sorted(result.regions) == [(96, 32, 128, 64), (608, 352, 640, 360)]
+    assert result.changed_fraction == 2 / (640 * 360)
+    assert result.stable
+
+
+def test_tilediff_fusiona_hasta_max_regions():
+    before = screen()
+    after = before.copy()
+    draw = ImageDraw.Draw(after)
+    for i in range(6):
+        draw.rectangle((i * 100, 300, i * 100 + 5, 305), fill='blue')
+
+    result = TileDiff(max_regions=2).compare(before, after)
+    assert len(result.regions) == 2
+    covered = [box for box in result.regions if box[1] <= 300 and box[3] >= 306]
+    assert covered
+
+
+def test_tilediff_cambio_completo_y_estabilidad():
+    before = screen()
+    after = Image.new('RGB', before.size, color='lightgray')
+
+    result = TileDiff().compare(before, after)
+    assert result.regions == [(0, 0, 640, 360)]
+    assert not result.stable
+    assert result.to_dict()['changed_tiles'] == result.total_tiles
+
+
+def test_tilediff_tamano_de_bloque_no_multiplo_de_8():
+    before = screen((100, 70))
+    after = before.copy()
+    after.putpixel((99, 69), (0, 0, 0))
+
+    result = TileDiff(tile_size=30).compare(before, after)
+    assert result.regions == [(90, 60, 100, 70)]
+
+
+def p50_ms(func, runs=15) -> float:
+    func()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[runs // 2]
+
+
+@pytest.mark.skipif(bool(os.getenv('SKIP_BENCHMARKS')), reason="benchmarks desactivados (SKIP_BENCHMARKS)")
+def test_tilediff_4k_cuesta_como_leer_las_dos_capturas():
+    base = screen((3840, 2160))
+    small = base.copy()
+    ImageDraw.Draw(small).rectangle((2000, 1200, 2300, 1260), fill='navy')
+    before, same, after = mss_frame(base), mss_frame(base), mss_frame(small)
+    tile_diff = TileDiff()
+
+    # Referencia: comparar los dos búferes como uint32 (lo mínimo que cuesta leer las dos capturas)
+    reference = p50_ms(lambda: np.array_equal(before.bgra.view(np.uint32), after.bgra.view(np.uint32)))
+    unchanged = p50_ms(lambda: tile_diff.compare(before, same))
+    changed = p50_ms(lambda: tile_diff.compare(before, after))
+
+    assert tile_diff.compare(before, after).regions == [(1984, 1184, 2304, 1280)]
+    assert unchanged < 1.5 * reference, (unchanged, reference)
+    assert changed < 1.5 * reference, (changed, reference)
@@ -0,0 +1,74 @@
+"""
+Pruebas de la política de enrutado de modelos.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from model_router import DEFAULT_MODELS, ModelRouter
+
+
+def tool_message(**tool_input):
+    return SimpleNamespace(content=[SimpleNamespace(type='tool_use', input=tool_input)])
+
+
+def test_parametros_por_ruta():
+    router = ModelRouter()
+    assert router.params('find_element') == {'model': DEFAULT_MODELS['fast'], 'max_tokens': 256}
+    assert router.params('find_element', needed_tokens=100)['max_tokens'] == 100
+    assert router.params('operacion_desconocida')['model'] == router.default_model
+
+
+def test_planificacion_en_el_modelo_por_defecto():
+    assert ModelRouter().model_for('get_actions_from_instruction') == DEFAULT_MODELS['balanced']
+
+
+def test_enrutado_desactivado_usa_el_nivel_por_defecto():
+    router = ModelRouter(enabled=False)
+    assert router.params('find_element') == {'model': router.default_model, 'max_tokens': 256}
+
+
+def test_configuracion_no_valida():
+    router = ModelRouter()
+    with pytest.raises(ValueError):
+        router.configure(routes={'find_element': {'tier': 'enorme'}})
+    with pytest.raises(ValueError):
+        router.configure(routes={'find_element': {'max_tokens': 0}})
+    assert router.route('find_element').tier == 'fast'
+
+
+def test_escala_con_confianza_baja():
+    router = ModelRouter()
+    request = router.params('find_element')
+    escalated = router.escalation('find_element', request, tool_message(found=True, x=1, y=2, confidence='low'))
+    assert escalated['model'] == DEFAULT_MODELS['balanced']
+    assert request['model'] == DEFAULT_MODELS['fast']
+    assert router.stats()['find_element']['escalations'] == 1
+
+
+def test_no_escala_un_no_encontrado_con_confianza():
+    router = ModelRouter()
+    request = router.params('find_element')
+    assert router.escalation('find_element', request, tool_message(found=False, reason='No está')) is None
+    assert router.escalation('find_elements', router.params('find_elements'),
+                             tool_message(elements=[{'found': False, 'reason': 'No está'},
+                                                    {'found': True, 'confidence': 'high'}])) is None
+
+
+def test_no_escala_rutas_sin_escalado():
+    router = ModelRouter()
+    message = tool_message(confidence='low')
+    assert router.escalation('analyze_screen', router.params('analyze_screen'), message) is None
+
+
+def test_guardar_y_cargar(tmp_path):
+    path = str(tmp_path / 'routing.json')
+    router = ModelRouter(path=path)
+    router.configure(routes={'analyze_screen': {'tier': 'fast', 'stop_sequences': ['FIN']}})
+    router.save()
+
+    loaded = ModelRouter()
+    loaded.load(path)
+    assert loaded.params('analyze_screen')['stop_sequences'] == ['FIN']
+    assert loaded.model_for('analyze_screen') == DEFAULT_MODELS['fast']
@@ -0,0 +1,239 @@
+"""
+Pruebas del control de peticiones (token bucket, concurrencia, reintentos y hedging).
+"""
+
+import asyncio
+import threading
+import time
+
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+from request_governor import GovernorTimeout, RequestGovernor, TokenBucket
+
+
+def test_token_bucket_rafaga_y_espera():
+    bucket = TokenBucket(rate=10.0, capacity=2)
+    assert bucket.reserve(0) == 0.0
+    assert bucket.reserve(0) == 0.0
+    # Sin saldo: la tercera reserva espera ~1/rate, y no se concede si no se acepta esperar
+    assert bucket.reserve(0.0) is None
+    wait = bucket.reserve(1.0)
+    assert 0.05 < wait <= 0.1
+    assert not bucket.try_take()
+
+
+def test_token_bucket_repone_con_el_tiempo():
+    bucket = TokenBucket(rate=100.0, capacity=1)
+    assert bucket.try_take()
+    assert not bucket.try_take()
+    time.sleep(0.02)
+    assert bucket.try_take()
+
+
+def test_reintenta_errores_transitorios():
+    governor = RequestGovernor(requests_per_minute=None, base_delay=0.001)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise anthropic.APIConnectionError(request=None)
+        return 'ok'
+
+    assert governor.call('analyze_screen', flaky) == 'ok'
+    assert governor.stats()['retries'] == 2
+
+
+class RateLimited(Exception):
+    """Error 429 con la cabecera retry-after (como los del cliente de la API)."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: str):
+        super().__init__('rate limit')
+        self.response = SimpleNamespace(headers={'retry-after': retry_after})
+
+
+def test_retry_after_se_limita_a_max_delay():
+    governor = RequestGovernor(requests_per_minute=None, base_delay=0.5, max_delay=20.0)
+
+    assert 2.0 <= governor.backoff_delay(0, RateLimited('2')) <= 2.5
+    assert 20.0 <= governor.backoff_delay(0, RateLimited('3600')) <= 20.5
+
+
+def test_no_reintenta_errores_definitivos():
+    governor = RequestGovernor(requests_per_minute=None, base_delay=0.001)
+    with pytest.raises(ValueError):
+        governor.call('analyze_screen', lambda: (_ for _ in ()).throw(ValueError('no')))
+    assert governor.stats()['retries'] == 0
+
+
+def test_limite_de_concurrencia_y_espera_agotada():
+    governor = RequestGovernor(max_concurrency=1, requests_per_minute=None, queue_timeout=0.05)
+    with governor.limit():
+        with pytest.raises(GovernorTimeout):
+            with governor.limit():
+                pass
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_el_duplicado_ganador_no_libera_el_hueco_de_la_principal():
+    governor = RequestGovernor(max_concurrency=2, requests_per_minute=None, hedge_after=0.05)
+    calls = []
+    primary_done = threading.Event()
+
+    def request():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.3)
+            primary_done.set()
+            return 'principal'
+        return 'duplicado'
+
+    assert governor.call('find_element', request) == 'duplicado'
+    stats = governor.stats()
+    assert stats['hedges'] == 1 and stats['hedge_wins'] == 1
+    # La principal sigue en curso y ocupa su hueco
+    assert stats['in_flight'] == 1
+
+    primary_done.wait(1.0)
+    time.sleep(0.02)
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_concurrencia_real_con_hedging_no_supera_el_limite():
+    governor = RequestGovernor(max_concurrency=2, requests_per_minute=None, hedge_after=0.01)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def request():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return 'ok'
+
+    threads = [threading.Thread(target=governor.call, args=('find_element', request)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(0.1)
+    assert peak[0] <= 2
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_alimit_espera_a_que_se_libere_un_hueco():
+    governor = RequestGovernor(max_concurrency=1, requests_per_minute=None, queue_timeout=2.0)
+
+    def hold():
+        with governor.limit():
+            time.sleep(0.1)
+
+    async def main():
+        holder = threading.Thread(target=hold)
+        holder.start()
+        await asyncio.sleep(0.02)
+        start = time.monotonic()
+        async with governor.alimit():
+            waited = time.monotonic() - start
+        holder.join()
+        return waited
+
+    waited = asyncio.run(main())
+    assert 0.03 < waited < 1.0
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_alimit_espera_agotada():
+    governor = RequestGovernor(max_concurrency=1, requests_per_minute=None, queue_timeout=0.05)
+
+    async def main():
+        async with governor.alimit():
+            with pytest.raises(GovernorTimeout):
+                async with governor.alimit():
+                    pass
+
+    asyncio.run(main())
+    assert governor.stats()['in_flight'] == 0
+    assert not governor._async_waiters
+
+
+class FakeStream:
+    """Gestor de contexto de stream que falla al abrirse las primeras veces."""
+
+    def __init__(self, failures: list):
+        self.failures = failures
+        self.closed = False
+
+    def __enter__(self):
+        if self.failures:
+            raise self.failures.pop(0)
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+def test_stream_reintenta_al_abrir_y_libera_el_hueco():
+    governor = RequestGovernor(max_concurrency=1, requests_per_minute=None, base_delay=0.001)
+    failures = [RateLimited('0'), anthropic.APIConnectionError(request=None)]
+    streams = []
+
+    def open_stream():
+        streams.append(FakeStream(failures))
+        return streams[-1]
+
+    with governor.stream('analyze_screen', open_stream) as stream:
+        assert stream is streams[-1]
+        assert governor.stats()['in_flight'] == 1
+
+    assert len(streams) == 3 and stream.closed
+    assert governor.stats()['retries'] == 2
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_stream_no_reintenta_errores_tras_abrir():
+    governor = RequestGovernor(requests_per_minute=None, base_delay=0.001)
+    opened = []
+
+    def open_stream():
+        opened.append(FakeStream([]))
+        return opened[-1]
+
+    with pytest.raises(anthropic.APIConnectionError):
+        with governor.stream('analyze_screen', open_stream):
+            raise anthropic.APIConnectionError(request=None)
+
+    assert len(opened) == 1 and opened[0].closed
+    assert governor.stats()['retries'] == 0
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_stream_asincrono_reintenta_al_abrir():
+    governor = RequestGovernor(requests_per_minute=None, base_delay=0.001)
+    failures = [RateLimited('0')]
+
+    async def main():
+        async with governor.astream('analyze_screen', lambda: FakeStream(failures)) as stream:
+            in_flight = governor.stats()['in_flight']
+        return stream, in_flight
+
+    stream, in_flight = asyncio.run(main())
+
+    assert stream.closed and in_flight == 1
+    assert governor.stats()['retries'] == 1
+    assert governor.stats()['in_flight'] == 0
@@ -0,0 +1,157 @@
+"""
+Pruebas de la caché de respuestas por huella de pantalla y de la agrupación de
+peticiones idénticas simultáneas.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+import response_cache
+from response_cache import ResponseCache, SingleFlight
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def screen(text="Pantalla de prueba", cursor=False) -> Image.Image:
+    image = Image.new('RGB', (640, 360), color='white')
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 20), text, fill='black')
+    if cursor:
+        draw.rectangle((300, 300, 301, 310), fill='black')
+    return image
+
+
+def test_cache_tolera_cambios_pequenos_de_pantalla():
+    cache = ResponseCache()
+    key = cache.make_key('analyze_screen', 'modelo', 'prompt', size=(640, 360))
+    cache.put(key, cache.fingerprint(screen()), {'texto': 'guardado'})
+
+    entry = cache.get(key, cache.fingerprint(screen(cursor=True)))
+
+    assert entry is not None and entry.value == {'texto': 'guardado'}
+    assert cache.get(key, cache.fingerprint(Image.new('RGB', (640, 360), color='black'))) is None
+    assert cache.get(cache.make_key('analyze_screen', 'modelo', 'otro'), cache.fingerprint(screen())) is None
+
+
+def test_cache_devuelve_copias():
+    cache = ResponseCache()
+    fingerprint = cache.fingerprint(screen())
+    cache.put('k', fingerprint, {'acciones': [1]})
+
+    cache.get('k', fingerprint).value['acciones'].append(2)
+
+    assert cache.get('k', fingerprint).value == {'acciones': [1]}
+
+
+def test_cache_expira_por_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache.time, 'monotonic', clock)
+    cache = ResponseCache(ttl_seconds=10)
+    fingerprint = cache.fingerprint(screen())
+    cache.put('k', fingerprint, 'valor')
+
+    clock.now += 9
+    assert cache.get('k', fingerprint).value == 'valor'
+
+    clock.now += 2
+    assert cache.get('k', fingerprint) is None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_cache_desaloja_la_menos_usada():
+    cache = ResponseCache(max_entries=2)
+    fingerprints = [cache.fingerprint(screen(f"Pantalla {idx} " * (idx + 1))) for idx in range(3)]
+    cache.put('a', fingerprints[0], 'a')
+    cache.put('b', fingerprints[1], 'b')
+
+    assert cache.get('a', fingerprints[0]) is not None  # 'a' pasa a ser la más reciente
+    cache.put('c', fingerprints[2], 'c')
+
+    assert cache.get('b', fingerprints[1]) is None
+    assert cache.get('a', fingerprints[0]).value == 'a'
+    assert cache.get('c', fingerprints[2]).value == 'c'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cache_reemplaza_la_misma_pantalla():
+    cache = ResponseCache()
+    fingerprint = cache.fingerprint(screen())
+    cache.put('k', fingerprint, 'antigua')
+    cache.put('k', fingerprint, 'nueva')
+
+    assert cache.get('k', fingerprint).value == 'nueva'
+    assert cache.stats()['size'] == 1
+
+
+def test_single_flight_agrupa_peticiones_simultaneas():
+    flight = SingleFlight()
+    fingerprint = ResponseCache().fingerprint(screen())
+    calls = []
+    results = []
+    barrier = threading.Barrier(4)
+
+    def request():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'x': 1}
+
+    def worker():
+        barrier.wait()
+        results.append(flight.do('k', fingerprint, request))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(value == {'x': 1} for value, _ in results)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_single_flight_propaga_el_error_y_no_lo_guarda():
+    flight = SingleFlight()
+
+    def failing():
+        raise RuntimeError("fallo de la API")
+
+    with pytest.raises(RuntimeError):
+        flight.do('k', b'huella', failing)
+    assert flight.do('k', b'huella', lambda: 'de nuevo') == ('de nuevo', False)
+
+
+def test_single_flight_asincrono_cancela_si_no_quedan_esperas():
+    flight = SingleFlight()
+    started = []
+
+    async def request():
+        started.append(1)
+        await asyncio.sleep(10)
+
+    async def main():
+        waiters = [asyncio.ensure_future(flight.ado('k', b'huella', request)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight.stats()
+
+    stats = asyncio.run(main())
+
+    assert len(started) == 1
+    assert stats['coalesced'] == 1
+    assert stats['in_flight'] == 0
@@ -0,0 +1,107 @@
+"""
+Pruebas de la captura desde varios hilos con una instancia de mss simulada.
+Necesitan pygetwindow (solo funciona en Windows).
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pygetwindow')
+
+from frame import Frame  # noqa: E402
+from screen_capture import FrameRing, MssPool, ScreenCapture  # noqa: E402
+
+
+class FakeScreenShot:
+    def __init__(self, rect):
+        self.size = (rect['width'], rect['height'])
+        self.raw = bytes(rect['width'] * rect['height'] * 4)
+
+
+class FakeMss:
+    """Sustituto de mss.mss con dos monitores uno al lado del otro."""
+
+    monitors = [
+        {'left': 0, 'top': 0, 'width': 320, 'height': 120},
+        {'left': 0, 'top': 0, 'width': 160, 'height': 120},
+        {'left': 160, 'top': 0, 'width': 160, 'height': 100},
+    ]
+
+    grab_seconds = 0.0
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+
+    def grab(self, rect):
+        assert threading.current_thread() is self.thread, "mss usado desde otro hilo"
+        time.sleep(self.grab_seconds)
+        return FakeScreenShot(rect)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def capture():
+    capture = ScreenCapture(capture_workers=3)
+    capture.mss_pool = MssPool(factory=FakeMss)
+    yield capture
+    capture.close()
+
+
+def test_hilos_de_peticion_reutilizan_las_instancias_de_captura(capture):
+    sizes = []
+
+    def request():
+        frame = capture.capture_frame()
+        sizes.append((frame.size, capture.get_screen_size(2)))
+
+    for _ in range(4):
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sizes == [((160, 120), (160, 100))] * 32
+    assert capture.mss_pool.stats()['created'] <= capture.capture_workers
+
+
+def test_escritorio_virtual_une_los_monitores(capture):
+    desktop = capture.capture_virtual_desktop()
+
+    assert desktop.size == (320, 120)
+    assert desktop.origin == (0, 0)
+    assert capture.mss_pool.stats()['created'] <= capture.capture_workers + len(FakeMss.monitors) - 1
+
+
+def test_capturas_simultaneas_en_paralelo_hasta_capture_workers(capture, monkeypatch):
+    monkeypatch.setattr(FakeMss, 'grab_seconds', 0.2)
+
+    def elapsed(requests):
+        threads = [threading.Thread(target=capture.capture_frame) for _ in range(requests)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    assert elapsed(3) < 0.35  # tres a la vez con tres hilos de captura
+    assert elapsed(6) >= 0.4  # las que superan capture_workers esperan turno
+
+
+def test_framering_limita_la_memoria():
+    ring = FrameRing(capacity=30, max_bytes=3 * 100 * 100 * 4)
+    for idx in range(5):
+        ring.append(Frame.from_bgra(bytearray(100 * 100 * 4), (100, 100), timestamp=float(idx + 1)))
+
+    assert len(ring) == 3
+    assert ring.nbytes == 3 * 100 * 100 * 4
+    assert [frame.timestamp for frame in ring.frames_since(0)] == [3.0, 4.0, 5.0]
+
+    # Una captura mayor que el límite se conserva sola (siempre queda la más reciente)
+    ring.append(Frame.from_bgra(bytearray(400 * 400 * 4), (400, 400), timestamp=6.0))
+    assert len(ring) == 1 and ring.latest().timestamp == 6.0
@@ -0,0 +1,134 @@
+"""
+Pruebas de la validación de las salidas estructuradas de la IA y del parser incremental
+que emite las acciones del plan mientras llegan.
+"""
+
+import json
+
+from types import SimpleNamespace
+
+import pytest
+
+from structured_output import (
+    ACTION_PLAN_TOOL, ELEMENT_LOCATION_TOOL, IncrementalArrayParser, StructuredOutputError, StructuredResult,
+    normalize, validate,
+)
+
+
+def message(*blocks, stop_reason='tool_use'):
+    return SimpleNamespace(content=list(blocks), stop_reason=stop_reason)
+
+
+def tool_use(tool, data):
+    return SimpleNamespace(type='tool_use', name=tool['name'], input=data)
+
+
+def text(value):
+    return SimpleNamespace(type='text', text=value)
+
+
+def test_validate_acepta_datos_validos():
+    data = {'found': True, 'x': 10, 'y': 20, 'confidence': 'high'}
+
+    assert validate(data, ELEMENT_LOCATION_TOOL['input_schema']) == []
+
+
+def test_validate_informa_la_ruta_de_cada_error():
+    plan = {
+        'analysis': 'a', 'strategy': 's', 'warnings': [], 'success_criteria': 'c',
+        'actions': [{'type': 'click', 'x': 1, 'y': 2, 'description': 'ok'},
+                    {'type': 'drag', 'x': '3', 'description': 'mal'}],
+    }
+
+    errors = validate(plan, ACTION_PLAN_TOOL['input_schema'])
+
+    assert errors == ["$.actions[1].type: valor no permitido 'drag'", "$.actions[1].x: se esperaba integer"]
+
+
+def test_validate_no_acepta_bool_como_numero():
+    schema = ELEMENT_LOCATION_TOOL['input_schema']
+
+    assert validate({'found': True, 'x': True}, schema) == ["$.x: se esperaba integer"]
+    assert validate({'x': 1}, schema) == ["$.found: campo obligatorio"]
+
+
+def test_normalize_convierte_floats_enteros():
+    data, errors = normalize({'found': True, 'x': 120.0, 'y': 45.5}, ELEMENT_LOCATION_TOOL['input_schema'])
+
+    assert data['x'] == 120 and isinstance(data['x'], int)
+    assert errors == ["$.y: se esperaba integer"]
+
+
+def test_from_message_usa_el_bloque_de_la_herramienta():
+    result = StructuredResult.from_message(
+        message(text('Busco el botón'), tool_use(ELEMENT_LOCATION_TOOL, {'found': True, 'x': 5.0, 'y': 6})),
+        ELEMENT_LOCATION_TOOL
+    )
+
+    assert result.ok
+    assert result.to_dict() == {'found': True, 'x': 5, 'y': 6}
+
+
+def test_from_message_interpreta_texto_json_como_respaldo():
+    result = StructuredResult.from_message(
+        message(text('```json\n{"found": false, "reason": "no está"}\n```'), stop_reason='end_turn'),
+        ELEMENT_LOCATION_TOOL
+    )
+
+    assert result.ok
+    assert result.data == {'found': False, 'reason': 'no está'}
+
+
+def test_from_message_truncado_no_es_valido():
+    result = StructuredResult.from_message(
+        message(text('{"found": true, "x": 1'), stop_reason='max_tokens'),
+        ELEMENT_LOCATION_TOOL
+    )
+
+    assert not result.ok
+    assert result.errors == ["Sin datos estructurados: respuesta truncada (max_tokens)"]
+    with pytest.raises(StructuredOutputError):
+        result.raise_for_errors()
+
+
+PLAN = {
+    'analysis': 'Hay un editor con "actions": [] en el texto {sin cerrar',
+    'warnings': ['ojo con [corchetes]'],
+    'actions': [
+        {'type': 'press', 'key': '}', 'description': 'llave'},
+        {'type': 'type', 'text': 'comillas " y barra \\', 'description': 'escapes'},
+        {'type': 'hotkey', 'keys': ['ctrl', 's'], 'description': 'lista anidada'},
+    ],
+    'strategy': 'después de las acciones',
+}
+
+
+def feed_in_chunks(parser, stream, size):
+    emitted = []
+    for start in range(0, len(stream), size):
+        emitted.extend(parser.feed(stream[start:start + size]))
+    return emitted
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 1000])
+def test_parser_incremental_emite_cada_accion_completa(size):
+    stream = json.dumps(PLAN, ensure_ascii=False)
+    parser = IncrementalArrayParser('actions')
+
+    assert feed_in_chunks(parser, stream, size) == PLAN['actions']
+    assert parser.emitted == len(PLAN['actions'])
+    assert json.loads(parser.text) == PLAN
+
+
+def test_parser_incremental_emite_antes_de_cerrar_el_array():
+    parser = IncrementalArrayParser('actions')
+
+    assert parser.feed('{"actions": [{"type": "wait", "seconds": 1}') == [{'type': 'wait', 'seconds': 1}]
+    assert parser.feed(', {"type": "press"') == []
+    assert parser.feed(', "key": "enter"}]}') == [{'type': 'press', 'key': 'enter'}]
+
+
+def test_parser_incremental_ignora_otros_arrays():
+    parser = IncrementalArrayParser('actions')
+
+    assert parser.feed('{"steps": [{"a": 1}], "meta": {"actions": [{"b": 2}]}, "actions": []}') == []
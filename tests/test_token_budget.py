@@ -0,0 +1,95 @@
+"""
+Pruebas de la estimación de tokens y del presupuesto de entrada por petición.
+"""
+
+from PIL import Image, ImageDraw
+
+from ai_vision import AIVision
+from frame import Frame
+from image_encoder import ImageEncoder
+from token_budget import TokenBudget, estimate_image_tokens, estimate_request_tokens, estimate_text_tokens
+
+
+def wide_screen(size=(5760, 1080)) -> Image.Image:
+    """Captura de tres monitores con texto solo en el de la derecha."""
+    image = Image.new('RGB', size, color='white')
+    draw = ImageDraw.Draw(image)
+    for line in range(40):
+        draw.text((size[0] - 900, 40 + line * 24), "Botón Guardar", fill='black')
+    return image
+
+
+def test_estimacion_de_texto_e_imagen():
+    assert estimate_text_tokens('') == 0
+    assert estimate_text_tokens('a' * 35) == 10
+    assert estimate_image_tokens(1000, 1000) > estimate_image_tokens(500, 500)
+    # La API reescala las imágenes grandes: más píxeles no suman más tokens
+    assert estimate_image_tokens(8000, 8000) == estimate_image_tokens(16000, 16000)
+
+
+def test_estimacion_de_peticion():
+    encoded = ImageEncoder(format='PNG').encode(Image.new('RGB', (800, 600), 'white'))
+    request = {
+        'system': 'Eres un asistente',
+        'messages': [{'role': 'user', 'content': [encoded.to_content_block(), {'type': 'text', 'text': 'Hola'}]}],
+    }
+    estimate = estimate_request_tokens(request)
+    assert estimate['images'] == 1
+    assert estimate['image_tokens'] == estimate_image_tokens(800, 600)
+    assert estimate['total'] == estimate['image_tokens'] + estimate['text_tokens']
+
+
+def test_captura_normal_sin_recorte():
+    plan = TokenBudget().plan(Image.new('RGB', (1920, 1080)), ImageEncoder())
+    assert plan.box is None
+    assert estimate_image_tokens(plan.width, plan.height) <= TokenBudget().image_budget
+
+
+def test_captura_ancha_se_reduce_sin_recortar_por_defecto():
+    image = wide_screen()
+    budget = TokenBudget()
+    plan = budget.plan(image, ImageEncoder())
+    assert plan.box is None
+    assert plan.scale < budget.min_scale
+
+    encoded, _ = budget.encode(Frame(image), ImageEncoder())
+    assert not encoded.is_crop
+    assert encoded.offset == (0, 0)
+
+
+def test_recorte_opcional_elige_la_region_con_detalle():
+    image = wide_screen()
+    budget = TokenBudget(allow_crop=True)
+    plan = budget.plan(image, ImageEncoder())
+
+    left, top, right, bottom = plan.box
+    assert right > image.width - 900 and left < image.width - 700
+    assert plan.scale >= budget.min_scale - 0.01
+
+    encoded, _ = budget.encode(Frame(image), ImageEncoder())
+    assert encoded.is_crop
+    assert encoded.full_size == image.size
+    assert encoded.offset == (left, top)
+    x, _ = encoded.to_original_coords(0, 0)
+    assert x == left
+
+
+def test_from_env_recorte_desactivado_por_defecto(monkeypatch):
+    monkeypatch.delenv('AI_BUDGET_CROP', raising=False)
+    assert not TokenBudget.from_env().allow_crop
+    monkeypatch.setenv('AI_BUDGET_CROP', '1')
+    assert TokenBudget.from_env().allow_crop
+
+
+def test_el_prompt_avisa_del_recorte():
+    image = Frame(wide_screen())
+
+    ai = AIVision(api_key='test', budget=TokenBudget(allow_crop=True))
+    request, _ = ai._find_element_request(image, "Botón Guardar")
+    texts = [block['text'] for block in request['messages'][0]['content'] if block['type'] == 'text']
+    assert any('solo una parte de la pantalla' in text for text in texts)
+
+    ai = AIVision(api_key='test')
+    request, _ = ai._find_element_request(image, "Botón Guardar")
+    texts = [block['text'] for block in request['messages'][0]['content'] if block['type'] == 'text']
+    assert not any('solo una parte de la pantalla' in text for text in texts)
@@ -0,0 +1,343 @@
+"""
+Módulo de estimación de tokens y presupuesto por petición.
+Predice localmente los tokens de imagen y de texto de una petición antes de enviarla
+y elige la resolución (o el recorte) de cada captura para no superar un presupuesto
+por llamada sin que el texto de la pantalla quede por debajo de un tamaño legible.
+"""
+
+from PIL import Image
+import numpy as np
+import base64
+import copy
+import io
+import json
+import math
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from frame import Frame, gray_array, memoized, unwrap
+from image_encoder import EncodedImage, ImageEncoder
+from metrics import PIXELS_PER_IMAGE_TOKEN, estimate_image_tokens as pixels_to_tokens
+
+
+# Caracteres por token de texto (aproximación para español e inglés)
+CHARS_PER_TOKEN = 3.5
+
+# Tokens que añade la API al system prompt cuando la petición declara herramientas
+TOOL_USE_SYSTEM_TOKENS = 300
+
+# Bytes en base64 que se decodifican para leer la cabecera (tamaño) de una imagen
+IMAGE_HEADER_CHARS = 16384
+
+# Lado de la miniatura usada para elegir el recorte con más detalle
+DETAIL_MAP_EDGE = 256
+
+# La API reescala en el servidor las imágenes mayores que esto antes de contarlas
+_API_RESIZE = ImageEncoder(max_long_edge=ImageEncoder.DEFAULT_MAX_LONG_EDGE,
+                           max_pixels=ImageEncoder.DEFAULT_MAX_PIXELS)
+
+
+# ===== ESTIMACIÓN =====
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Estima los tokens de un texto.
+
+    Args:
+        text: Texto
+
+    Returns:
+        Número aproximado de tokens
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estima los tokens de una imagen teniendo en cuenta el reescalado que hace la API.
+
+    Args:
+        width: Ancho de la imagen enviada
+        height: Alto de la imagen enviada
+
+    Returns:
+        Número aproximado de tokens
+    """
+    return pixels_to_tokens(*_API_RESIZE.target_size(width, height))
+
+
+def _image_block_size(block: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """Tamaño de la imagen de un bloque base64 leyendo solo su cabecera (None si no se puede)."""
+    data = block.get('source', {}).get('data')
+    if not data:
+        return None
+    for chunk in (data[:IMAGE_HEADER_CHARS], data):
+        try:
+            with Image.open(io.BytesIO(base64.b64decode(chunk))) as image:
+                return image.size
+        except Exception:
+            continue
+    return None
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Estima los tokens de entrada de una petición a la API de mensajes.
+
+    Args:
+        request: Argumentos de messages.create() (system, messages, tools...)
+
+    Returns:
+        Diccionario con images, image_tokens, text_tokens y total
+    """
+    images = image_tokens = text_tokens = 0
+
+    def add_content(content: Any):
+        nonlocal images, image_tokens, text_tokens
+        if isinstance(content, str):
+            text_tokens += estimate_text_tokens(content)
+            return
+        for block in content or []:
+            block_type = block.get('type')
+            if block_type == 'image':
+                size = _image_block_size(block)
+                images += 1
+                image_tokens += estimate_image_tokens(*size) if size else 0
+            elif block_type == 'text':
+                text_tokens += estimate_text_tokens(block.get('text', ''))
+            elif block_type == 'tool_use':
+                text_tokens += estimate_text_tokens(json.dumps(block.get('input', {})))
+            elif block_type == 'tool_result':
+                add_content(block.get('content'))
+
+    add_content(request.get('system'))
+    for message in request.get('messages', []):
+        add_content(message.get('content'))
+    if request.get('tools'):
+        text_tokens += TOOL_USE_SYSTEM_TOKENS + estimate_text_tokens(json.dumps(request['tools']))
+
+    return {
+        'images': images,
+        'image_tokens': image_tokens,
+        'text_tokens': text_tokens,
+        'total': image_tokens + text_tokens,
+    }
+
+
+# ===== PRESUPUESTO =====
+
+class BudgetPlan:
+    """Resolución y recorte elegidos para una captura."""
+
+    def __init__(self, box: Optional[Tuple[int, int, int, int]], size: Tuple[int, int],
+                 scale: float, text_height: float):
+        """
+        Args:
+            box: Región recortada (left, top, right, bottom) o None si se envía la captura completa
+            size: Tamaño (width, height) de la imagen enviada
+            scale: Escala aplicada (imagen enviada / región original)
+            text_height: Altura estimada del texto en la imagen enviada (píxeles)
+        """
+        self.box = box
+        self.width, self.height = size
+        self.scale = scale
+        self.text_height = text_height
+
+    @property
+    def image_tokens(self) -> int:
+        """Tokens estimados de la imagen enviada."""
+        return estimate_image_tokens(self.width, self.height)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'box': list(self.box) if self.box else None,
+            'size': [self.width, self.height],
+            'scale': round(self.scale, 4),
+            'text_height': round(self.text_height, 1),
+            'image_tokens': self.image_tokens,
+        }
+
+
+class TokenBudget:
+    """
+    Presupuesto de tokens de entrada por petición.
+
+    La imagen puede usar el presupuesto menos la reserva para el texto y se reduce
+    hasta caber en él. Con allow_crop, si para entrar habría que reducir la captura por
+    debajo del tamaño de texto legible, se envía en su lugar la región con más detalle
+    que cabe a ese tamaño (y el prompt avisa al modelo de que solo ve una parte). Está
+    desactivado por defecto: en capturas anchas (varios monitores) la región elegida
+    puede no contener lo que se busca.
+    """
+
+    def __init__(self, max_tokens: int = 2400, reserved_text_tokens: int = 800,
+                 text_height: float = 14.0, min_text_height: float = 5.0, allow_crop: bool = False):
+        """
+        Args:
+            max_tokens: Tokens de entrada máximos por petición
+            reserved_text_tokens: Parte del presupuesto reservada para prompts, herramientas e historial
+            text_height: Altura típica del texto en la captura original (píxeles)
+            min_text_height: Altura mínima del texto en la imagen enviada para que siga legible
+            allow_crop: Recortar en lugar de reducir por debajo del tamaño legible
+        """
+        if max_tokens <= reserved_text_tokens:
+            raise ValueError("El presupuesto debe ser mayor que la reserva para el texto")
+        self.max_tokens = max_tokens
+        self.reserved_text_tokens = reserved_text_tokens
+        self.text_height = text_height
+        self.min_text_height = min_text_height
+        self.allow_crop = allow_crop
+
+    @classmethod
+    def from_env(cls) -> 'TokenBudget':
+        """
+        Crea el presupuesto a partir de las variables de entorno.
+
+        Variables:
+            AI_TOKEN_BUDGET: Tokens de entrada máximos por petición
+            AI_MIN_TEXT_HEIGHT: Altura mínima legible del texto en píxeles
+            AI_BUDGET_CROP: 1/true para recortar en lugar de reducir por debajo del tamaño legible
+
+        Returns:
+            TokenBudget configurado
+        """
+        kwargs: Dict[str, Any] = {}
+        try:
+            if os.getenv('AI_TOKEN_BUDGET'):
+                kwargs['max_tokens'] = int(os.environ['AI_TOKEN_BUDGET'])
+            if os.getenv('AI_MIN_TEXT_HEIGHT'):
+                kwargs['min_text_height'] = float(os.environ['AI_MIN_TEXT_HEIGHT'])
+        except ValueError as e:
+            print(f"Configuración de presupuesto de tokens no válida, se ignora: {e}")
+        kwargs['allow_crop'] = os.getenv('AI_BUDGET_CROP', '0').lower() in ('1', 'true', 'yes', 'on')
+        return cls(**kwargs)
+
+    @property
+    def image_budget(self) -> int:
+        """Tokens disponibles para la imagen."""
+        return self.max_tokens - self.reserved_text_tokens
+
+    @property
+    def min_scale(self) -> float:
+        """Escala mínima con la que el texto sigue siendo legible."""
+        return min(1.0, self.min_text_height / self.text_height)
+
+    def _encoder_for(self, encoder: ImageEncoder) -> ImageEncoder:
+        """Codificador con el límite de píxeles del presupuesto (el mismo si ya lo cumple)."""
+        max_pixels = self.image_budget * PIXELS_PER_IMAGE_TOKEN
+        if encoder.max_pixels is not None and encoder.max_pixels <= max_pixels:
+            return encoder
+        limited = copy.copy(encoder)
+        limited.max_pixels = max_pixels
+        return limited
+
+    def plan(self, image: Image.Image, encoder: ImageEncoder) -> BudgetPlan:
+        """
+        Elige la resolución y, si hace falta, el recorte de una captura.
+
+        Args:
+            image: Captura (imagen PIL o Frame)
+            encoder: Codificador que se usará
+
+        Returns:
+            BudgetPlan con la región, el tamaño enviado y la altura de texto resultante
+        """
+        encoder = self._encoder_for(encoder)
+        width, height = image.size
+        sent = encoder.target_size(width, height)
+        scale = sent[0] / width
+        if scale >= self.min_scale or not self.allow_crop:
+            return BudgetPlan(None, sent, scale, self.text_height * scale)
+
+        # Región más grande que cabe en el presupuesto sin bajar de la escala mínima
+        max_edge = encoder.max_long_edge / self.min_scale if encoder.max_long_edge else math.inf
+        max_area = encoder.max_pixels / self.min_scale ** 2
+        crop_w, crop_h = min(width, max_edge), min(height, max_edge)
+        if crop_w * crop_h > max_area:
+            short = min(crop_w, crop_h, math.sqrt(max_area))
+            long = max_area / short
+            crop_w, crop_h = (long, short) if crop_w >= crop_h else (short, long)
+        crop_w, crop_h = int(min(crop_w, width)), int(min(crop_h, height))
+
+        box = self._detail_box(image, crop_w, crop_h)
+        sent = encoder.target_size(crop_w, crop_h)
+        scale = sent[0] / crop_w
+        return BudgetPlan(box, sent, scale, self.text_height * scale)
+
+    @staticmethod
+    def _detail_box(image: Image.Image, crop_w: int, crop_h: int) -> Tuple[int, int, int, int]:
+        """Región de crop_w x crop_h con más bordes (texto, controles) de la captura."""
+        width, height = image.size
+
+        def detail_map() -> np.ndarray:
+            thumbnail = Image.fromarray(gray_array(image))
+            thumbnail.thumbnail((DETAIL_MAP_EDGE, DETAIL_MAP_EDGE))
+            gray = np.asarray(thumbnail, dtype=np.int16)
+            detail = np.zeros(gray.shape, dtype=np.float64)
+            detail[:, 1:] += np.abs(np.diff(gray, axis=1))
+            detail[1:, :] += np.abs(np.diff(gray, axis=0))
+            return detail
+
+        detail = memoized(image, ('detail_map', DETAIL_MAP_EDGE), detail_map)
+        rows, cols = detail.shape
+        factor = width / cols
+        win_w = max(1, min(cols, int(round(crop_w / factor))))
+        win_h = max(1, min(rows, int(round(crop_h / factor))))
+
+        # Suma del detalle de cada ventana posible con una imagen integral
+        integral = np.pad(detail.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        sums = (integral[win_h:, win_w:] - integral[:-win_h, win_w:]
+                - integral[win_h:, :-win_w] + integral[:-win_h, :-win_w])
+        row, col = np.unravel_index(int(np.argmax(sums)), sums.shape)
+
+        left = min(int(col * factor), width - crop_w)
+        top = min(int(row * factor), height - crop_h)
+        return left, top, left + crop_w, top + crop_h
+
+    def encode(self, image: Image.Image, encoder: ImageEncoder) -> Tuple[EncodedImage, BudgetPlan]:
+        """
+        Codifica una captura dentro del presupuesto.
+
+        Args:
+            image: Captura (imagen PIL o Frame; en un Frame el resultado se memoriza)
+            encoder: Codificador base
+
+        Returns:
+            Tupla (EncodedImage, BudgetPlan); si hay recorte, la imagen codificada lleva su
+            desplazamiento para devolver las coordenadas a la captura completa
+        """
+        plan = self.plan(image, encoder)
+        encoder = self._encoder_for(encoder)
+
+        if plan.box is None:
+            if isinstance(image, Frame):
+                return image.encode(encoder), plan
+            return encoder.encode(image), plan
+
+        def compute() -> EncodedImage:
+            encoded = encoder.encode(unwrap(image).crop(plan.box))
+            encoded.offset = plan.box[:2]
+            encoded.full_size = image.size
+            return encoded
+
+        return memoized(image, ('budget_crop', plan.box) + encoder.cache_key(), compute), plan
+
+
+# Función de prueba
+if __name__ == "__main__":
+    from PIL import ImageDraw
+
+    budget = TokenBudget()
+    for size in ((1920, 1080), (3840, 2160), (5760, 1080), (11520, 2160)):
+        screen = Image.new('RGB', size, color='white')
+        ImageDraw.Draw(screen).text((size[0] - 400, 100), "Texto en el último monitor", fill='black')
+        plan = budget.plan(screen, ImageEncoder())
+        print(f"{size[0]}x{size[1]}: {plan.to_dict()}")
+
+    request = {
+        'messages': [{'role': 'user', 'content': [
+            ImageEncoder().encode(Image.new('RGB', (1920, 1080), 'white')).to_content_block(),
+            {'type': 'text', 'text': "Describe la pantalla"},
+        ]}],
+    }
+    print(f"Estimación de la petición: {estimate_request_tokens(request)}")